@@ -0,0 +1,202 @@
+"""Benchmark the decision, prompt, validation, assembly and rendering hot paths.
+
+Usage:
+    python benchmarks/bench.py --sizes 1,1000,100000 --output bench.json
+    python benchmarks/bench.py --compare bench.json --threshold 0.10
+
+Each benchmark calls its function ``size`` times over synthetic payloads that
+follow `input_output_contract.md`. Inputs are built once from a pool of at
+most ``--pool`` distinct patients that is cycled for larger sizes, so a 1M
+run does not hold a million payloads in memory. ``end_to_end`` runs the full
+single-patient flow against `FakeLLM` with zero latency, which measures the
+pipeline's own overhead. Results are written as JSON. ``--compare`` flags
+every benchmark whose time per operation regressed beyond the threshold and
+exits with status 1.
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from src.compliance import validate_email, validate_output
+from src.decision_engine import DecisionInput, assign_package
+from src.generator import build_prompt, generate_email
+from src.llm_backends import FakeLLM
+from src.spool import MessageRenderer, OutgoingEmail
+from src.static_content import assemble_full_email
+from src.synthetic import synthetic_payloads
+
+DEFAULT_SIZES = (1, 1000, 100_000)
+
+
+def build_cases(pool_size: int) -> dict[str, list[Any]]:
+    """Precompute the argument lists each benchmark cycles through."""
+    payloads = list(synthetic_payloads(pool_size, seed=13))
+    decisions = [_decision_input(payload) for payload in payloads]
+    packages = [assign_package(decision) for decision in decisions]
+    prompts = [
+        dict(
+            patient_name=payload["patient"]["patient_name"],
+            package=package,
+            recency_type=payload["temporal"]["recency_type"],
+            days_since_last_exam=payload["temporal"]["days_since_last_exam"],
+        )
+        for payload, package in zip(payloads, packages)
+    ]
+    llm = FakeLLM(seed=13)
+    bodies = [llm(build_prompt(**kwargs)) for kwargs in prompts]
+    return {"decisions": decisions, "prompts": prompts, "bodies": bodies}
+
+
+def benchmarks(cases: dict[str, list[Any]]) -> dict[str, Callable[[int], None]]:
+    """Map benchmark names to functions running ``size`` operations."""
+    llm = FakeLLM(seed=13)
+
+    def run_assign_package(size: int) -> None:
+        for decision in itertools.islice(itertools.cycle(cases["decisions"]), size):
+            assign_package(decision)
+
+    def run_build_prompt(size: int) -> None:
+        for kwargs in itertools.islice(itertools.cycle(cases["prompts"]), size):
+            build_prompt(**kwargs)
+
+    def run_validate_email(size: int) -> None:
+        for body in itertools.islice(itertools.cycle(cases["bodies"]), size):
+            validate_email(body)
+
+    def run_validate_output(size: int) -> None:
+        for body in itertools.islice(itertools.cycle(cases["bodies"]), size):
+            validate_output(body)
+
+    def run_assemble_full_email(size: int) -> None:
+        for body in itertools.islice(itertools.cycle(cases["bodies"]), size):
+            assemble_full_email(body)
+
+    def run_render_message(size: int) -> None:
+        renderer = MessageRenderer()
+        for body in itertools.islice(itertools.cycle(cases["bodies"]), size):
+            renderer.render(OutgoingEmail(email_body=body, recipient="paciente@example.com"))
+
+    def run_end_to_end(size: int) -> None:
+        pairs = itertools.islice(itertools.cycle(zip(cases["decisions"], cases["prompts"])), size)
+        for decision, kwargs in pairs:
+            package = assign_package(decision)
+            body = generate_email(**{**kwargs, "package": package}, llm=llm)
+            assemble_full_email(body)
+
+    return {
+        "assign_package": run_assign_package,
+        "build_prompt": run_build_prompt,
+        "validate_email": run_validate_email,
+        "validate_output": run_validate_output,
+        "assemble_full_email": run_assemble_full_email,
+        "render_message": run_render_message,
+        "end_to_end": run_end_to_end,
+    }
+
+
+def run(sizes: list[int], *, pool_size: int, repeat: int, only: Optional[set[str]] = None) -> dict[str, Any]:
+    cases = build_cases(min(pool_size, max(sizes)))
+    results: dict[str, dict[str, dict[str, float]]] = {}
+    for name, bench in benchmarks(cases).items():
+        if only and name not in only:
+            continue
+        results[name] = {}
+        for size in sizes:
+            best = min(_timed(bench, size) for _ in range(repeat))
+            results[name][str(size)] = {
+                "seconds": round(best, 6),
+                "ns_per_op": round(best * 1e9 / size, 1),
+                "ops_per_s": round(size / best, 1) if best else 0.0,
+            }
+            print(f"{name:<22}{size:>10}  {results[name][str(size)]['ns_per_op']:>14.1f} ns/op", file=sys.stderr)
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pool_size": min(pool_size, max(sizes)),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], threshold: float) -> list[str]:
+    """Return one line per benchmark slower than ``baseline`` by more than ``threshold``."""
+    regressions: list[str] = []
+    for name, sizes in current["results"].items():
+        for size, stats in sizes.items():
+            reference = baseline.get("results", {}).get(name, {}).get(size)
+            if not reference or not reference.get("ns_per_op"):
+                continue
+            ratio = stats["ns_per_op"] / reference["ns_per_op"]
+            if ratio > 1.0 + threshold:
+                regressions.append(
+                    f"{name}[{size}]: {reference['ns_per_op']:.1f} -> {stats['ns_per_op']:.1f} ns/op "
+                    f"(+{(ratio - 1.0) * 100:.1f}%)"
+                )
+    return regressions
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the email generator hot paths.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES))
+    parser.add_argument("--pool", type=int, default=10_000, help="distinct synthetic patients")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per size; the fastest is kept")
+    parser.add_argument("--only", help="comma-separated benchmark names")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown fraction")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size]
+    only = set(args.only.split(",")) if args.only else None
+    current = run(sizes, pool_size=args.pool, repeat=args.repeat, only=only)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(current, indent=2) + "\n", encoding="utf-8")
+    else:
+        json.dump(current, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        regressions = compare(current, baseline, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION: {line}", file=sys.stderr)
+        if regressions:
+            return 1
+        print("OK: sin regresiones", file=sys.stderr)
+    return 0
+
+
+def _timed(bench: Callable[[int], None], size: int) -> float:
+    started = time.perf_counter()
+    bench(size)
+    return time.perf_counter() - started
+
+
+def _decision_input(payload: dict[str, Any]) -> DecisionInput:
+    clinical = payload["clinical"]
+    return DecisionInput(
+        mdls_calculable=clinical["mdls_calculable"],
+        mdls_tier=clinical.get("mdls_tier"),
+        biomarker_flags=clinical.get("biomarker_flags"),
+        mdls_derivatives=clinical.get("mdls_derivatives"),
+        comorbidity_channels=clinical.get("comorbidity_channels"),
+    )
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,109 @@
+"""Throughput of SMTP delivery against the local stand-in server.
+
+Usage:
+    python benchmarks/delivery.py --messages 2000 --latency 0.002 --output delivery.json
+
+Delivers the same rendered campaign under several pool settings:
+- a new connection per message, the behaviour without a pool
+- persistent connections with and without PIPELINING
+- several connections in parallel
+
+Each setting reports messages per second and the number of connections
+opened. ``--latency`` adds server-side time per accepted message;
+``--transient-failure-rate`` injects ``451`` replies that are retried.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from src.delivery import DeliveryStats, SMTPConfig, SMTPPool, deliver, envelope_for
+from src.retry import RetryPolicy
+from src.smtp_standin import SMTPStandIn
+from src.spool import MessageRenderer, OutgoingEmail
+from src.synthetic import synthetic_payloads
+
+# (name, connections, messages per connection, pipelining)
+SCENARIOS = (
+    ("connection_per_message", 1, 1, False),
+    ("persistent_1", 1, 1000, False),
+    ("persistent_1_pipelined", 1, 1000, True),
+    ("persistent_4_pipelined", 4, 1000, True),
+    ("persistent_8_pipelined", 8, 1000, True),
+)
+
+
+def run(messages: int, *, latency: float, transient_failure_rate: float) -> dict[str, Any]:
+    renderer = MessageRenderer()
+    body = "\n\n".join(f"Bloque {index} del correo de prueba." for index in range(1, 8))
+    envelopes = [
+        envelope_for(
+            OutgoingEmail(
+                email_body=body,
+                patient_id=str(payload["patient"]["patient_id"]),
+                recipient=f"{payload['patient']['patient_id']}@example.com",
+            ),
+            renderer,
+        )
+        for payload in synthetic_payloads(messages, seed=21)
+    ]
+    policy = RetryPolicy(max_attempts=5, backoff_base=0.001, backoff_max=0.01)
+    results: dict[str, Any] = {}
+    for name, size, per_connection, pipelining in SCENARIOS:
+        with SMTPStandIn(
+            latency=latency,
+            transient_failure_rate=transient_failure_rate,
+            keep_messages=False,
+        ) as server:
+            stats = DeliveryStats()
+            with SMTPPool(
+                SMTPConfig(host=server.hostname, port=server.port),
+                size=size,
+                max_messages_per_connection=per_connection,
+                pipelining=pipelining,
+            ) as pool:
+                for _ in deliver(envelopes, pool, policy=policy, stats=stats):
+                    pass
+        results[name] = {
+            "sent": stats.sent,
+            "failed": stats.failed,
+            "retries": stats.retries,
+            "connections": stats.connections,
+            "seconds": round(stats.elapsed, 4),
+            "messages_per_s": round(stats.throughput, 1),
+        }
+    return results
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.0, help="server seconds per message")
+    parser.add_argument("--transient-failure-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = run(
+        args.messages,
+        latency=args.latency,
+        transient_failure_rate=args.transient_failure_rate,
+    )
+    for name, result in results.items():
+        print(
+            f"{name:<26} {result['messages_per_s']:>10.1f} msg/s "
+            f"{result['connections']:>6} conexiones {result['retries']:>5} reintentos",
+            file=sys.stderr,
+        )
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,54 +1,53 @@
-import os
-from openai import OpenAI
-from src.generator import generate_email
-from src.static_content import assemble_full_email
-from src.decision_engine import DecisionInput, assign_package
+"""Generate the email of one payload with the OpenAI backend and print it.
+
+Usage:
+    python run_generator.py [payload.json] [--api-key-file PATH] [--model NAME]
+"""
+import argparse
 import json
 from pathlib import Path
 
-payload = json.loads(Path("tests/sample_input.json").read_text(encoding="utf-8"))
+# Ruta a tu archivo oaiak (ajústala)
+DEFAULT_API_KEY_FILE = r"C:\Users\orlando.caballero\Downloads\oaiak"
 
-patient_name = payload["patient"]["patient_name"]
-recency_type = payload["temporal"]["recency_type"]
-days_since_last_exam = payload["temporal"]["days_since_last_exam"]
 
-decision_input = DecisionInput(
-    mdls_calculable=payload["clinical"]["mdls_calculable"],
-    mdls_tier=payload["clinical"].get("mdls_tier"),
-    biomarker_flags=payload["clinical"].get("biomarker_flags"),
-    mdls_derivatives=payload["clinical"].get("mdls_derivatives"),
-    comorbidity_channels=payload["clinical"].get("comorbidity_channels"),
-)
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("payload", nargs="?", default="tests/sample_input.json")
+    parser.add_argument("--api-key-file", default=DEFAULT_API_KEY_FILE)
+    parser.add_argument("--model", default="gpt-4.1-mini")
+    args = parser.parse_args(argv)
 
-package = assign_package(decision_input)
+    from src.contract import to_decision_input
+    from src.decision_engine import assign_package
+    from src.generator import generate_email
+    from src.llm_backends import OpenAIBackend, load_api_key
+    from src.static_content import assemble_full_email
 
-def load_openai_key(path: str) -> str:
-    with open(path, "r", encoding="utf-8") as f:
-        line = f.read().strip()
-    return line.split("=", 1)[1].strip()
+    payload = json.loads(Path(args.payload).read_text(encoding="utf-8"))
+    decision_input = to_decision_input(payload)
 
-# Ruta a tu archivo oaiak (ajústala)
-api_key = load_openai_key(r"C:\Users\orlando.caballero\Downloads\oaiak")
+    patient_name = payload["patient"]["patient_name"]
+    recency_type = payload["temporal"]["recency_type"]
+    days_since_last_exam = payload["temporal"]["days_since_last_exam"]
 
-client = OpenAI(api_key=api_key)
+    package = assign_package(decision_input)
 
-def llm(prompt: str) -> str:
-    response = client.responses.create(
-        model="gpt-4.1-mini",
-        input=prompt
-    )
-    return response.output_text
+    llm = OpenAIBackend(api_key=load_api_key(args.api_key_file), model=args.model)
 
-body = generate_email(
-    patient_name=patient_name,
-    package=package,
-    recency_type=recency_type,
-    days_since_last_exam=days_since_last_exam,
-    llm=llm,
-    program_name="Programa Preventivo de Minimed"
-)
+    body = generate_email(
+        patient_name=patient_name,
+        package=package,
+        recency_type=recency_type,
+        days_since_last_exam=days_since_last_exam,
+        llm=llm,
+        program_name="Programa Preventivo de Minimed",
+    )
 
-final_email = assemble_full_email(body)
-print(final_email)
+    final_email = assemble_full_email(body)
+    print(final_email)
+    return 0
 
 
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,14 +1,52 @@
-"""Core package for the email generator."""
-
-from .compliance import ComplianceError, validate_email
-from .generator import build_prompt, generate_email
-from .static_content import assemble_full_email
-
-__all__ = [
-    "ComplianceError",
-    "assemble_full_email",
-    "build_prompt",
-    "generate_email",
-    "validate_email",
-]
-__all__ = ["ComplianceError", "build_prompt", "generate_email", "validate_email"]
+"""Core package for the email generator.
+
+The public names below are imported from their submodules on first access,
+so ``import src`` or ``import src.decision_engine`` does not pay for the
+thread pool, asyncio or LLM backend imports of the generation layers.
+"""
+from __future__ import annotations
+
+import importlib
+from typing import TYPE_CHECKING, Any
+
+_EXPORTS = {
+    "ComplianceError": "compliance",
+    "ComplianceScanner": "compliance",
+    "EmailCheck": "compliance",
+    "EmailResult": "batch",
+    "assemble_full_email": "static_content",
+    "build_prompt": "generator",
+    "check_email": "compliance",
+    "generate_email": "generator",
+    "generate_emails": "batch",
+    "validate_email": "compliance",
+    "validate_output": "compliance",
+}
+
+__all__ = sorted(_EXPORTS)
+
+if TYPE_CHECKING:
+    from .batch import EmailResult, generate_emails
+    from .compliance import (
+        ComplianceError,
+        ComplianceScanner,
+        EmailCheck,
+        check_email,
+        validate_email,
+        validate_output,
+    )
+    from .generator import build_prompt, generate_email
+    from .static_content import assemble_full_email
+
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
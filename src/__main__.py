@@ -0,0 +1,223 @@
+"""Command-line entry point: ``python -m src <command>``.
+
+Commands:
+    decide    package assignment per payload (JSONL out)
+    prompt    the LLM prompt of each payload
+    generate  the full email of each payload, from an LLM
+    validate  output-contract check of an email body
+
+Payload input is one JSON object, a JSON list, or JSONL; ``-`` reads stdin.
+Each command imports only the modules it needs, so ``decide`` never loads
+the generator, the LLM backends or asyncio, and ``generate`` loads the
+OpenAI SDK only with ``--openai``. Assets are read on first use; pass
+``--preload`` to read and compile them all up front, e.g. in a worker that
+serves many requests after starting.
+
+Usage:
+    python -m src decide payloads.jsonl
+    python -m src prompt tests/sample_input.json
+    python -m src generate tests/sample_input.json --fake
+    python -m src generate tests/sample_input.json --openai --api-key-file ~/oaiak
+    python -m src validate email.txt
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from typing import Any, Callable, Iterator, Optional
+
+DEFAULT_PROGRAM_NAME = "Programa Preventivo de Minimed"
+DIVIDER = "\n" + "=" * 72 + "\n"
+
+
+def read_payloads(source: str) -> list[Any]:
+    """Parse a JSON object, a JSON list or JSONL from a path or ``-``.
+
+    A JSONL line that is not valid JSON is returned as its ``ValueError``,
+    so one bad row does not stop the others.
+    """
+    if source == "-":
+        text = sys.stdin.read()
+    else:
+        with open(source, encoding="utf-8") as f:
+            text = f.read()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return [_parse_line(line) for line in text.splitlines() if line.strip()]
+    return data if isinstance(data, list) else [data]
+
+
+def _parse_line(line: str) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError as exc:
+        return exc
+
+
+def cmd_decide(args: argparse.Namespace) -> int:
+    from .contract import ContractError, to_decision_input
+    from .decision_engine import assign_package
+
+    failed = 0
+    for payload, record in _each_payload(args.input):
+        try:
+            if isinstance(payload, ValueError):
+                raise payload
+            record["package"] = assign_package(to_decision_input(payload))
+        except ValueError as exc:
+            failed += 1
+            record["error"] = str(exc)
+            if isinstance(exc, ContractError):
+                record["field_errors"] = [{"path": e.path, "message": e.message} for e in exc.errors]
+        print(json.dumps(record, ensure_ascii=False))
+    return 0 if failed == 0 else 1
+
+
+def cmd_prompt(args: argparse.Namespace) -> int:
+    from .generator import build_prompt
+
+    return _per_patient(
+        args,
+        lambda payload, package: build_prompt(
+            patient_name=payload["patient"]["patient_name"],
+            package=package,
+            recency_type=payload["temporal"]["recency_type"],
+            days_since_last_exam=payload["temporal"]["days_since_last_exam"],
+            program_name=args.program_name,
+        ),
+    )
+
+
+def cmd_generate(args: argparse.Namespace) -> int:
+    from .generator import generate_email
+    from .static_content import assemble_full_email
+
+    llm = _resolve_llm(args)
+
+    def render(payload: Any, package: str) -> str:
+        body = generate_email(
+            patient_name=payload["patient"]["patient_name"],
+            package=package,
+            recency_type=payload["temporal"]["recency_type"],
+            days_since_last_exam=payload["temporal"]["days_since_last_exam"],
+            llm=llm,
+            program_name=args.program_name,
+        )
+        return body if args.body_only else assemble_full_email(body)
+
+    return _per_patient(args, render)
+
+
+def cmd_validate(args: argparse.Namespace) -> int:
+    from .compliance import check_email, get_scanner
+
+    if args.input == "-":
+        text = sys.stdin.read()
+    else:
+        with open(args.input, encoding="utf-8") as f:
+            text = f.read()
+    if args.content_only:
+        violations = get_scanner().scan(text)
+        words = blocks = None
+    else:
+        check = check_email(text)
+        violations, words, blocks = list(check.violations), check.words, check.blocks
+    for violation in violations:
+        print(violation)
+    if words is not None:
+        print(f"palabras={words} bloques={blocks}", file=sys.stderr)
+    print("OK" if not violations else f"{len(violations)} incumplimientos", file=sys.stderr)
+    return 0 if not violations else 1
+
+
+def _each_payload(source: str) -> Iterator[tuple[Any, dict[str, Any]]]:
+    for payload in read_payloads(source):
+        patient = payload.get("patient") if isinstance(payload, dict) else None
+        patient_id = patient.get("patient_id") if isinstance(patient, dict) else None
+        yield payload, {"patient_id": patient_id}
+
+
+def _per_patient(args: argparse.Namespace, render: Callable[[Any, str], str]) -> int:
+    from .contract import to_decision_input
+    from .decision_engine import assign_package
+
+    failed = 0
+    outputs = 0
+    for payload, record in _each_payload(args.input):
+        try:
+            if isinstance(payload, ValueError):
+                raise payload
+            text = render(payload, assign_package(to_decision_input(payload)))
+        except ValueError as exc:
+            failed += 1
+            print(f"{record['patient_id']}: {exc}", file=sys.stderr)
+            continue
+        if outputs:
+            sys.stdout.write(DIVIDER)
+        sys.stdout.write(text + "\n")
+        outputs += 1
+    return 0 if failed == 0 else 1
+
+
+def _resolve_llm(args: argparse.Namespace) -> Callable[[str], str]:
+    if args.fake:
+        from .llm_backends import FakeLLM
+
+        return FakeLLM(seed=args.seed)
+    if args.openai:
+        from .llm_backends import OpenAIBackend, load_api_key
+
+        api_key = load_api_key(args.api_key_file) if args.api_key_file else None
+        return OpenAIBackend(api_key=api_key, model=args.model)
+    from .pipeline import load_llm
+
+    return load_llm(args.llm)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m src", description=__doc__.splitlines()[0])
+    parser.add_argument("--preload", action="store_true", help="read and compile all assets first")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    decide = commands.add_parser("decide", help="assign packages (JSONL out)")
+    decide.add_argument("input", help="payload JSON/JSONL file, or - for stdin")
+    decide.set_defaults(handler=cmd_decide)
+
+    prompt = commands.add_parser("prompt", help="print the LLM prompt per payload")
+    prompt.add_argument("input", help="payload JSON/JSONL file, or - for stdin")
+    prompt.add_argument("--program-name", default=DEFAULT_PROGRAM_NAME)
+    prompt.set_defaults(handler=cmd_prompt)
+
+    generate = commands.add_parser("generate", help="print the full email per payload")
+    generate.add_argument("input", help="payload JSON/JSONL file, or - for stdin")
+    generate.add_argument("--program-name", default=DEFAULT_PROGRAM_NAME)
+    generate.add_argument("--body-only", action="store_true", help="omit disclaimer and signature")
+    backend = generate.add_mutually_exclusive_group(required=True)
+    backend.add_argument("--llm", help="LLM callable as module:attribute")
+    backend.add_argument("--openai", action="store_true", help="use the OpenAI backend")
+    backend.add_argument("--fake", action="store_true", help="offline deterministic FakeLLM")
+    generate.add_argument("--api-key-file", help="NAME=value file with the OpenAI API key")
+    generate.add_argument("--model", default="gpt-4.1-mini")
+    generate.add_argument("--seed", type=int, default=0, help="FakeLLM seed")
+    generate.set_defaults(handler=cmd_generate)
+
+    validate = commands.add_parser("validate", help="check an email body against the contract")
+    validate.add_argument("input", help="text file with the email body, or - for stdin")
+    validate.add_argument("--content-only", action="store_true", help="skip the structural rules")
+    validate.set_defaults(handler=cmd_validate)
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.preload:
+        from .generator import preload
+
+        preload(getattr(args, "program_name", DEFAULT_PROGRAM_NAME))
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,283 @@
+"""Campaign compliance audit built from counters while a run progresses.
+
+`ComplianceAudit` answers the reviewers' questions about a batch without
+keeping any email:
+- how many generated emails hit each forbidden term, urgency term or
+  diagnosis pattern
+- how many violations each rejected email had
+- how many LLM attempts were rejected and how many of them were retried
+- the package and recency mix of the emails that went out
+
+Rejections are seen through `wrap`, which records the violations of every
+`ComplianceError` the validator raises, retried attempts included. Results
+are seen through `record_result`. Everything is a counter, so memory does
+not grow with the campaign. Length violations are counted per ten-word
+range rather than per exact word count. Terms are kept per category up to ``max_terms``
+and the rest are counted under ``"(otros)"``. Audits of different shards or
+runs are combined with `merge` and exported as JSON or CSV.
+
+Usage:
+    python -m src.audit merge shards/*.audit.json -o audit.csv
+    python -m src.audit summarize results.jsonl -o audit.json
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import re
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Iterable, Mapping, Optional, Sequence, TextIO, Union
+
+from .compliance import ComplianceError
+from .generator import recency_bucket
+
+OTHER_TERMS = "(otros)"
+CSV_FIELDS = ("section", "key", "detail", "count")
+_WORD_COUNT = re.compile(r"(\d+) palabras ")
+
+
+class ComplianceAudit:
+    """Thread-safe, mergeable compliance counters for one campaign.
+
+    Attributes:
+        emails: Result records seen, resumed and skipped ones included.
+        statuses: Records per ``status``.
+        rejections: Attempts the validator rejected for compliance.
+        compliance_failures: Records that ended in a compliance error.
+        terms: Rejected attempts per category and term.
+        violations_per_rejection: Histogram of violation counts per rejection.
+        packages: ``ok`` emails per package.
+        recency: ``ok`` emails per recency bucket.
+        package_recency: ``ok`` emails per ``"PACKAGE/BUCKET"``.
+    """
+
+    def __init__(self, max_terms: int = 200) -> None:
+        self.max_terms = max_terms
+        self.emails = 0
+        self.statuses: Counter[str] = Counter()
+        self.rejections = 0
+        self.compliance_failures = 0
+        self.terms: dict[str, Counter[str]] = {}
+        self.violations_per_rejection: Counter[int] = Counter()
+        self.packages: Counter[str] = Counter()
+        self.recency: Counter[str] = Counter()
+        self.package_recency: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def retries(self) -> int:
+        """Rejected attempts that were followed by another attempt."""
+        return max(self.rejections - self.compliance_failures, 0)
+
+    def wrap(self, validator: Callable[[str], None]) -> Callable[[str], None]:
+        """Return ``validator`` recording the violations of each rejection."""
+
+        def audited(text: str) -> None:
+            try:
+                validator(text)
+            except ComplianceError as exc:
+                self.record_rejection(exc.violations)
+                raise
+
+        return audited
+
+    def record_rejection(self, violations: Sequence[str]) -> None:
+        """Count one rejected attempt and each distinct term it hit."""
+        hits = dict.fromkeys(_split_label(label) for label in violations)
+        with self._lock:
+            self.rejections += 1
+            self.violations_per_rejection[len(violations)] += 1
+            for category, term in hits:
+                self._count_term(category, term, 1)
+
+    def record_result(self, record: Mapping[str, Any], payload: Any = None) -> None:
+        """Count one pipeline result record; ``payload`` adds its recency bucket."""
+        status = str(record.get("status", "error"))
+        bucket = _bucket(payload) if status == "ok" else None
+        package = record.get("package") if status == "ok" else None
+        with self._lock:
+            self.emails += 1
+            self.statuses[status] += 1
+            if status == "error" and record.get("violations"):
+                self.compliance_failures += 1
+            if package is not None:
+                self.packages[str(package)] += 1
+            if bucket is not None:
+                self.recency[bucket] += 1
+                if package is not None:
+                    self.package_recency[f"{package}/{bucket}"] += 1
+
+    def merge(self, other: "ComplianceAudit") -> None:
+        """Add ``other``'s counters to this audit."""
+        with self._lock:
+            self.emails += other.emails
+            self.statuses.update(other.statuses)
+            self.rejections += other.rejections
+            self.compliance_failures += other.compliance_failures
+            self.violations_per_rejection.update(other.violations_per_rejection)
+            self.packages.update(other.packages)
+            self.recency.update(other.recency)
+            self.package_recency.update(other.package_recency)
+            for category, terms in other.terms.items():
+                for term, count in terms.items():
+                    self._count_term(category, term, count)
+
+    def _count_term(self, category: str, term: str, count: int) -> None:
+        terms = self.terms.setdefault(category, Counter())
+        if term not in terms and len(terms) >= self.max_terms:
+            term = OTHER_TERMS
+        terms[term] += count
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "emails": self.emails,
+                "statuses": dict(sorted(self.statuses.items())),
+                "rejections": self.rejections,
+                "compliance_failures": self.compliance_failures,
+                "retries": self.retries,
+                "terms": {
+                    category: dict(terms.most_common())
+                    for category, terms in sorted(self.terms.items())
+                },
+                "violations_per_rejection": {
+                    str(count): n for count, n in sorted(self.violations_per_rejection.items())
+                },
+                "packages": dict(sorted(self.packages.items())),
+                "recency": dict(sorted(self.recency.items())),
+                "package_recency": dict(sorted(self.package_recency.items())),
+            }
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any], max_terms: int = 200) -> "ComplianceAudit":
+        audit = cls(max_terms=max_terms)
+        audit.emails = int(data.get("emails", 0))
+        audit.statuses.update(data.get("statuses", {}))
+        audit.rejections = int(data.get("rejections", 0))
+        audit.compliance_failures = int(data.get("compliance_failures", 0))
+        audit.violations_per_rejection.update(
+            {int(count): n for count, n in data.get("violations_per_rejection", {}).items()}
+        )
+        audit.packages.update(data.get("packages", {}))
+        audit.recency.update(data.get("recency", {}))
+        audit.package_recency.update(data.get("package_recency", {}))
+        for category, terms in data.get("terms", {}).items():
+            for term, count in terms.items():
+                audit._count_term(category, term, int(count))
+        return audit
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "ComplianceAudit":
+        return cls.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2) + "\n"
+
+    def write_csv(self, stream: TextIO) -> None:
+        """Write one ``section,key,detail,count`` row per counter."""
+        data = self.to_dict()
+        writer = csv.writer(stream, lineterminator="\n")
+        writer.writerow(CSV_FIELDS)
+        for key in ("emails", "rejections", "compliance_failures", "retries"):
+            writer.writerow(("total", key, "", data[key]))
+        for status, count in data["statuses"].items():
+            writer.writerow(("status", status, "", count))
+        for category, terms in data["terms"].items():
+            for term, count in terms.items():
+                writer.writerow(("term", category, term, count))
+        for violations, count in data["violations_per_rejection"].items():
+            writer.writerow(("violations_per_rejection", violations, "", count))
+        for section in ("packages", "recency", "package_recency"):
+            for key, count in data[section].items():
+                writer.writerow((section, key, "", count))
+
+    def write(self, path: Union[str, Path]) -> None:
+        """Write the audit to ``path``: JSON for ``.json``, CSV otherwise."""
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            if str(path).endswith(".json"):
+                f.write(self.to_json())
+            else:
+                self.write_csv(f)
+
+
+def audit_results(records: Iterable[Mapping[str, Any]]) -> ComplianceAudit:
+    """Audit finished result records.
+
+    Records only keep the violations of final failures, so rejections that
+    were retried successfully are not counted here.
+    """
+    audit = ComplianceAudit()
+    for record in records:
+        audit.record_result(record)
+        if record.get("status") == "error" and record.get("violations"):
+            audit.record_rejection(record["violations"])
+    return audit
+
+
+def _split_label(label: str) -> tuple[str, str]:
+    category, sep, term = label.partition(": ")
+    if not sep:
+        return "otro", label
+    words = _WORD_COUNT.match(term)
+    if words is not None:
+        # One term per ten words, instead of one per exact count.
+        low = int(words.group(1)) // 10 * 10
+        term = f"{low}-{low + 9} palabras"
+    return category, term
+
+
+def _bucket(payload: Any) -> Optional[str]:
+    try:
+        temporal = payload["temporal"]
+        return recency_bucket(temporal["recency_type"], int(temporal["days_since_last_exam"]))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _read_records(path: str) -> Iterable[dict[str, Any]]:
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    merge = commands.add_parser("merge", help="add up audit JSON files")
+    merge.add_argument("inputs", nargs="+", help="audit JSON files, e.g. one per shard")
+    merge.add_argument("-o", "--output", default="-", help=".json, .csv, or - for JSON on stdout")
+    summarize = commands.add_parser("summarize", help="audit a pipeline result JSONL file")
+    summarize.add_argument("input", help="result JSONL file, or - for stdin")
+    summarize.add_argument("-o", "--output", default="-", help=".json, .csv, or - for JSON on stdout")
+    args = parser.parse_args(argv)
+
+    if args.command == "merge":
+        audit = ComplianceAudit()
+        for path in args.inputs:
+            audit.merge(ComplianceAudit.load(path))
+    else:
+        audit = audit_results(_read_records(args.input))
+
+    if args.output == "-":
+        sys.stdout.write(audit.to_json())
+    else:
+        audit.write(args.output)
+    print(
+        f"correos={audit.emails} rechazos={audit.rejections} "
+        f"fallos_cumplimiento={audit.compliance_failures} reintentos={audit.retries}",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,206 @@
+"""Batch email generation with a bounded number of concurrent LLM calls."""
+from __future__ import annotations
+
+from collections import deque
+from dataclasses import dataclass
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    TypeVar,
+    Union,
+)
+
+from .compliance import validate_output
+from .generator import agenerate_email, generate_email
+from .retry import RetryPolicy
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+BACKENDS = {"thread", "asyncio"}
+REQUIRED_FIELDS = ("patient_name", "package", "recency_type", "days_since_last_exam")
+DEFAULT_PROGRAM_NAME = "Programa Preventivo de Minimed"
+
+
+@dataclass(frozen=True)
+class EmailResult:
+    """Outcome of one patient in a batch, reported at its input position."""
+
+    index: int
+    email_body: Optional[str] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def generate_emails(
+    payloads: Iterable[Mapping[str, Any]],
+    llm: Callable[[str], Any],
+    *,
+    max_in_flight: int = 8,
+    backend: str = "thread",
+    validator: Callable[[str], None] | None = validate_output,
+    policy: Optional[RetryPolicy] = None,
+) -> list[EmailResult]:
+    """Generate one email per payload keeping ``max_in_flight`` LLM calls open.
+
+    Each payload holds the keyword arguments of :func:`generate_email`
+    (``patient_name``, ``package``, ``recency_type``, ``days_since_last_exam``
+    and optionally ``program_name``). Results keep the input order, and any
+    exception raised for a patient, from a ``ComplianceError`` to an LLM
+    backend failure, is reported on that patient instead of aborting the
+    batch and discarding the finished results. A shared ``policy`` applies
+    the same retries and rate limit to every patient before its error is
+    reported.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {sorted(BACKENDS)}")
+    if backend == "asyncio":
+        import asyncio
+
+        return asyncio.run(
+            agenerate_emails(
+                payloads, llm, max_in_flight=max_in_flight, validator=validator, policy=policy
+            )
+        )
+    return list(
+        iter_emails(payloads, llm, max_in_flight=max_in_flight, validator=validator, policy=policy)
+    )
+
+
+def iter_emails(
+    payloads: Iterable[Mapping[str, Any]],
+    llm: Callable[[str], str],
+    *,
+    max_in_flight: int = 8,
+    validator: Callable[[str], None] | None = validate_output,
+    policy: Optional[RetryPolicy] = None,
+) -> Iterator[EmailResult]:
+    """Thread-pool backend yielding results lazily in input order."""
+
+    def run(item: tuple[int, Mapping[str, Any]]) -> EmailResult:
+        index, payload = item
+        try:
+            body = generate_email(
+                **_email_kwargs(payload), llm=llm, validator=validator, policy=policy
+            )
+        except Exception as exc:  # reported on this patient; the batch goes on
+            return EmailResult(index=index, error=exc)
+        return EmailResult(index=index, email_body=body)
+
+    return map_in_order(run, enumerate(payloads), max_in_flight=max_in_flight)
+
+
+async def agenerate_emails(
+    payloads: Iterable[Mapping[str, Any]],
+    llm: Callable[[str], Union[str, Awaitable[str]]],
+    *,
+    max_in_flight: int = 8,
+    validator: Callable[[str], None] | None = validate_output,
+    policy: Optional[RetryPolicy] = None,
+) -> list[EmailResult]:
+    """Asyncio backend; ``llm`` may be a coroutine function or a blocking callable."""
+    return [
+        result
+        async for result in aiter_emails(
+            payloads, llm, max_in_flight=max_in_flight, validator=validator, policy=policy
+        )
+    ]
+
+
+async def aiter_emails(
+    payloads: Iterable[Mapping[str, Any]],
+    llm: Callable[[str], Union[str, Awaitable[str]]],
+    *,
+    max_in_flight: int = 8,
+    validator: Callable[[str], None] | None = validate_output,
+    policy: Optional[RetryPolicy] = None,
+) -> AsyncIterator[EmailResult]:
+    """Async generator yielding results in input order."""
+    import asyncio
+
+    _check_in_flight(max_in_flight)
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def run(index: int, payload: Mapping[str, Any]) -> EmailResult:
+        async with semaphore:
+            try:
+                body = await agenerate_email(
+                    **_email_kwargs(payload), llm=llm, validator=validator, policy=policy
+                )
+            except Exception as exc:  # reported on this patient; the batch goes on
+                return EmailResult(index=index, error=exc)
+            return EmailResult(index=index, email_body=body)
+
+    window: deque[asyncio.Task[EmailResult]] = deque()
+    try:
+        for index, payload in enumerate(payloads):
+            if len(window) >= 2 * max_in_flight:
+                yield await window.popleft()
+            window.append(asyncio.ensure_future(run(index, payload)))
+        while window:
+            yield await window.popleft()
+    finally:
+        for task in window:
+            task.cancel()
+
+
+def map_in_order(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    *,
+    max_in_flight: int = 8,
+) -> Iterator[R]:
+    """Apply ``fn`` on a thread pool, yielding results in input order.
+
+    At most ``2 * max_in_flight`` items are pulled from ``items`` ahead of the
+    consumer, so a slow head item never lets the backlog grow unbounded and a
+    slow consumer throttles reading of the input.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    _check_in_flight(max_in_flight)
+    executor = ThreadPoolExecutor(max_workers=max_in_flight)
+    window: deque = deque()
+    try:
+        for item in items:
+            if len(window) >= 2 * max_in_flight:
+                yield window.popleft().result()
+            window.append(executor.submit(fn, item))
+        while window:
+            yield window.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def patient_errors(policy: Optional[RetryPolicy]) -> tuple[type[BaseException], ...]:
+    """Expected per-patient failures: contract and compliance errors and ``policy.retry_on``.
+
+    `pipeline` and `multi_prompt` report these on the failing patient and let
+    anything else, such as a programming error, abort the run.
+    """
+    if policy is None:
+        return (ValueError,)
+    return (ValueError, *policy.retry_on)
+
+
+def _email_kwargs(payload: Mapping[str, Any]) -> dict[str, Any]:
+    missing = [field for field in REQUIRED_FIELDS if payload.get(field) is None]
+    if missing:
+        raise ValueError(f"missing fields: {', '.join(missing)}")
+    kwargs = {field: payload[field] for field in REQUIRED_FIELDS}
+    kwargs["program_name"] = payload.get("program_name") or DEFAULT_PROGRAM_NAME
+    return kwargs
+
+
+def _check_in_flight(max_in_flight: int) -> None:
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1")
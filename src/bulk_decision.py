@@ -0,0 +1,182 @@
+"""Columnar package assignment for full patient-base re-segmentation.
+
+Each patient is reduced to three columns: ``mdls_calculable``, ``mdls_tier``
+and the feature bitmask from `decision_engine.encode_features`. Biomarker
+rows are resolved by indexing the precomputed `RiskTierTable` and tiers are
+resolved once per distinct value, which keeps the result identical to
+`assign_package` by construction. NumPy is used when installed; otherwise
+the same passes run on lists.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Iterable, Mapping, Optional, Sequence, Union
+
+from .decision_engine import (
+    BIOMARKER_RISK_TO_PACKAGE,
+    MDLS_TIER_TO_PACKAGE,
+    DecisionEngineError,
+    DecisionInput,
+    _package_from_tier,
+    get_risk_tier_table,
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+# Statuses that never set a feature bit, checked before normalizing case.
+_IN_RANGE_STATUSES = frozenset(("NORMAL", "SIN_DATO", "", None))
+
+
+@dataclass(frozen=True)
+class DecisionColumns:
+    """Column-oriented decision inputs; sequences or NumPy arrays."""
+
+    mdls_calculable: Sequence[bool]
+    mdls_tier: Sequence[Optional[str]]
+    feature_mask: Sequence[int]
+
+    def __len__(self) -> int:
+        return len(self.feature_mask)
+
+
+def to_columns(records: Iterable[Union[DecisionInput, Mapping[str, Any]]]) -> DecisionColumns:
+    """Convert `DecisionInput` objects or ``clinical`` mappings to columns once.
+
+    This is the one per-record pass; it inlines `RiskTierTable.encode` and
+    skips the common statuses without normalizing them.
+    """
+
+    table = get_risk_tier_table()
+    bits = table.bits
+    width = len(table.markers)
+    other_bit = 1 << width
+    derivative_bit = 1 << (width + 1)
+    comorbidity_bit = 1 << (width + 2)
+    calculable: list[bool] = []
+    tiers: list[Optional[str]] = []
+    masks: list[int] = []
+    for record in records:
+        if isinstance(record, DecisionInput):
+            record = record.__dict__
+        calculable.append(bool(record.get("mdls_calculable")))
+        tiers.append(record.get("mdls_tier"))
+        mask = 0
+        flags = record.get("biomarker_flags")
+        if flags:
+            for marker, status in flags.items():
+                if status not in _IN_RANGE_STATUSES and (status or "").upper() == "FUERA_RANGO":
+                    mask |= bits.get(marker, other_bit)
+        derivatives = record.get("mdls_derivatives")
+        if derivatives and any(derivatives.values()):
+            mask |= derivative_bit
+        comorbidities = record.get("comorbidity_channels")
+        if comorbidities and any(comorbidities.values()):
+            mask |= comorbidity_bit
+        masks.append(mask)
+    return DecisionColumns(mdls_calculable=calculable, mdls_tier=tiers, feature_mask=masks)
+
+
+def encode_flag_columns(
+    biomarker_flags: Mapping[str, Sequence[str]],
+    derivative_abnormal: Optional[Sequence[bool]] = None,
+    comorbidity_abnormal: Optional[Sequence[bool]] = None,
+) -> Any:
+    """Vectorized `encode_features` for one status column per marker.
+
+    Requires NumPy. Columns for markers outside the table markers all set the
+    shared OTHER_ABNORMAL bit.
+    """
+
+    if np is None:
+        raise RuntimeError("encode_flag_columns requires numpy")
+    table = get_risk_tier_table()
+    width = len(table.markers)
+    mask: Any = None
+    for marker, statuses in biomarker_flags.items():
+        column = np.char.upper(np.asarray(statuses, dtype=str)) == "FUERA_RANGO"
+        bit = table.bits.get(marker, 1 << width)
+        contribution = np.where(column, bit, 0).astype(np.int64)
+        mask = contribution if mask is None else mask | contribution
+    signals = ((derivative_abnormal, 1 << (width + 1)), (comorbidity_abnormal, 1 << (width + 2)))
+    for column, bit in signals:
+        if column is None:
+            continue
+        contribution = np.where(np.asarray(column, dtype=bool), bit, 0).astype(np.int64)
+        mask = contribution if mask is None else mask | contribution
+    if mask is None:
+        raise ValueError("at least one column is required")
+    return mask
+
+
+def assign_packages(
+    columns: Union[DecisionColumns, Iterable[Union[DecisionInput, Mapping[str, Any]]]],
+) -> list[str]:
+    """Assign packages for many patients; same labels and errors as `assign_package`.
+
+    Raises:
+        DecisionEngineError: For a row `assign_package` would reject, with
+            the row index in the message.
+    """
+
+    if not isinstance(columns, DecisionColumns):
+        columns = to_columns(columns)
+    if np is not None:
+        return _assign_numpy(columns)
+    return _assign_python(columns)
+
+
+def _assign_python(columns: DecisionColumns) -> list[str]:
+    by_mask = _packages_by_mask()
+    by_tier: dict[Optional[str], str] = {}
+    packages: list[str] = []
+    for row, (calculable, tier, mask) in enumerate(
+        zip(columns.mdls_calculable, columns.mdls_tier, columns.feature_mask)
+    ):
+        if calculable:
+            package = by_tier.get(tier)
+            if package is None:
+                package = by_tier[tier] = _row_guard(row, _package_for_tier, tier)
+        else:
+            package = by_mask[mask]
+        packages.append(package)
+    return packages
+
+
+def _assign_numpy(columns: DecisionColumns) -> list[str]:
+    masks = np.asarray(columns.feature_mask, dtype=np.int64)
+    packages = np.array(_packages_by_mask(), dtype=object)[masks]
+
+    # Tiers override the mask lookup; resolved in row order so the first
+    # bad row is the one reported, as in `_assign_python`.
+    by_tier: dict[Optional[str], str] = {}
+    tiers = columns.mdls_tier
+    for row in np.flatnonzero(np.asarray(columns.mdls_calculable, dtype=bool)).tolist():
+        tier = tiers[row]
+        package = by_tier.get(tier)
+        if package is None:
+            package = by_tier[tier] = _row_guard(row, _package_for_tier, tier)
+        packages[row] = package
+    return packages.tolist()
+
+
+def _package_for_tier(tier: Optional[str]) -> str:
+    if not tier:
+        raise DecisionEngineError("mdls_tier is required when mdls_calculable is true")
+    return _package_from_tier(tier, MDLS_TIER_TO_PACKAGE)
+
+
+def _packages_by_mask() -> list[str]:
+    return [
+        _package_from_tier(tier, BIOMARKER_RISK_TO_PACKAGE)
+        for tier in get_risk_tier_table().tiers
+    ]
+
+
+def _row_guard(row: int, fn: Any, *args: Any) -> str:
+    try:
+        return fn(*args)
+    except DecisionEngineError as exc:
+        raise DecisionEngineError(f"row {row}: {exc}") from exc
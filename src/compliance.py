@@ -2,7 +2,12 @@
 from __future__ import annotations
 
 import re
-from typing import Iterable, Sequence
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterable, Optional, Sequence
+
+from . import instrumentation
+from .content import read_text
 
 DEFAULT_FORBIDDEN_TERMS = (
     "hba1c",
@@ -36,8 +41,304 @@ DEFAULT_URGENCY_TERMS = (
 )
 
 
+# Output contract (input_output_contract.md, section 2.1).
+REQUIRED_BLOCKS = 7
+MIN_WORDS = 120
+MAX_WORDS = 220
+
+# Second-person informal forms; the contract requires "usted/su" throughout.
+INFORMAL_MARKERS = (
+    "tú",
+    "tu",
+    "tus",
+    "te",
+    "ti",
+    "contigo",
+    "tuyo",
+    "tuya",
+    "tienes",
+    "puedes",
+    "quieres",
+    "necesitas",
+    "estás",
+    "eres",
+    "debes",
+    "sabes",
+)
+
+# Fixed assets appended outside the model; the body must not repeat them.
+FOOTER_ASSETS = ("static/disclaimer.txt", "static/signature.txt")
+
+# Constructs that cannot be folded into one alternation with other patterns:
+# numbered or named backreferences, conditional group references, named
+# groups and inline global flags.
+_UNFOLDABLE = re.compile(r"\\\d|\(\?P[=<]|\(\?\(|\(\?[aiLmsux]+\)")
+
+CONTENT_CATEGORIES = frozenset(("término prohibido", "lenguaje de urgencia", "diagnóstico explícito"))
+
+
 class ComplianceError(ValueError):
-    """Raised when the email body violates compliance rules."""
+    """Raised when the email body violates compliance rules.
+
+    ``violations`` holds the ``"category: detail"`` labels behind the
+    message, and ``check`` the structured `EmailCheck` when the error comes
+    from `validate_output`.
+    """
+
+    def __init__(
+        self,
+        message: str,
+        check: Optional["EmailCheck"] = None,
+        violations: Sequence[str] = (),
+    ) -> None:
+        super().__init__(message)
+        self.check = check
+        self.violations = tuple(violations) or (check.violations if check is not None else ())
+
+
+@dataclass(frozen=True)
+class EmailCheck:
+    """Result of checking one email body against the output rules.
+
+    ``violations`` use the same ``"category: detail"`` labels as
+    `ComplianceScanner.scan`, content rules first.
+    """
+
+    words: int
+    blocks: int
+    violations: tuple[str, ...] = ()
+
+    @property
+    def ok(self) -> bool:
+        return not self.violations
+
+    @property
+    def categories(self) -> frozenset[str]:
+        return frozenset(violation.split(":", 1)[0] for violation in self.violations)
+
+    @property
+    def structural_only(self) -> bool:
+        """True when every violation is about form, not content."""
+        return bool(self.violations) and not (self.categories & CONTENT_CATEGORIES)
+
+
+class ComplianceScanner:
+    """Precompiled scanner that finds every compliance violation in one pass.
+
+    Terms are merged into one literal alternation and diagnosis patterns into
+    another, both compiled once. Clean text is therefore scanned by the regex
+    engine without any per-term work. Each position where an alternation
+    matches is resolved against the individual terms or patterns, which keeps
+    overlapping hits (``resultado`` and ``resultados``) reported exactly like
+    the per-term loops did.
+
+    Terms and patterns are kept in separate alternations on purpose: mixing
+    literals with ``\\b``-anchored patterns disables the first-character
+    prefilter of ``re`` and makes a single combined expression several times
+    slower.
+
+    Patterns with backreferences, named groups or inline global flags change
+    meaning or fail to compile inside an alternation, so they are searched
+    on their own.
+    """
+
+    def __init__(
+        self,
+        *,
+        forbidden_terms: Iterable[str] = DEFAULT_FORBIDDEN_TERMS,
+        diagnosis_patterns: Sequence[str] = DEFAULT_DIAGNOSIS_PATTERNS,
+        urgency_terms: Iterable[str] = DEFAULT_URGENCY_TERMS,
+    ) -> None:
+        self.forbidden_terms = tuple(forbidden_terms)
+        self.diagnosis_patterns = tuple(diagnosis_patterns)
+        self.urgency_terms = tuple(urgency_terms)
+
+        terms = {
+            term.lower()
+            for term in self.forbidden_terms + self.urgency_terms
+            if term.lower()
+        }
+        self._terms = tuple(sorted(terms, key=len, reverse=True))
+        self._patterns = tuple(re.compile(pattern) for pattern in self.diagnosis_patterns)
+        self._folded = tuple(
+            index
+            for index, pattern in enumerate(self.diagnosis_patterns)
+            if _UNFOLDABLE.search(pattern) is None
+        )
+        self._separate = tuple(
+            index for index in range(len(self._patterns)) if index not in self._folded
+        )
+        self._term_regex = (
+            re.compile("|".join(re.escape(term) for term in self._terms)) if self._terms else None
+        )
+        self._pattern_regex = (
+            re.compile("|".join(f"(?:{self.diagnosis_patterns[index]})" for index in self._folded))
+            if self._folded
+            else None
+        )
+
+    def scan(self, text: str) -> list[str]:
+        """Return the violations found in ``text``, in rule order."""
+        return self.scan_lower((text or "").lower())
+
+    def scan_lower(self, lower_text: str) -> list[str]:
+        """`scan` for text that is already lowercased."""
+        found_terms: set[str] = set()
+        found_patterns: set[int] = set()
+        self._find_terms(lower_text, 0, found_terms)
+        self._find_patterns(lower_text, 0, found_patterns)
+        return self._format(found_terms, found_patterns)
+
+    def stream(self, *, lookback: int = 256) -> "StreamingScan":
+        """Start an incremental scan for text that arrives in chunks."""
+        return StreamingScan(self, lookback=lookback)
+
+    @property
+    def max_term_length(self) -> int:
+        return len(self._terms[0]) if self._terms else 0
+
+    def _format(self, found_terms: set[str], found_patterns: set[int]) -> list[str]:
+        if not found_terms and not found_patterns:
+            return []
+
+        violations: list[str] = []
+        for term in self.forbidden_terms:
+            if term.lower() in found_terms:
+                violations.append(f"término prohibido: {term}")
+        for term in self.urgency_terms:
+            if term.lower() in found_terms:
+                violations.append(f"lenguaje de urgencia: {term}")
+        for index, pattern in enumerate(self.diagnosis_patterns):
+            if index in found_patterns:
+                violations.append(f"diagnóstico explícito: {pattern}")
+        return violations
+
+    def _find_terms(self, lower_text: str, start: int, found: set[str]) -> None:
+        if self._term_regex is None:
+            return
+        search = self._term_regex.search
+        match = search(lower_text, start)
+        while match is not None:
+            position = match.start()
+            for term in self._terms:
+                if lower_text.startswith(term, position):
+                    found.add(term)
+            if position >= len(lower_text):
+                break
+            match = search(lower_text, position + 1)
+
+    def _find_patterns(
+        self,
+        lower_text: str,
+        start: int,
+        found: set[int],
+        *,
+        settled_end: Optional[int] = None,
+    ) -> None:
+        """Add matching pattern indexes; with ``settled_end``, only matches ending before it."""
+        for index in self._separate:
+            if index in found:
+                continue
+            for hit in self._patterns[index].finditer(lower_text, start):
+                if settled_end is None or hit.end() < settled_end:
+                    found.add(index)
+                    break
+        if self._pattern_regex is None:
+            return
+        search = self._pattern_regex.search
+        match = search(lower_text, start)
+        while match is not None:
+            position = match.start()
+            for index in self._folded:
+                if index in found:
+                    continue
+                hit = self._patterns[index].match(lower_text, position)
+                if hit is not None and (settled_end is None or hit.end() < settled_end):
+                    found.add(index)
+            if position >= len(lower_text):
+                # An empty match at the end would be found again forever.
+                break
+            match = search(lower_text, position + 1)
+
+
+class StreamingScan:
+    """Incremental compliance scan over a response streamed in chunks.
+
+    ``feed`` only rescans the tail of the text that new chunks can affect, so
+    terms split across chunk boundaries are still found. A diagnosis pattern
+    counts as certain only once at least one character follows its match,
+    because a trailing ``\\b`` could still fail on the next chunk. Patterns
+    longer than ``lookback`` characters may only be caught by ``finish``,
+    which always scans the complete text.
+    """
+
+    def __init__(self, scanner: ComplianceScanner, *, lookback: int = 256) -> None:
+        self._scanner = scanner
+        self._lookback = lookback
+        self._chunks: list[str] = []
+        self._lower = ""
+        self._found_terms: set[str] = set()
+        self._found_patterns: set[int] = set()
+
+    def feed(self, chunk: str) -> bool:
+        """Add a chunk; return True once a violation is certain."""
+        if not chunk:
+            return self.failed
+        previous_length = len(self._lower)
+        self._chunks.append(chunk)
+        self._lower += chunk.lower()
+        scanner = self._scanner
+        term_start = max(0, previous_length - scanner.max_term_length + 1)
+        scanner._find_terms(self._lower, term_start, self._found_terms)
+        scanner._find_patterns(
+            self._lower,
+            max(0, previous_length - self._lookback),
+            self._found_patterns,
+            settled_end=len(self._lower),
+        )
+        return self.failed
+
+    @property
+    def failed(self) -> bool:
+        return bool(self._found_terms or self._found_patterns)
+
+    @property
+    def violations(self) -> list[str]:
+        """Violations that are certain so far, in rule order."""
+        return self._scanner._format(self._found_terms, self._found_patterns)
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def finish(self) -> list[str]:
+        """Return the exact violations of the complete text."""
+        return self._scanner.scan(self.text)
+
+
+def get_scanner(
+    *,
+    forbidden_terms: Iterable[str] = DEFAULT_FORBIDDEN_TERMS,
+    diagnosis_patterns: Sequence[str] = DEFAULT_DIAGNOSIS_PATTERNS,
+    urgency_terms: Iterable[str] = DEFAULT_URGENCY_TERMS,
+) -> ComplianceScanner:
+    """Return a cached scanner for the given rule sets."""
+    return _cached_scanner(
+        tuple(forbidden_terms), tuple(diagnosis_patterns), tuple(urgency_terms)
+    )
+
+
+@lru_cache(maxsize=32)
+def _cached_scanner(
+    forbidden_terms: tuple[str, ...],
+    diagnosis_patterns: tuple[str, ...],
+    urgency_terms: tuple[str, ...],
+) -> ComplianceScanner:
+    return ComplianceScanner(
+        forbidden_terms=forbidden_terms,
+        diagnosis_patterns=diagnosis_patterns,
+        urgency_terms=urgency_terms,
+    )
 
 
 def validate_email(
@@ -53,39 +354,142 @@ def validate_email(
         ComplianceError: When a forbidden term, diagnosis, or urgency trigger is found.
     """
 
-    violations = _collect_violations(
-        text,
+    with instrumentation.metrics.span("validation"):
+        violations = _collect_violations(
+            text,
+            forbidden_terms=forbidden_terms,
+            diagnosis_patterns=diagnosis_patterns,
+            urgency_terms=urgency_terms,
+        )
+    if violations:
+        raise_violations(violations)
+
+
+def raise_violations(violations: Sequence[str], check: Optional[EmailCheck] = None) -> None:
+    """Raise the ComplianceError used for every rejected email."""
+    instrumentation.record_violations(violations)
+    formatted = "; ".join(violations)
+    raise ComplianceError(f"Contenido no permitido: {formatted}", check, violations)
+
+
+_BLOCK_BREAK = re.compile(r"\n[ \t\r]*\n")
+_LINK_HINT = re.compile(r"://|www\.|@|\.(?:cl|com|org|net)\b")
+_TOKEN_PUNCTUATION = "¡!¿?.,;:()[]\"'«»…—–-"
+_INFORMAL = frozenset(INFORMAL_MARKERS)
+
+
+def check_structure(
+    text: str,
+    *,
+    min_words: int = MIN_WORDS,
+    max_words: int = MAX_WORDS,
+    blocks: int = REQUIRED_BLOCKS,
+) -> EmailCheck:
+    """Check block count, length, links, register and footer text of a body."""
+    return _check_structure((text or "").strip().lower(), min_words, max_words, blocks)
+
+
+def check_email(
+    text: str,
+    *,
+    forbidden_terms: Iterable[str] = DEFAULT_FORBIDDEN_TERMS,
+    diagnosis_patterns: Sequence[str] = DEFAULT_DIAGNOSIS_PATTERNS,
+    urgency_terms: Iterable[str] = DEFAULT_URGENCY_TERMS,
+    min_words: int = MIN_WORDS,
+    max_words: int = MAX_WORDS,
+    blocks: int = REQUIRED_BLOCKS,
+) -> EmailCheck:
+    """Check content and structure rules over a single lowercased copy of ``text``."""
+    lower_text = (text or "").strip().lower()
+    scanner = get_scanner(
         forbidden_terms=forbidden_terms,
         diagnosis_patterns=diagnosis_patterns,
         urgency_terms=urgency_terms,
     )
-    if violations:
-        formatted = "; ".join(violations)
-        raise ComplianceError(f"Contenido no permitido: {formatted}")
+    content = scanner.scan_lower(lower_text)
+    structure = _check_structure(lower_text, min_words, max_words, blocks)
+    if not content:
+        return structure
+    return EmailCheck(structure.words, structure.blocks, (*content, *structure.violations))
 
 
-def _collect_violations(
+def validate_output(
     text: str,
     *,
-    forbidden_terms: Iterable[str],
-    diagnosis_patterns: Sequence[str],
-    urgency_terms: Iterable[str],
-) -> list[str]:
-    lower_text = (text or "").lower()
+    forbidden_terms: Iterable[str] = DEFAULT_FORBIDDEN_TERMS,
+    diagnosis_patterns: Sequence[str] = DEFAULT_DIAGNOSIS_PATTERNS,
+    urgency_terms: Iterable[str] = DEFAULT_URGENCY_TERMS,
+) -> None:
+    """Validate a generated body against every output contract rule.
+
+    Extends `validate_email` with the structural rules: 7 blocks, 120-220
+    words, no links, formal register and no disclaimer or signature text.
+
+    Raises:
+        ComplianceError: With the `EmailCheck` as ``check`` when any rule fails.
+    """
+    with instrumentation.metrics.span("validation"):
+        check = check_email(
+            text,
+            forbidden_terms=forbidden_terms,
+            diagnosis_patterns=diagnosis_patterns,
+            urgency_terms=urgency_terms,
+        )
+    if check.violations:
+        raise_violations(check.violations, check)
+
+
+def _check_structure(lower_text: str, min_words: int, max_words: int, blocks: int) -> EmailCheck:
+    # One whitespace tokenization serves the word count, the register check
+    # and, only when the C-level link hint fires, link extraction. A
+    # per-token regex tokenizer was several times slower than the content scan.
+    tokens = lower_text.split()
+    words = len(tokens)
+    block_count = sum(1 for block in _BLOCK_BREAK.split(lower_text) if block.strip())
+    informal = _INFORMAL.intersection([token.strip(_TOKEN_PUNCTUATION) for token in tokens])
+    links: list[str] = []
+    if _LINK_HINT.search(lower_text) is not None:
+        links = [token for token in tokens if _LINK_HINT.search(token) is not None]
+
     violations: list[str] = []
+    if block_count != blocks:
+        violations.append(f"estructura: {block_count} bloques (se esperan {blocks})")
+    if not min_words <= words <= max_words:
+        violations.append(f"longitud: {words} palabras (se esperan {min_words}-{max_words})")
+    violations.extend(f"link no permitido: {link}" for link in links)
+    violations.extend(
+        f"registro informal: {marker}" for marker in INFORMAL_MARKERS if marker in informal
+    )
+    violations.extend(
+        f"disclaimer o firma incluidos: {marker}"
+        for marker in _footer_markers(*(read_text(path) for path in FOOTER_ASSETS))
+        if marker in lower_text
+    )
+    return EmailCheck(words, block_count, tuple(violations))
 
-    for term in forbidden_terms:
-        normalized = term.lower()
-        if normalized and normalized in lower_text:
-            violations.append(f"término prohibido: {term}")
 
-    for term in urgency_terms:
-        normalized = term.lower()
-        if normalized and normalized in lower_text:
-            violations.append(f"lenguaje de urgencia: {term}")
+@lru_cache(maxsize=4)
+def _footer_markers(*footers: str) -> tuple[str, ...]:
+    """Lowercased lines and sentences of the fixed footer assets."""
+    markers: list[str] = []
+    for footer in footers:
+        for line in footer.lower().splitlines():
+            for sentence in re.split(r"(?<=\.)\s+", line.strip()):
+                if len(sentence) >= 10 and sentence not in markers:
+                    markers.append(sentence)
+    return tuple(markers)
 
-    for pattern in diagnosis_patterns:
-        if re.search(pattern, lower_text):
-            violations.append(f"diagnóstico explícito: {pattern}")
 
-    return violations
+def _collect_violations(
+    text: str,
+    *,
+    forbidden_terms: Iterable[str],
+    diagnosis_patterns: Sequence[str],
+    urgency_terms: Iterable[str],
+) -> list[str]:
+    scanner = get_scanner(
+        forbidden_terms=forbidden_terms,
+        diagnosis_patterns=diagnosis_patterns,
+        urgency_terms=urgency_terms,
+    )
+    return scanner.scan(text)
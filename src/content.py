@@ -0,0 +1,65 @@
+"""Shared in-memory registry for prompt, template and static text assets."""
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+class ContentRegistry:
+    """Load text assets once and serve them from memory.
+
+    Assets are stored stripped, exactly as the previous per-call readers
+    returned them. The file mtime is re-checked at most once every
+    ``check_interval`` seconds per asset, so edits are picked up without
+    adding a ``stat`` call to every email. ``reload()`` drops everything
+    immediately.
+    """
+
+    def __init__(self, root: Path = REPO_ROOT, *, check_interval: float = 2.0) -> None:
+        self.root = Path(root)
+        self.check_interval = check_interval
+        self._entries: dict[str, tuple[int, float, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, relative_path: str) -> str:
+        """Return the stripped text of ``relative_path`` under the root."""
+        entry = self._entries.get(relative_path)
+        now = time.monotonic()
+        if entry is not None and now - entry[1] < self.check_interval:
+            return entry[2]
+
+        path = self.root / relative_path
+        mtime = path.stat().st_mtime_ns
+        with self._lock:
+            entry = self._entries.get(relative_path)
+            if entry is not None and entry[0] == mtime:
+                text = entry[2]
+            else:
+                text = path.read_text(encoding="utf-8").strip()
+            self._entries[relative_path] = (mtime, now, text)
+        return text
+
+    def reload(self, relative_path: Optional[str] = None) -> None:
+        """Forget one asset, or all of them, so the next access rereads disk."""
+        with self._lock:
+            if relative_path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(relative_path, None)
+
+
+registry = ContentRegistry()
+
+
+def read_text(relative_path: str) -> str:
+    """Return a repository text asset through the shared registry."""
+    return registry.get(relative_path)
+
+
+def reload(relative_path: Optional[str] = None) -> None:
+    """Invalidate cached assets in the shared registry."""
+    registry.reload(relative_path)
@@ -0,0 +1,303 @@
+"""Strict validator for the generator input contract.
+
+Mirrors section 1 of `input_output_contract.md`: only the listed fields are
+accepted, enums are exact, ``days_since_last_exam`` is an integer >= 0 and
+``mdls_tier`` is required when ``mdls_calculable`` is true. The schema below
+is compiled once at import into nested checkers with their field paths
+already bound, so checking a payload is a single pass over its keys with no
+per-call schema interpretation.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Callable, Iterable, Mapping, Optional
+
+from .decision_engine import DecisionInput
+
+MDLS_TIERS = ("BAJO", "MEDIO", "ALTO")
+RECENCY_TYPES = ("PRIMER_EXAMEN", "HISTORICO")
+FLAG_VALUES = ("NORMAL", "FUERA_RANGO", "SIN_DATO")
+MDLS_BIOMARKERS = ("GLU", "HBA1C", "LDL", "HDL", "VLDL", "TG", "PLT", "HGB", "ALT")
+
+
+@dataclass(frozen=True)
+class FieldError:
+    """One contract violation at a dotted field path."""
+
+    path: str
+    message: str
+
+    def __str__(self) -> str:
+        return f"{self.path}: {self.message}"
+
+
+class ContractError(ValueError):
+    """Raised when a payload does not satisfy the input contract."""
+
+    def __init__(self, errors: list[FieldError]) -> None:
+        self.errors = errors
+        super().__init__("Payload fuera de contrato: " + "; ".join(str(error) for error in errors))
+
+
+@dataclass(frozen=True)
+class Field:
+    """Declarative schema node compiled by `compile_schema`.
+
+    ``kind`` is one of ``object``, ``string``, ``name``, ``identifier``,
+    ``boolean``, ``number``, ``days``, ``date``, ``enum``, ``number_map`` and
+    ``enum_map``. ``keys`` restricts the keys of a map; ``rules`` are
+    cross-field checks run on a valid object.
+    """
+
+    kind: str
+    required: bool = False
+    choices: tuple[str, ...] = ()
+    fields: Mapping[str, "Field"] = field(default_factory=dict)
+    keys: Optional[tuple[str, ...]] = None
+    rules: tuple[Callable[[Mapping[str, Any], str, list[FieldError]], None], ...] = ()
+
+
+def _clinical_rules(clinical: Mapping[str, Any], path: str, errors: list[FieldError]) -> None:
+    calculable = clinical.get("mdls_calculable")
+    if calculable is True and "mdls_tier" not in clinical:
+        errors.append(FieldError(f"{path}.mdls_tier", "obligatorio si mdls_calculable es true"))
+    if calculable is False:
+        for name in ("mdls_score", "mdls_tier"):
+            if name in clinical:
+                errors.append(FieldError(f"{path}.{name}", "solo se admite si mdls_calculable es true"))
+
+
+CONTRACT = Field(
+    "object",
+    required=True,
+    fields={
+        "patient": Field(
+            "object",
+            required=True,
+            fields={
+                "patient_id": Field("identifier"),
+                "patient_name": Field("name", required=True),
+                "patient_email": Field("string"),
+            },
+        ),
+        "clinical": Field(
+            "object",
+            required=True,
+            fields={
+                "mdls_calculable": Field("boolean", required=True),
+                "mdls_score": Field("number"),
+                "mdls_tier": Field("enum", choices=MDLS_TIERS),
+                "biomarkers": Field("number_map", keys=MDLS_BIOMARKERS),
+                "biomarker_flags": Field("enum_map", choices=FLAG_VALUES),
+                "mdls_derivatives": Field("number_map"),
+                "comorbidity_channels": Field("number_map"),
+            },
+            rules=(_clinical_rules,),
+        ),
+        "temporal": Field(
+            "object",
+            required=True,
+            fields={
+                "last_exam_date": Field("date"),
+                "days_since_last_exam": Field("days", required=True),
+                "recency_type": Field("enum", required=True, choices=RECENCY_TYPES),
+            },
+        ),
+    },
+)
+
+Checker = Callable[[Any, list[FieldError]], None]
+
+
+def compile_schema(node: Field, path: str = "") -> Checker:
+    """Compile a schema node into a ``check(value, errors)`` function."""
+    label = path or "payload"
+    kind = node.kind
+    if kind == "object":
+        return _compile_object(node, path, label)
+    if kind in ("number_map", "enum_map"):
+        return _compile_map(node, label)
+    if kind == "enum":
+        return _enum_checker(label, node.choices)
+    simple = _SIMPLE_CHECKS.get(kind)
+    if simple is None:
+        raise ValueError(f"Unknown schema kind: {kind}")
+    test, message = simple
+
+    def check(value: Any, errors: list[FieldError]) -> None:
+        if not test(value):
+            errors.append(FieldError(label, message))
+
+    return check
+
+
+def _compile_object(node: Field, path: str, label: str) -> Checker:
+    prefix = f"{path}." if path else ""
+    checkers = {name: compile_schema(child, prefix + name) for name, child in node.fields.items()}
+    required = frozenset(name for name, child in node.fields.items() if child.required)
+    rules = node.rules
+
+    def check(value: Any, errors: list[FieldError]) -> None:
+        if not isinstance(value, dict):
+            errors.append(FieldError(label, "debe ser un objeto"))
+            return
+        for name, item in value.items():
+            checker = checkers.get(name)
+            if checker is None:
+                errors.append(FieldError(f"{prefix}{name}", "campo no permitido por el contrato"))
+            else:
+                checker(item, errors)
+        if not required.issubset(value.keys()):
+            for name in sorted(required.difference(value.keys())):
+                errors.append(FieldError(prefix + name, "campo requerido ausente"))
+        for rule in rules:
+            rule(value, label, errors)
+
+    return check
+
+
+def _compile_map(node: Field, label: str) -> Checker:
+    allowed = frozenset(node.keys) if node.keys is not None else None
+    if node.kind == "enum_map":
+        choices = frozenset(node.choices)
+        test: Callable[[Any], bool] = lambda item: isinstance(item, str) and item in choices
+        message = "debe ser uno de " + " | ".join(node.choices)
+        valid_values: Callable[[Any], bool] = lambda values: choices.issuperset(values)
+    else:
+        test = _is_number
+        message = "debe ser numérico"
+        valid_values = lambda values: _NUMBER_TYPES.issuperset(map(type, values))
+
+    def check(value: Any, errors: list[FieldError]) -> None:
+        if not isinstance(value, dict):
+            errors.append(FieldError(label, "debe ser un objeto"))
+            return
+        # Fast path: whole-map set checks; per-item errors only when they fail.
+        try:
+            if (allowed is None or allowed.issuperset(value)) and valid_values(value.values()):
+                return
+        except TypeError:
+            pass
+        for key, item in value.items():
+            if allowed is not None and key not in allowed:
+                errors.append(FieldError(f"{label}.{key}", "clave no permitida por el contrato"))
+            elif not test(item):
+                errors.append(FieldError(f"{label}.{key}", message))
+
+    return check
+
+
+def _enum_checker(label: str, choices: tuple[str, ...]) -> Checker:
+    allowed = frozenset(choices)
+    message = "debe ser uno de " + " | ".join(choices)
+
+    def check(value: Any, errors: list[FieldError]) -> None:
+        if not isinstance(value, str) or value not in allowed:
+            errors.append(FieldError(label, message))
+
+    return check
+
+
+_NUMBER_TYPES = frozenset((int, float))
+
+
+def _is_number(value: Any) -> bool:
+    return type(value) in _NUMBER_TYPES
+
+
+def _is_iso_date(value: Any) -> bool:
+    if not isinstance(value, str) or len(value) != 10:
+        return False
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+_SIMPLE_CHECKS: dict[str, tuple[Callable[[Any], bool], str]] = {
+    "string": (lambda value: isinstance(value, str), "debe ser texto"),
+    "name": (lambda value: isinstance(value, str) and bool(value.strip()), "debe ser texto no vacío"),
+    "identifier": (
+        lambda value: isinstance(value, (str, int)) and not isinstance(value, bool),
+        "debe ser texto o número entero",
+    ),
+    "boolean": (lambda value: isinstance(value, bool), "debe ser booleano"),
+    "number": (_is_number, "debe ser numérico"),
+    "days": (
+        lambda value: type(value) is int and value >= 0,
+        "debe ser un entero >= 0",
+    ),
+    "date": (_is_iso_date, "debe ser una fecha YYYY-MM-DD"),
+}
+
+_check_payload = compile_schema(CONTRACT)
+
+
+def validate_payload(payload: Any) -> list[FieldError]:
+    """Return every contract violation in ``payload``; empty when it is valid."""
+    errors: list[FieldError] = []
+    _check_payload(payload, errors)
+    return errors
+
+
+def to_decision_input(payload: Any) -> DecisionInput:
+    """Validate ``payload`` and build the decision engine input from it.
+
+    Raises:
+        ContractError: With the per-field errors when the payload is invalid.
+    """
+    errors: list[FieldError] = []
+    _check_payload(payload, errors)
+    if errors:
+        raise ContractError(errors)
+    return _decision_input(payload["clinical"])
+
+
+@dataclass(frozen=True)
+class ValidPayload:
+    index: int
+    payload: Mapping[str, Any]
+    decision_input: DecisionInput
+
+
+@dataclass(frozen=True)
+class RejectedPayload:
+    index: int
+    payload: Any
+    errors: list[FieldError]
+
+
+@dataclass
+class ContractPartition:
+    """Result of `partition_payloads`, both lists in input order."""
+
+    valid: list[ValidPayload] = field(default_factory=list)
+    rejected: list[RejectedPayload] = field(default_factory=list)
+
+
+def partition_payloads(payloads: Iterable[Any]) -> ContractPartition:
+    """Split payloads into valid ones (with their `DecisionInput`) and rejected ones."""
+    partition = ContractPartition()
+    accept = partition.valid.append
+    reject = partition.rejected.append
+    check = _check_payload
+    for index, payload in enumerate(payloads):
+        errors: list[FieldError] = []
+        check(payload, errors)
+        if errors:
+            reject(RejectedPayload(index, payload, errors))
+        else:
+            accept(ValidPayload(index, payload, _decision_input(payload["clinical"])))
+    return partition
+
+
+def _decision_input(clinical: Mapping[str, Any]) -> DecisionInput:
+    return DecisionInput(
+        mdls_calculable=clinical["mdls_calculable"],
+        mdls_tier=clinical.get("mdls_tier"),
+        biomarker_flags=clinical.get("biomarker_flags"),
+        mdls_derivatives=clinical.get("mdls_derivatives"),
+        comorbidity_channels=clinical.get("comorbidity_channels"),
+    )
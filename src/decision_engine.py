@@ -5,8 +5,12 @@ package label used later by the prompt/generator layer.
 """
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Mapping, Optional
+import csv
+import itertools
+from dataclasses import dataclass, field
+from typing import Iterable, Mapping, Optional, TextIO
+
+from . import instrumentation
 
 
 MDLS_TIER_TO_PACKAGE = {
@@ -24,6 +28,9 @@ BIOMARKER_RISK_TO_PACKAGE = {
 GLUCOSE_MARKERS = {"GLU", "HBA1C"}
 LIPID_MARKERS = {"TG", "VLDL", "HDL", "LDL", "NON_HDL"}
 HEPATIC_MARKERS = {"ALT", "AST_ALT_RATIO"}
+SOLE_MEDIO_MARKERS = {"GLU", "HBA1C", "TG", "VLDL"}
+
+FEATURE_SIGNALS = ("OTHER_ABNORMAL", "DERIVATIVE", "COMORBIDITY")
 
 
 @dataclass(frozen=True)
@@ -41,6 +48,134 @@ class DecisionEngineError(ValueError):
     """Raised when decision inputs are inconsistent or incomplete."""
 
 
+@dataclass(frozen=True)
+class RiskTierTable:
+    """Precomputed biomarker risk tier for every feature bitmask.
+
+    Bit ``i`` of a mask is set when ``markers[i]`` is FUERA_RANGO; the three
+    bits after the markers stand for FEATURE_SIGNALS: any other marker
+    FUERA_RANGO, any truthy derivative and any truthy comorbidity channel.
+    Those are the only facts the rules look at, so ``tiers[mask]`` is the
+    full decision surface.
+    """
+
+    markers: tuple[str, ...]
+    tiers: tuple[str, ...]
+    bits: Mapping[str, int] = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        bits = {marker: 1 << index for index, marker in enumerate(self.markers)}
+        object.__setattr__(self, "bits", bits)
+
+    @property
+    def feature_names(self) -> tuple[str, ...]:
+        return self.markers + FEATURE_SIGNALS
+
+    def encode(
+        self,
+        biomarker_flags: Optional[Mapping[str, str]],
+        mdls_derivatives: Optional[Mapping[str, float]],
+        comorbidity_channels: Optional[Mapping[str, float]],
+    ) -> int:
+        """Build the feature bitmask for one patient."""
+
+        width = len(self.markers)
+        other_bit = 1 << width
+        mask = 0
+        for marker, status in (biomarker_flags or {}).items():
+            if (status or "").upper() == "FUERA_RANGO":
+                mask |= self.bits.get(marker, other_bit)
+        if any(value for value in (mdls_derivatives or {}).values()):
+            mask |= 1 << (width + 1)
+        if any(value for value in (comorbidity_channels or {}).values()):
+            mask |= 1 << (width + 2)
+        return mask
+
+    def decode(self, mask: int) -> tuple[dict[str, str], dict[str, float], dict[str, float]]:
+        """Return representative rule inputs for a feature bitmask."""
+
+        width = len(self.markers)
+        flags = {
+            marker: "FUERA_RANGO"
+            for index, marker in enumerate(self.markers)
+            if mask & (1 << index)
+        }
+        if mask & (1 << width):
+            flags["OTHER"] = "FUERA_RANGO"
+        derivatives = {"ANY": 1.0} if mask & (1 << (width + 1)) else {}
+        comorbidities = {"ANY": 1.0} if mask & (1 << (width + 2)) else {}
+        return flags, derivatives, comorbidities
+
+    def rows(self) -> list[dict[str, object]]:
+        """Export the table as one row per mask, for audits."""
+
+        names = self.feature_names
+        return [
+            {
+                "mask": mask,
+                **{name: bool(mask & (1 << index)) for index, name in enumerate(names)},
+                "tier": tier,
+            }
+            for mask, tier in enumerate(self.tiers)
+        ]
+
+    def write_csv(self, stream: TextIO) -> None:
+        writer = csv.DictWriter(stream, fieldnames=["mask", *self.feature_names, "tier"])
+        writer.writeheader()
+        writer.writerows(self.rows())
+
+
+def build_risk_tier_table(markers: Optional[Iterable[str]] = None) -> RiskTierTable:
+    """Evaluate the rules once per feature combination."""
+
+    if markers is None:
+        markers = GLUCOSE_MARKERS | LIPID_MARKERS | HEPATIC_MARKERS | SOLE_MEDIO_MARKERS
+    placeholder = RiskTierTable(markers=tuple(sorted(markers)), tiers=())
+    size = 1 << len(placeholder.feature_names)
+    tiers = tuple(_evaluate_rules(*placeholder.decode(mask)) for mask in range(size))
+    return RiskTierTable(markers=placeholder.markers, tiers=tiers)
+
+
+def get_risk_tier_table() -> RiskTierTable:
+    """Return the active table, building it on first use."""
+
+    global _risk_tier_table
+    if _risk_tier_table is None:
+        _risk_tier_table = build_risk_tier_table()
+    return _risk_tier_table
+
+
+def rebuild_risk_tier_table() -> RiskTierTable:
+    """Rebuild the active table after the marker sets or rules change."""
+
+    global _risk_tier_table
+    _risk_tier_table = build_risk_tier_table()
+    return _risk_tier_table
+
+
+def diff_risk_tier_tables(old: RiskTierTable, new: RiskTierTable) -> list[dict[str, object]]:
+    """List the feature combinations whose tier differs between two tables.
+
+    Tables built from different marker sets are compared over the union of
+    their markers, so rule versions can be audited against each other.
+    """
+
+    union = RiskTierTable(markers=tuple(sorted(set(old.markers) | set(new.markers))), tiers=())
+    changes: list[dict[str, object]] = []
+    names = union.feature_names
+    for bits in itertools.product((False, True), repeat=len(names)):
+        mask = sum(1 << index for index, bit in enumerate(bits) if bit)
+        inputs = union.decode(mask)
+        old_tier = old.tiers[old.encode(*inputs)]
+        new_tier = new.tiers[new.encode(*inputs)]
+        if old_tier != new_tier:
+            changes.append({**dict(zip(names, bits)), "old": old_tier, "new": new_tier})
+    return changes
+
+
+_risk_tier_table: Optional[RiskTierTable] = None
+
+
 def assign_package(decision_input: DecisionInput) -> str:
     """Assign the membership package based on deterministic rules.
 
@@ -50,7 +185,16 @@ def assign_package(decision_input: DecisionInput) -> str:
     Returns:
         Package label: STANDARD, SILVER, or GOLD.
     """
+    metrics = instrumentation.metrics
+    if not metrics.enabled:
+        return _assign_package(decision_input)
+    with metrics.span("decision"):
+        package = _assign_package(decision_input)
+    metrics.inc("packages_assigned_total", package=package)
+    return package
+
 
+def _assign_package(decision_input: DecisionInput) -> str:
     if decision_input.mdls_calculable:
         if not decision_input.mdls_tier:
             raise DecisionEngineError("mdls_tier is required when mdls_calculable is true")
@@ -79,8 +223,20 @@ def derive_biomarker_risk_tier(
     - Use MEDIO for consistent but less severe patterns, including a single
       clinically relevant biomarker or comorbidity channel when that is the
       only available signal.
+
+    The rules live in `_evaluate_rules`; this function only builds the
+    feature bitmask and looks the tier up in the precomputed table.
     """
 
+    table = get_risk_tier_table()
+    return table.tiers[table.encode(biomarker_flags, mdls_derivatives, comorbidity_channels)]
+
+
+def _evaluate_rules(
+    biomarker_flags: Optional[Mapping[str, str]],
+    mdls_derivatives: Optional[Mapping[str, float]],
+    comorbidity_channels: Optional[Mapping[str, float]],
+) -> str:
     flags = {k: (v or "").upper() for k, v in (biomarker_flags or {}).items()}
     derivatives = {k: v for k, v in (mdls_derivatives or {}).items()}
     comorbidities = {k: v for k, v in (comorbidity_channels or {}).items()}
@@ -111,7 +267,7 @@ def derive_biomarker_risk_tier(
 
     if len(abnormal_markers) == 1:
         sole_marker = next(iter(abnormal_markers))
-        if sole_marker in {"GLU", "HBA1C", "TG", "VLDL"}:
+        if sole_marker in SOLE_MEDIO_MARKERS:
             return "MEDIO"
 
     if renal_abnormal and not abnormal_markers:
@@ -123,6 +279,16 @@ def derive_biomarker_risk_tier(
     return "BAJO"
 
 
+def encode_features(
+    biomarker_flags: Optional[Mapping[str, str]],
+    mdls_derivatives: Optional[Mapping[str, float]],
+    comorbidity_channels: Optional[Mapping[str, float]],
+) -> int:
+    """Encode the inputs of `derive_biomarker_risk_tier` as a feature bitmask."""
+
+    return get_risk_tier_table().encode(biomarker_flags, mdls_derivatives, comorbidity_channels)
+
+
 def _package_from_tier(tier: str, mapping: Mapping[str, str]) -> str:
     normalized = (tier or "").strip().upper()
     if normalized not in mapping:
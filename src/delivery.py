@@ -0,0 +1,428 @@
+"""SMTP delivery of rendered campaign emails over pooled connections.
+
+`SMTPPool` keeps up to ``size`` authenticated SMTP connections open and
+reuses each one for up to ``max_messages_per_connection`` messages, so a
+campaign does not pay a TCP/TLS handshake per email. When the server
+advertises ``PIPELINING``, the MAIL, RCPT and DATA commands of a message
+go out in one write and their replies are read together.
+
+`deliver` sends envelopes from a thread per pooled connection and yields
+one `DeliveryResult` per envelope, in input order. A shared `TokenBucket`
+caps the send rate. Transient failures are retried with the backoff of a
+`RetryPolicy`: 4xx replies, dropped connections and timeouts. 5xx replies
+fail the message at once.
+
+Sender and recipient are checked with `spool.normalize_address` before
+any command is built, so an address cannot smuggle extra SMTP commands into
+a pipelined write. A connection whose replies do not fit the commands sent,
+or that fails to reset, is dropped instead of going back to the pool.
+
+Usage:
+    python -m src.delivery spool.jsonl --host smtp.example.com --port 587 --starttls \\
+        --user campañas --password-env SMTP_PASSWORD --connections 4 --rpm 600
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import queue
+import re
+import smtplib
+import ssl
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from email.utils import parseaddr
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, Optional, Union
+
+from . import instrumentation
+from .batch import map_in_order
+from .retry import RetryPolicy, TokenBucket
+from .spool import DEFAULT_SENDER, MessageRenderer, OutgoingEmail, normalize_address
+
+SENT = "sent"
+FAILED = "failed"
+
+_LEADING_DOT = re.compile(rb"^\.", re.MULTILINE)
+_TRANSIENT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError, OSError)
+_ACCEPTED = (250, 251)
+
+
+@dataclass(frozen=True)
+class SMTPConfig:
+    """Where and how to connect; ``sender`` is the envelope sender."""
+
+    host: str = "localhost"
+    port: int = 25
+    sender: str = parseaddr(DEFAULT_SENDER)[1]
+    starttls: bool = False
+    use_ssl: bool = False
+    username: Optional[str] = None
+    password: Optional[str] = None
+    timeout: float = 30.0
+    local_hostname: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class Envelope:
+    """A rendered RFC 5322 message (CRLF line ends) and its recipient."""
+
+    recipient: Optional[str]
+    data: bytes
+    patient_id: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class DeliveryResult:
+    """Outcome of one envelope; ``code`` is the last SMTP reply code, if any."""
+
+    index: int
+    patient_id: Optional[str]
+    recipient: Optional[str]
+    status: str
+    attempts: int
+    code: Optional[int] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class DeliveryStats:
+    """Counters for one `deliver` run."""
+
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    connections: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+
+class SMTPDeliveryError(smtplib.SMTPResponseException):
+    """Non-250 reply to a pipelined command."""
+
+
+def envelope_for(message: OutgoingEmail, renderer: Optional[MessageRenderer] = None) -> Envelope:
+    """Render ``message`` for SMTP; the renderer must use CRLF line ends."""
+    renderer = renderer if renderer is not None else MessageRenderer()
+    return Envelope(message.recipient, renderer.render(message), message.patient_id)
+
+
+def read_spool_envelopes(path: Union[str, Path]) -> Iterator[Envelope]:
+    """Yield the envelopes of a JSONL spool written by `spool.JsonlSpool`."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield Envelope(record.get("to"), record["message"].encode("utf-8"), record.get("patient_id"))
+
+
+class _Connection:
+    def __init__(self, smtp: smtplib.SMTP, pipelining: bool) -> None:
+        self.smtp = smtp
+        self.pipelining = pipelining
+        self.eight_bit = smtp.has_extn("8bitmime")
+        self.sent = 0
+        # Set when the session state is unknown; the pool then drops the connection.
+        self.broken = False
+
+    def send(self, sender: str, envelope: Envelope) -> None:
+        """Send one envelope.
+
+        Raises:
+            ValueError: When the sender or recipient is not a well-formed address.
+            smtplib.SMTPResponseException: On a rejecting or unexpected reply.
+        """
+        sender = normalize_address(sender)
+        recipient = normalize_address(envelope.recipient)
+        if not self.pipelining:
+            self.smtp.sendmail(sender, [recipient], envelope.data)
+            return
+        smtp = self.smtp
+        body = " BODY=8BITMIME" if self.eight_bit else ""
+        smtp.send(f"MAIL FROM:<{sender}>{body}\r\nRCPT TO:<{recipient}>\r\nDATA\r\n")
+        replies = [
+            (smtp.getreply(), expected) for expected in ((250,), _ACCEPTED, (354,))
+        ]
+        refused = next((reply for reply, expected in replies if reply[0] not in expected), None)
+        if refused is not None:
+            in_step = all(_fits(reply[0], expected) for reply, expected in replies)
+            if not in_step or replies[2][0][0] == 354:
+                # Replies out of step with MAIL/RCPT/DATA, or DATA opened for a
+                # refused envelope: the session state is unknown.
+                self.broken = True
+            else:
+                self._reset()
+            raise SMTPDeliveryError(*refused)
+        payload = _LEADING_DOT.sub(b"..", envelope.data)
+        if not payload.endswith(b"\r\n"):
+            payload += b"\r\n"
+        smtp.send(payload + b".\r\n")
+        code, reply = smtp.getreply()
+        if code != 250:
+            self.broken = not _fits(code, (250,))
+            raise SMTPDeliveryError(code, reply)
+
+    def _reset(self) -> None:
+        try:
+            code, _ = self.smtp.rset()
+        except (smtplib.SMTPException, OSError):
+            self.broken = True
+            return
+        if code != 250:
+            self.broken = True
+
+    def close(self) -> None:
+        if self.broken:
+            # QUIT may be read as message data mid-DATA; drop the socket instead.
+            self.smtp.close()
+            return
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+
+
+class SMTPPool:
+    """Up to ``size`` persistent SMTP connections, opened on demand.
+
+    A connection goes back to the pool after each message and is closed
+    after ``max_messages_per_connection`` messages or on any transport
+    error. ``pipelining=False`` ignores the server's PIPELINING extension.
+    """
+
+    def __init__(
+        self,
+        config: SMTPConfig,
+        *,
+        size: int = 4,
+        max_messages_per_connection: int = 100,
+        pipelining: bool = True,
+        factory: Optional[Callable[[SMTPConfig], smtplib.SMTP]] = None,
+    ) -> None:
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        if max_messages_per_connection < 1:
+            raise ValueError("max_messages_per_connection must be at least 1")
+        self.config = config
+        self.size = size
+        self.max_messages_per_connection = max_messages_per_connection
+        self.pipelining = pipelining
+        self.opened = 0
+        self._factory = factory if factory is not None else _connect
+        self._idle: "queue.LifoQueue[_Connection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    def acquire(self) -> _Connection:
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            smtp = self._factory(self.config)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.opened += 1
+        instrumentation.metrics.inc("smtp_connections_total")
+        return _Connection(smtp, self.pipelining and smtp.has_extn("pipelining"))
+
+    def release(self, connection: _Connection, *, broken: bool = False) -> None:
+        if broken or connection.sent >= self.max_messages_per_connection:
+            connection.close()
+        else:
+            self._idle.put(connection)
+        self._slots.release()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def __enter__(self) -> "SMTPPool":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+def deliver(
+    envelopes: Iterable[Envelope],
+    pool: SMTPPool,
+    *,
+    policy: Optional[RetryPolicy] = None,
+    rate_limiter: Optional[TokenBucket] = None,
+    stats: Optional[DeliveryStats] = None,
+) -> Iterator[DeliveryResult]:
+    """Send every envelope and yield its `DeliveryResult` in input order.
+
+    ``policy`` sets the attempts per message and the backoff between them;
+    its own rate limiter is used when ``rate_limiter`` is not given.
+    Envelopes without a recipient fail without touching the pool.
+    """
+    policy = policy if policy is not None else RetryPolicy(max_attempts=3)
+    limiter = rate_limiter if rate_limiter is not None else policy.rate_limiter
+    sender = pool.config.sender
+
+    def send(item: tuple[int, Envelope]) -> DeliveryResult:
+        index, envelope = item
+        if not envelope.recipient:
+            return DeliveryResult(index, envelope.patient_id, None, FAILED, 0, error="sin destinatario")
+        code: Optional[int] = None
+        error = ""
+        for attempt in range(1, policy.max_attempts + 1):
+            if limiter is not None:
+                limiter.acquire()
+            connection: Optional[_Connection] = None
+            broken = False
+            try:
+                connection = pool.acquire()
+                with instrumentation.metrics.span("smtp"):
+                    connection.send(sender, envelope)
+                connection.sent += 1
+                return DeliveryResult(index, envelope.patient_id, envelope.recipient, SENT, attempt, 250)
+            except smtplib.SMTPRecipientsRefused as exc:
+                code, reply = next(iter(exc.recipients.values()))
+                error = _reply_text(reply)
+            except smtplib.SMTPResponseException as exc:
+                code, error = exc.smtp_code, _reply_text(exc.smtp_error)
+                broken = code == 421
+            except _TRANSIENT_ERRORS as exc:
+                code, error, broken = None, str(exc) or type(exc).__name__, True
+            except ValueError as exc:
+                # Malformed sender or recipient; retrying will not help.
+                code, error = None, str(exc)
+                break
+            finally:
+                if connection is not None:
+                    pool.release(connection, broken=broken or connection.broken)
+            if code is not None and not 400 <= code < 500:
+                break
+            if attempt < policy.max_attempts:
+                instrumentation.metrics.inc("smtp_retries_total", code=str(code or "conexion"))
+                time.sleep(policy.backoff(attempt))
+        return DeliveryResult(
+            index, envelope.patient_id, envelope.recipient, FAILED, attempt, code, error
+        )
+
+    stats = stats if stats is not None else DeliveryStats()
+    started = time.perf_counter()
+    opened = pool.opened
+    try:
+        for result in map_in_order(send, enumerate(envelopes), max_in_flight=pool.size):
+            if result.status == SENT:
+                stats.sent += 1
+            else:
+                stats.failed += 1
+            stats.retries += max(0, result.attempts - 1)
+            instrumentation.metrics.inc("emails_delivered_total", status=result.status)
+            yield result
+    finally:
+        stats.elapsed += time.perf_counter() - started
+        stats.connections += pool.opened - opened
+
+
+def _connect(config: SMTPConfig) -> smtplib.SMTP:
+    if config.use_ssl:
+        smtp: smtplib.SMTP = smtplib.SMTP_SSL(
+            config.host,
+            config.port,
+            local_hostname=config.local_hostname,
+            timeout=config.timeout,
+            context=ssl.create_default_context(),
+        )
+    else:
+        smtp = smtplib.SMTP(
+            config.host, config.port, local_hostname=config.local_hostname, timeout=config.timeout
+        )
+    try:
+        smtp.ehlo()
+        if config.starttls:
+            smtp.starttls(context=ssl.create_default_context())
+            smtp.ehlo()
+        if config.username:
+            smtp.login(config.username, config.password or "")
+    except BaseException:
+        smtp.close()
+        raise
+    return smtp
+
+
+def _fits(code: int, accepted: tuple[int, ...]) -> bool:
+    """Whether ``code`` is a possible reply to a command expecting ``accepted``."""
+    return code in accepted or 400 <= code < 600
+
+
+def _reply_text(reply: Union[bytes, str]) -> str:
+    return reply.decode("utf-8", "replace") if isinstance(reply, bytes) else str(reply)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Deliver a JSONL spool over pooled SMTP connections.")
+    parser.add_argument("spools", nargs="+", help="JSONL spool files written by src.spool")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=25)
+    parser.add_argument("--sender", default=SMTPConfig.sender, help="envelope sender address")
+    parser.add_argument("--starttls", action="store_true")
+    parser.add_argument("--ssl", action="store_true", help="implicit TLS (usually port 465)")
+    parser.add_argument("--user")
+    parser.add_argument("--password-env", help="environment variable holding the SMTP password")
+    parser.add_argument("--connections", type=int, default=4, help="persistent connections")
+    parser.add_argument("--per-connection", type=int, default=100, help="messages per connection")
+    parser.add_argument("--no-pipelining", action="store_true")
+    parser.add_argument("--rpm", type=float, help="messages per minute across all connections")
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument("--report", help="write one JSON line per message to this file")
+    args = parser.parse_args(argv)
+
+    config = SMTPConfig(
+        host=args.host,
+        port=args.port,
+        sender=args.sender,
+        starttls=args.starttls,
+        use_ssl=args.ssl,
+        username=args.user,
+        password=os.environ.get(args.password_env, "") if args.password_env else None,
+    )
+    policy = RetryPolicy(
+        max_attempts=args.max_attempts,
+        rate_limiter=TokenBucket(args.rpm) if args.rpm else None,
+    )
+    envelopes = (envelope for path in args.spools for envelope in read_spool_envelopes(path))
+    stats = DeliveryStats()
+    report = open(args.report, "w", encoding="utf-8") if args.report else None
+    try:
+        with SMTPPool(
+            config,
+            size=args.connections,
+            max_messages_per_connection=args.per_connection,
+            pipelining=not args.no_pipelining,
+        ) as pool:
+            for result in deliver(envelopes, pool, policy=policy, stats=stats):
+                if report is not None:
+                    report.write(json.dumps(asdict(result), ensure_ascii=False) + "\n")
+    finally:
+        if report is not None:
+            report.close()
+
+    print(
+        f"enviados={stats.sent} fallidos={stats.failed} reintentos={stats.retries} "
+        f"conexiones={stats.connections} segundos={stats.elapsed:.2f} "
+        f"correos_por_s={stats.throughput:.1f}",
+        file=sys.stderr,
+    )
+    return 0 if stats.failed == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,10 +1,20 @@
 """Single-entry email generator for the Minimed preventive program."""
 from __future__ import annotations
 
-from pathlib import Path
-from typing import Callable
+from functools import lru_cache
+from typing import Awaitable, Callable, Iterable, Union
 
-from .compliance import validate_email
+from . import instrumentation
+from .compliance import (
+    ComplianceScanner,
+    check_structure,
+    get_scanner,
+    raise_violations,
+    validate_output,
+)
+from .content import read_text
+from .retry import RetryPolicy, ainvoke_llm
+from .templating import Slot, SlotTemplate
 
 ALLOWED_PACKAGES = {"STANDARD", "SILVER", "GOLD"}
 ALLOWED_RECENCY_TYPES = {"PRIMER_EXAMEN", "HISTORICO"}
@@ -25,33 +35,77 @@ def build_prompt(
     program_name: str = "Programa Preventivo de Minimed",
 ) -> str:
     """Build the prompt contract for the LLM, including narrative anchors."""
+    metrics = instrumentation.metrics
+    if not metrics.enabled:
+        return _build_prompt(patient_name, package, recency_type, days_since_last_exam, program_name)
+    with metrics.span("prompt"):
+        prompt = _build_prompt(patient_name, package, recency_type, days_since_last_exam, program_name)
+    instrumentation.record_prompt(prompt)
+    return prompt
+
+
+def _build_prompt(
+    patient_name: str,
+    package: str,
+    recency_type: str,
+    days_since_last_exam: int,
+    program_name: str,
+) -> str:
     normalized_package = _normalize_package(package)
     normalized_recency = _normalize_recency(recency_type)
 
-    recency_message = build_recency_message(normalized_recency, days_since_last_exam)
-    prompt_contract = _load_prompt_contract()
-    anchor_template = _load_package_template(normalized_package)
-
-    anchor_example = (
-        anchor_template.replace("{{patient_name}}", patient_name).replace(
-            "{{recency_message}}", recency_message
-        )
+    template = compile_prompt(
+        normalized_package,
+        recency_bucket(normalized_recency, days_since_last_exam),
+        program_name,
+    )
+    return template.render(
+        {"patient_name": patient_name, "days_since_last_exam": str(days_since_last_exam)}
     )
 
-    return (
-        f"{prompt_contract}\n\n"
-        "INPUTS PARA LA GENERACIÓN\n"
-        f"- patient_name: {patient_name}\n"
-        f"- recency_type: {normalized_recency}\n"
-        f"- days_since_last_exam: {days_since_last_exam}\n"
-        f"- package: {normalized_package}\n"
-        f"- program_name: {program_name}\n\n"
-        "EJEMPLO DE ESTILO POR PAQUETE (NO COPIAR LITERAL)\n"
-        f"{anchor_example}\n\n"
-        "RESPUESTA:\n"
+
+def compile_prompt(
+    package: str,
+    recency_bucket: str,
+    program_name: str = "Programa Preventivo de Minimed",
+) -> SlotTemplate:
+    """Return the precompiled prompt for a package and recency bucket.
+
+    The result only has the ``patient_name`` and ``days_since_last_exam``
+    slots left; everything else, including the anchor example with its
+    recency message, is constant text. ``template.prefix`` is the part shared
+    by every patient and can be handed to LLM backends as a cacheable prefix.
+    """
+    normalized_package = _normalize_package(package)
+    if recency_bucket not in RECENCY_MESSAGES:
+        raise ValueError(f"recency_bucket must be one of {sorted(RECENCY_MESSAGES)}")
+    return _compile_prompt(
+        _load_prompt_contract(),
+        _load_package_template(normalized_package),
+        normalized_package,
+        recency_bucket,
+        program_name,
     )
 
 
+def preload(program_name: str = "Programa Preventivo de Minimed") -> None:
+    """Read the prompt and static assets and compile every prompt and the scanner.
+
+    Nothing is loaded at import time; long-lived workers call this once at
+    startup so the first patient does not pay for disk reads and compilation.
+    """
+    for package in sorted(ALLOWED_PACKAGES):
+        for bucket in RECENCY_MESSAGES:
+            compile_prompt(package, bucket, program_name)
+    get_scanner()
+    check_structure("")
+
+
+def prompt_prefix() -> str:
+    """Constant prompt prefix (contract and input headers) shared by all patients."""
+    return compile_prompt("STANDARD", "PRIMER_EXAMEN").prefix
+
+
 def generate_email(
     patient_name: str,
     package: str,
@@ -59,9 +113,14 @@ def generate_email(
     days_since_last_exam: int,
     llm: Callable[[str], str],
     program_name: str = "Programa Preventivo de Minimed",
-    validator: Callable[[str], None] | None = validate_email,
+    validator: Callable[[str], None] | None = validate_output,
+    policy: RetryPolicy | None = None,
 ) -> str:
-    """Generate the email body using a single LLM call."""
+    """Generate the email body using a single LLM call.
+
+    With a ``policy``, the LLM call is rate limited, bounded by its timeout
+    and retried (including on ``ComplianceError``) as the policy dictates.
+    """
     if llm is None:
         raise ValueError("llm callable is required to generate the email")
 
@@ -72,22 +131,149 @@ def generate_email(
         days_since_last_exam=days_since_last_exam,
         program_name=program_name,
     )
-    response = llm(prompt).strip()
-    if validator is not None:
-        validator(response)
-    return response
+    llm = instrumentation.timed_llm(llm)
+    if policy is not None:
+        return policy.call(llm, prompt, lambda response: _finalize_response(response, validator))
+    return _finalize_response(llm(prompt), validator)
+
+
+async def agenerate_email(
+    patient_name: str,
+    package: str,
+    recency_type: str,
+    days_since_last_exam: int,
+    llm: Callable[[str], Union[str, Awaitable[str]]],
+    program_name: str = "Programa Preventivo de Minimed",
+    validator: Callable[[str], None] | None = validate_output,
+    policy: RetryPolicy | None = None,
+) -> str:
+    """Async variant of :func:`generate_email`.
+
+    ``llm`` may be a coroutine function or a plain blocking callable; blocking
+    callables are run in the default executor so the event loop stays free.
+    """
+    if llm is None:
+        raise ValueError("llm callable is required to generate the email")
+
+    prompt = build_prompt(
+        patient_name=patient_name,
+        package=package,
+        recency_type=recency_type,
+        days_since_last_exam=days_since_last_exam,
+        program_name=program_name,
+    )
+    llm = instrumentation.timed_llm(llm)
+    if policy is not None:
+        return await policy.acall(
+            llm, prompt, lambda response: _finalize_response(response, validator)
+        )
+    return _finalize_response(await ainvoke_llm(llm, prompt), validator)
+
+
+def generate_email_streaming(
+    patient_name: str,
+    package: str,
+    recency_type: str,
+    days_since_last_exam: int,
+    llm_stream: Callable[[str], Iterable[str]],
+    program_name: str = "Programa Preventivo de Minimed",
+    validator: Callable[[str], None] | None = validate_output,
+    policy: RetryPolicy | None = None,
+    scanner: ComplianceScanner | None = None,
+) -> str:
+    """Generate the email body from a streamed LLM response.
+
+    ``llm_stream`` returns an iterator of text chunks. Chunks are checked as
+    they arrive, and the stream is closed as soon as a violation is certain,
+    so a failing response does not cost its remaining generation time and
+    tokens. The complete body still goes through ``validator``.
+    """
+    if llm_stream is None:
+        raise ValueError("llm_stream callable is required to generate the email")
+
+    prompt = build_prompt(
+        patient_name=patient_name,
+        package=package,
+        recency_type=recency_type,
+        days_since_last_exam=days_since_last_exam,
+        program_name=program_name,
+    )
+    active_scanner = scanner or get_scanner()
+
+    @instrumentation.timed_llm
+    def consume(prompt_text: str) -> str:
+        scan = active_scanner.stream()
+        chunks = llm_stream(prompt_text)
+        try:
+            for chunk in chunks:
+                if scan.feed(chunk):
+                    raise_violations(scan.violations)
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+        return scan.text
+
+    if policy is not None:
+        return policy.call(consume, prompt, lambda response: _finalize_response(response, validator))
+    return _finalize_response(consume(prompt), validator)
 
 
 def build_recency_message(recency_type: str, days_since_last_exam: int) -> str:
     """Return a brief narrative line based on recency."""
+    return RECENCY_MESSAGES[recency_bucket(recency_type, days_since_last_exam)]
+
+
+def recency_bucket(recency_type: str, days_since_last_exam: int) -> str:
+    """Return the RECENCY_MESSAGES key for the given recency inputs."""
     normalized_recency = _normalize_recency(recency_type)
     if normalized_recency == "PRIMER_EXAMEN":
-        return RECENCY_MESSAGES["PRIMER_EXAMEN"]
+        return "PRIMER_EXAMEN"
     if days_since_last_exam > 365:
-        return RECENCY_MESSAGES["HISTORICO_LARGO"]
+        return "HISTORICO_LARGO"
     if days_since_last_exam > 90:
-        return RECENCY_MESSAGES["HISTORICO_MEDIO"]
-    return RECENCY_MESSAGES["HISTORICO_RECIENTE"]
+        return "HISTORICO_MEDIO"
+    return "HISTORICO_RECIENTE"
+
+
+@lru_cache(maxsize=64)
+def _compile_prompt(
+    prompt_contract: str,
+    anchor_template: str,
+    package: str,
+    recency_bucket: str,
+    program_name: str,
+) -> SlotTemplate:
+    recency_type = "PRIMER_EXAMEN" if recency_bucket == "PRIMER_EXAMEN" else "HISTORICO"
+    anchor_example = SlotTemplate.parse(
+        anchor_template, ("patient_name", "recency_message")
+    ).bind(recency_message=RECENCY_MESSAGES[recency_bucket])
+
+    return (
+        SlotTemplate(
+            [
+                f"{prompt_contract}\n\n",
+                "INPUTS PARA LA GENERACIÓN\n",
+                "- patient_name: ",
+                Slot("patient_name"),
+                f"\n- recency_type: {recency_type}\n",
+                "- days_since_last_exam: ",
+                Slot("days_since_last_exam"),
+                f"\n- package: {package}\n",
+                f"- program_name: {program_name}\n\n",
+                "EJEMPLO DE ESTILO POR PAQUETE (NO COPIAR LITERAL)\n",
+            ]
+        )
+        + anchor_example
+        + SlotTemplate(["\n\nRESPUESTA:\n"])
+    )
+
+
+def _finalize_response(response: str, validator: Callable[[str], None] | None) -> str:
+    body = response.strip()
+    if validator is not None:
+        validator(body)
+    return body
 
 
 def _normalize_package(package: str) -> str:
@@ -114,5 +300,4 @@ def _load_package_template(package: str) -> str:
 
 
 def _read_text(relative_path: str) -> str:
-    repo_root = Path(__file__).resolve().parents[1]
-    return (repo_root / relative_path).read_text(encoding="utf-8").strip()
+    return read_text(relative_path)
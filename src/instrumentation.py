@@ -0,0 +1,238 @@
+"""Per-stage instrumentation with a no-op default.
+
+Hook sites in the decision engine, generator, compliance and retry modules
+read ``instrumentation.metrics`` and do nothing else while it is the
+default `NullMetrics`. Installing a `Metrics` registry with `enable()`
+records timing spans, counters and histograms, which can be exported in
+the Prometheus text format or as JSON.
+
+Recorded series (all prefixed with ``minimed_`` on export):
+    stage_duration_seconds{stage}: decision, prompt, llm, validation spans.
+    packages_assigned_total{package}
+    prompt_chars / response_chars: size histograms per call.
+    prompt_chars_total / prompt_tokens_estimate_total: the latter is
+        characters / 4, a rough token count for cost tracking.
+    compliance_violations_total{category}: categories from `_collect_violations`.
+    emails_rejected_total
+    llm_retries_total{reason}
+"""
+from __future__ import annotations
+
+import bisect
+import inspect
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, ContextManager, Iterator, Mapping, Optional, Sequence, Union
+
+PREFIX = "minimed_"
+TIME_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000)
+HISTOGRAM_BUCKETS: dict[str, Sequence[float]] = {
+    "prompt_chars": SIZE_BUCKETS,
+    "response_chars": SIZE_BUCKETS,
+}
+
+LabelKey = tuple[str, tuple[tuple[str, str], ...]]
+
+
+class NullMetrics:
+    """Default recorder: every hook is a no-op."""
+
+    enabled = False
+    _null_span = nullcontext()
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        pass
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        pass
+
+    def span(self, stage: str) -> ContextManager[None]:
+        return self._null_span
+
+
+class _Histogram:
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds: Sequence[float]) -> None:
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        running = 0
+        rows: list[tuple[str, int]] = []
+        for bound, count in zip((*self.bounds, float("inf")), self.counts):
+            running += count
+            rows.append(("+Inf" if bound == float("inf") else _number(bound), running))
+        return rows
+
+
+class Metrics(NullMetrics):
+    """Thread-safe in-memory registry of counters and histograms."""
+
+    enabled = True
+
+    def __init__(self) -> None:
+        self._counters: dict[LabelKey, float] = {}
+        self._histograms: dict[LabelKey, _Histogram] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = _Histogram(HISTOGRAM_BUCKETS.get(name, TIME_BUCKETS))
+                self._histograms[key] = histogram
+            histogram.add(value)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_duration_seconds", time.perf_counter() - started, stage=stage)
+
+    def counter(self, name: str, **labels: str) -> float:
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0.0)
+
+    def to_prometheus(self) -> str:
+        """Render every series in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            lines: list[str] = []
+            declared: set[str] = set()
+            for (name, labels), value in counters:
+                metric = PREFIX + name
+                if metric not in declared:
+                    lines.append(f"# TYPE {metric} counter")
+                    declared.add(metric)
+                lines.append(f"{metric}{_labels(labels)} {_number(value)}")
+            for (name, labels), histogram in histograms:
+                metric = PREFIX + name
+                if metric not in declared:
+                    lines.append(f"# TYPE {metric} histogram")
+                    declared.add(metric)
+                for bound, count in histogram.cumulative():
+                    lines.append(f"{metric}_bucket{_labels(labels, le=bound)} {count}")
+                lines.append(f"{metric}_sum{_labels(labels)} {_number(histogram.total)}")
+                lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self._counters.items())
+                ],
+                "histograms": [
+                    {
+                        "name": name,
+                        "labels": dict(labels),
+                        "buckets": dict(histogram.cumulative()),
+                        "sum": histogram.total,
+                        "count": histogram.count,
+                    }
+                    for (name, labels), histogram in sorted(
+                        self._histograms.items(), key=lambda item: item[0]
+                    )
+                ],
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+
+
+metrics: Union[NullMetrics, Metrics] = NullMetrics()
+
+
+def enable(registry: Optional[Metrics] = None) -> Metrics:
+    """Install ``registry`` (or a fresh one) as the active recorder."""
+    global metrics
+    metrics = registry if registry is not None else Metrics()
+    return metrics
+
+
+def disable() -> None:
+    """Restore the no-op recorder."""
+    global metrics
+    metrics = NullMetrics()
+
+
+def record_prompt(prompt: str) -> None:
+    """Record the size of a rendered prompt."""
+    metrics.observe("prompt_chars", len(prompt))
+    metrics.inc("prompt_chars_total", len(prompt))
+    metrics.inc("prompt_tokens_estimate_total", len(prompt) // 4)
+
+
+def timed_llm(llm: Callable[[str], Any]) -> Callable[[str], Any]:
+    """Wrap ``llm`` so each call records the ``llm`` span and the response size.
+
+    Returns ``llm`` itself while instrumentation is disabled. Coroutine
+    functions get an async wrapper so callers can still await them.
+    """
+    if not metrics.enabled:
+        return llm
+    active = metrics
+
+    if inspect.iscoroutinefunction(llm):
+
+        async def timed_async(prompt: str) -> Any:
+            with active.span("llm"):
+                response = await llm(prompt)
+            active.observe("response_chars", len(response))
+            return response
+
+        return timed_async
+
+    def timed(prompt: str) -> Any:
+        with active.span("llm"):
+            response = llm(prompt)
+        if isinstance(response, str):
+            active.observe("response_chars", len(response))
+        return response
+
+    return timed
+
+
+def record_violations(violations: Sequence[str]) -> None:
+    """Count formatted violations by the category before their first colon."""
+    if not metrics.enabled:
+        return
+    metrics.inc("emails_rejected_total")
+    for violation in violations:
+        metrics.inc("compliance_violations_total", category=violation.split(":", 1)[0])
+
+
+def _labels(labels: tuple[tuple[str, str], ...], **extra: str) -> str:
+    items: Mapping[str, str] = {**dict(labels), **extra}
+    if not items:
+        return ""
+    rendered = ",".join(f'{key}="{_escape(str(value))}"' for key, value in items.items())
+    return "{" + rendered + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
@@ -0,0 +1,116 @@
+"""Checkpoint journal that makes campaign runs resumable.
+
+Every finished patient is stored under its ``patient_id`` together with a
+fingerprint of the input payload and of the prompt/template/static content.
+A restarted run reuses stored emails whose fingerprint still matches and only
+regenerates failed, new or changed patients. Writes go to an SQLite file in
+WAL mode and are committed in batches, so checkpointing stays off the
+per-email hot path.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Mapping, Optional, Union
+
+from .content import read_text
+
+VERSIONED_ASSETS = (
+    "prompts/email_prompt_v1.txt",
+    "templates/standard.txt",
+    "templates/silver.txt",
+    "templates/gold.txt",
+    "static/disclaimer.txt",
+    "static/signature.txt",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    patient_id TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    status TEXT NOT NULL,
+    record TEXT NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+def content_version() -> str:
+    """Hash of every asset that shapes the prompt or the final email."""
+    digest = hashlib.sha256()
+    for relative_path in VERSIONED_ASSETS:
+        digest.update(relative_path.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(read_text(relative_path).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def payload_fingerprint(payload: Mapping[str, Any], version: str) -> str:
+    """Stable hash of a payload plus the content version it was generated with."""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(f"{version}\n{canonical}".encode("utf-8")).hexdigest()
+
+
+class RunJournal:
+    """SQLite-backed journal of finished patients.
+
+    Use it from a single thread; the pipeline only touches it from the thread
+    that writes the output.
+    """
+
+    def __init__(self, path: Union[str, Path], *, batch_size: int = 200) -> None:
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self._pending: list[tuple[str, str, str, str, float]] = []
+        self._connection = sqlite3.connect(str(self.path))
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(_SCHEMA)
+        self._connection.commit()
+
+    def lookup(self, patient_id: str, fingerprint: str) -> Optional[dict[str, Any]]:
+        """Return the stored record if the patient already has a valid email."""
+        row = self._connection.execute(
+            "SELECT record FROM entries WHERE patient_id = ? AND fingerprint = ? AND status = 'ok'",
+            (patient_id, fingerprint),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def record(self, patient_id: str, fingerprint: str, record: Mapping[str, Any]) -> None:
+        """Queue a finished patient; committed with the next batch."""
+        self._pending.append(
+            (
+                patient_id,
+                fingerprint,
+                str(record.get("status", "error")),
+                json.dumps(record, ensure_ascii=False),
+                time.time(),
+            )
+        )
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO entries (patient_id, fingerprint, status, record, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                self._pending,
+            )
+        self._pending.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self._connection.close()
+
+    def __enter__(self) -> "RunJournal":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
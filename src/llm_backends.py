@@ -0,0 +1,230 @@
+"""Pluggable LLM backends: the OpenAI client and a deterministic local fake.
+
+Every backend is a plain ``prompt -> str`` callable, which is all
+`generate_email` and the batch/pipeline layers need, plus a ``stream``
+method yielding text chunks for `generate_email_streaming`.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, Optional, Protocol
+
+DEFAULT_MODEL = "gpt-4.1-mini"
+
+
+class LLMBackend(Protocol):
+    """Interface shared by all LLM backends."""
+
+    def __call__(self, prompt: str) -> str: ...
+
+    def stream(self, prompt: str) -> Iterator[str]: ...
+
+
+def load_api_key(path: str) -> str:
+    """Read an API key from a one-line ``NAME=value`` file."""
+    with open(path, "r", encoding="utf-8") as f:
+        line = f.read().strip()
+    return line.split("=", 1)[1].strip()
+
+
+class OpenAIBackend:
+    """OpenAI Responses API backend; the SDK is imported on first use."""
+
+    def __init__(
+        self,
+        *,
+        api_key: Optional[str] = None,
+        model: str = DEFAULT_MODEL,
+        client: Any = None,
+    ) -> None:
+        self.api_key = api_key
+        self.model = model
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> Any:
+        with self._lock:
+            if self._client is None:
+                from openai import OpenAI
+
+                self._client = OpenAI(api_key=self.api_key)
+            return self._client
+
+    def __call__(self, prompt: str) -> str:
+        response = self.client.responses.create(model=self.model, input=prompt)
+        return response.output_text
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        events = self.client.responses.create(model=self.model, input=prompt, stream=True)
+        try:
+            for event in events:
+                if getattr(event, "type", "") == "response.output_text.delta":
+                    yield event.delta
+        finally:
+            close = getattr(events, "close", None)
+            if close is not None:
+                close()
+
+
+@dataclass(frozen=True)
+class LatencyModel:
+    """Latency distribution for `FakeLLM`, in seconds.
+
+    ``kind`` is ``fixed`` (always ``median``), ``uniform`` (between
+    ``minimum`` and ``maximum``) or ``lognormal`` (``median`` with shape
+    ``sigma``, clipped to ``[minimum, maximum]``).
+    """
+
+    kind: str = "fixed"
+    median: float = 0.0
+    sigma: float = 0.5
+    minimum: float = 0.0
+    maximum: float = 60.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.median
+        if self.kind == "uniform":
+            return rng.uniform(self.minimum, self.maximum)
+        if self.kind == "lognormal":
+            if self.median <= 0:
+                return self.minimum
+            value = rng.lognormvariate(math.log(self.median), self.sigma)
+            return min(self.maximum, max(self.minimum, value))
+        raise ValueError(f"Unknown latency kind: {self.kind}")
+
+
+_MOTIVATION_LINES = (
+    "Cada paso cuenta, y avanzar con calma y a su propio ritmo es una forma accesible de cuidar su bienestar "
+    "con tranquilidad y confianza.",
+    "Nuestro deseo es que cuente con un acompañamiento sencillo y alcanzable, pensado para que se sienta "
+    "tranquilo y respaldado en cada etapa.",
+    "Sabemos que cuidarse puede ser más simple cuando se cuenta con apoyo cercano, por eso buscamos que este "
+    "proceso sea amable, claro y llevadero.",
+)
+_VIOLATION_LINES = (
+    "Es urgente que revise sus resultados con nuestro equipo lo antes posible.",
+    "Sus valores de glucosa muestran que es importante actuar de inmediato.",
+    "Dado que usted tiene diabetes, le recomendamos integrarse al programa.",
+)
+_NAME_LINE = re.compile(r"^- patient_name: (.*)$", re.MULTILINE)
+_EXAMPLE_HEADER = "EJEMPLO DE ESTILO POR PAQUETE (NO COPIAR LITERAL)\n"
+_ANSWER_HEADER = "\n\nRESPUESTA:"
+_BATCH_HEADER = "PACIENTES DEL LOTE (JSON)\n"
+# Prompts whose attempt count FakeLLM remembers; retries come soon after the first call.
+_MAX_TRACKED_PROMPTS = 4096
+
+
+class FakeLLM:
+    """Deterministic offline stand-in for a real LLM.
+
+    Replies are built from the anchor example embedded in the prompt plus a
+    motivational block, which yields the 7-block, 120-220 word shape of a
+    compliant email. Latency, transient errors (``ConnectionError``) and
+    compliance violations are injected at the configured rates. Batched
+    prompts from `multi_prompt` get a JSON reply with one body per patient,
+    each drawn separately for violations. Output only depends on ``seed``,
+    the prompt and how many times that prompt was seen, so runs are
+    reproducible regardless of concurrency while retries still get a fresh
+    draw. Attempt counts are kept for the most recent ``max_tracked_prompts``
+    prompts, so memory stays flat over long load tests.
+    """
+
+    def __init__(
+        self,
+        *,
+        latency: LatencyModel = LatencyModel(),
+        error_rate: float = 0.0,
+        violation_rate: float = 0.0,
+        seed: int = 0,
+        chunk_words: int = 4,
+        sleep: Callable[[float], None] = time.sleep,
+        max_tracked_prompts: int = _MAX_TRACKED_PROMPTS,
+    ) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.violation_rate = violation_rate
+        self.seed = seed
+        self.chunk_words = chunk_words
+        self._sleep = sleep
+        self.max_tracked_prompts = max_tracked_prompts
+        self._attempts: OrderedDict[bytes, int] = OrderedDict()
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def __call__(self, prompt: str) -> str:
+        rng = self._rng(prompt)
+        self._sleep(self.latency.sample(rng))
+        return self._reply(prompt, rng)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        rng = self._rng(prompt)
+        text = self._reply(prompt, rng)
+        words = text.split(" ")
+        chunks = [
+            " ".join(words[index : index + self.chunk_words])
+            for index in range(0, len(words), self.chunk_words)
+        ]
+        delay = self.latency.sample(rng) / max(1, len(chunks))
+        for index, chunk in enumerate(chunks):
+            self._sleep(delay)
+            yield chunk if index == 0 else " " + chunk
+
+    def _rng(self, prompt: str) -> random.Random:
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        with self._lock:
+            self.calls += 1
+            attempt = self._attempts.pop(digest, 0)
+            self._attempts[digest] = attempt + 1
+            if len(self._attempts) > self.max_tracked_prompts:
+                self._attempts.popitem(last=False)
+        return random.Random(f"{self.seed}:{digest.hex()}:{attempt}")
+
+    def _reply(self, prompt: str, rng: random.Random) -> str:
+        if rng.random() < self.error_rate:
+            raise ConnectionError("fake LLM transient error")
+
+        if _BATCH_HEADER in prompt:
+            return self._batch_reply(prompt, rng)
+        return self._body(_anchor_blocks(prompt), rng)
+
+    def _body(self, blocks: list[str], rng: random.Random) -> str:
+        line = rng.choice(_MOTIVATION_LINES)
+        if rng.random() < self.violation_rate:
+            line = rng.choice(_VIOLATION_LINES)
+        blocks.insert(max(0, len(blocks) - 2), line)
+        return "\n\n".join(blocks)
+
+    def _batch_reply(self, prompt: str, rng: random.Random) -> str:
+        start = prompt.index(_BATCH_HEADER) + len(_BATCH_HEADER)
+        patients = json.loads(prompt[start : prompt.index("\n\n", start)])
+        emails = []
+        for patient in patients:
+            blocks = [
+                block.replace("{{patient_name}}", patient["patient_name"]).replace(
+                    "{{recency_message}}", patient["recency_message"]
+                )
+                for block in _anchor_blocks(prompt)
+            ]
+            emails.append({"key": patient["key"], "email_body": self._body(blocks, rng)})
+        return json.dumps({"emails": emails}, ensure_ascii=False)
+
+
+def _anchor_blocks(prompt: str) -> list[str]:
+    start = prompt.rfind(_EXAMPLE_HEADER)
+    end = prompt.rfind(_ANSWER_HEADER)
+    if start == -1 or end == -1:
+        names = _NAME_LINE.findall(prompt)
+        name = names[-1] if names else "estimado paciente"
+        return [f"Hola {name}, esperamos que se encuentre muy bien.", "Quedamos atentos a su respuesta."]
+    example = prompt[start + len(_EXAMPLE_HEADER) : end]
+    return [block.strip() for block in example.split("\n\n") if block.strip()]
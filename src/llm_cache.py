@@ -0,0 +1,232 @@
+"""Opt-in, content-addressed cache of LLM responses.
+
+Responses are keyed by a hash of the model name and the exact prompt, so
+re-runs and dry-runs that send byte-identical prompts skip the LLM.
+`CachedLLM` validates every response it hands out, cached or fresh: fresh
+responses are stored only when they pass, and cached ones that no longer
+pass the compliance rules are dropped and regenerated.
+"""
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Union
+
+from .compliance import ComplianceError, validate_output
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,
+        response TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at)",
+    """
+    CREATE TABLE IF NOT EXISTS totals (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        entries INTEGER NOT NULL,
+        bytes INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS responses_insert AFTER INSERT ON responses BEGIN
+        UPDATE totals SET entries = entries + 1, bytes = bytes + LENGTH(CAST(NEW.response AS BLOB));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS responses_delete AFTER DELETE ON responses BEGIN
+        UPDATE totals SET entries = entries - 1, bytes = bytes - LENGTH(CAST(OLD.response AS BLOB));
+    END
+    """,
+)
+
+def cache_key(prompt: str, model: str) -> str:
+    """Content address of a prompt for a given model."""
+    return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    """Hit/miss counters for a `CachedLLM`.
+
+    ``hits`` are cached responses that passed validation again, ``rejected``
+    cached responses that no longer did and were dropped.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    rejected: int = 0
+
+
+class SQLiteResponseCache:
+    """Disk-backed response store with count-, size- and age-based eviction.
+
+    Entry and byte totals are kept by triggers inside the database, so they
+    stay exact when several processes or shards share the file. Safe to
+    share between the threads of a batch run.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        *,
+        max_entries: int = 100_000,
+        max_bytes: Optional[int] = 512 * 1024 * 1024,
+        max_age: Optional[float] = 30 * 24 * 3600,
+    ) -> None:
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            str(self.path), check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA busy_timeout=5000")
+        with self._transaction():
+            for statement in _SCHEMA:
+                self._connection.execute(statement)
+            self._connection.execute(
+                "INSERT OR IGNORE INTO totals (id, entries, bytes) "
+                "SELECT 0, COUNT(*), COALESCE(SUM(LENGTH(CAST(response AS BLOB))), 0) FROM responses"
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.max_age is not None and time.time() - row[1] > self.max_age:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        with self._lock, self._transaction():
+            self._connection.execute(
+                "INSERT OR IGNORE INTO responses (key, response, created_at) VALUES (?, ?, ?)",
+                (key, response, time.time()),
+            )
+            entries, size = self._totals()
+            if entries > self.max_entries or (self.max_bytes is not None and size > self.max_bytes):
+                self._evict(entries, size)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._totals()[0]
+
+    @property
+    def size_bytes(self) -> int:
+        """UTF-8 bytes of every stored response."""
+        with self._lock:
+            return self._totals()[1]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+        self._connection.execute("COMMIT")
+
+    def _totals(self) -> tuple[int, int]:
+        return self._connection.execute("SELECT entries, bytes FROM totals").fetchone()
+
+    def _evict(self, entries: int, size: int) -> None:
+        if self.max_age is not None:
+            self._connection.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self.max_age,)
+            )
+            entries, size = self._totals()
+        # Evict down to 90% of each limit so eviction is not paid on every put.
+        entry_target = self.max_entries - self.max_entries // 10
+        byte_target = None if self.max_bytes is None else self.max_bytes - self.max_bytes // 10
+        if entries <= self.max_entries and (byte_target is None or size <= self.max_bytes):
+            return
+        freed_entries = freed_bytes = 0
+        victims: list[str] = []
+        oldest = self._connection.execute(
+            "SELECT key, LENGTH(CAST(response AS BLOB)) FROM responses ORDER BY created_at, rowid"
+        )
+        for key, length in oldest:
+            if entries - freed_entries <= entry_target and (
+                byte_target is None or size - freed_bytes <= byte_target
+            ):
+                break
+            victims.append(key)
+            freed_entries += 1
+            freed_bytes += length
+        oldest.close()
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", [(k,) for k in victims])
+
+
+class CachedLLM:
+    """Wrap an LLM callable with a response cache; a drop-in ``llm`` callable.
+
+    Every response goes through ``validator`` before it leaves the wrapper.
+    A fresh response is stored only when it passes; a failing one is still
+    returned, unstored, so the caller's own validation and retries handle
+    it. A cached response that no longer passes the current rules is
+    dropped and the prompt goes to the LLM instead.
+    """
+
+    def __init__(
+        self,
+        llm: Callable[[str], str],
+        cache: SQLiteResponseCache,
+        *,
+        model: str,
+        validator: Callable[[str], None] = validate_output,
+    ) -> None:
+        self.llm = llm
+        self.cache = cache
+        self.model = model
+        self.validator = validator
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+
+    def __call__(self, prompt: str) -> str:
+        key = cache_key(prompt, self.model)
+        cached = self.cache.get(key)
+        if cached is not None:
+            if self._passes(cached):
+                self._count("hits")
+                return cached
+            self.cache.delete(key)
+            self._count("rejected")
+        self._count("misses")
+        response = self.llm(prompt)
+        if self._passes(response):
+            self.cache.put(key, response)
+        return response
+
+    def _passes(self, response: str) -> bool:
+        try:
+            self.validator(response.strip())
+        except ComplianceError:
+            return False
+        return True
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self.stats, counter, getattr(self.stats, counter) + 1)
@@ -0,0 +1,218 @@
+"""Offline load test of the campaign pipeline against `FakeLLM`.
+
+Runs synthetic payloads through decision -> prompt -> LLM -> validation ->
+assembly with a bounded number of LLM calls in flight and reports
+throughput plus p50/p95/p99 latency per stage. Payloads go through the same
+entry points as the pipeline, `contract.to_decision_input` and
+`generator.generate_email`; the prompt, LLM and validation stages are timed
+from inside `generate_email` through the LLM and validator it is given. No
+network access needed.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterable, Optional
+
+from .batch import map_in_order
+from .compliance import ComplianceError, validate_output
+from .contract import ContractError, to_decision_input
+from .decision_engine import assign_package
+from .generator import generate_email
+from .llm_backends import FakeLLM, LatencyModel
+from .static_content import assemble_full_email
+from .synthetic import synthetic_payloads
+
+STAGES = ("decision", "prompt", "llm", "validation", "assembly")
+
+
+@dataclass
+class LoadTestReport:
+    """Aggregated outcome of a load-test run."""
+
+    patients: int = 0
+    ok: int = 0
+    contract_errors: int = 0
+    llm_errors: int = 0
+    compliance_errors: int = 0
+    elapsed: float = 0.0
+    stage_seconds: dict[str, list[float]] = field(
+        default_factory=lambda: {stage: [] for stage in STAGES}
+    )
+
+    @property
+    def throughput(self) -> float:
+        return self.patients / self.elapsed if self.elapsed else 0.0
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "patients": self.patients,
+            "ok": self.ok,
+            "contract_errors": self.contract_errors,
+            "llm_errors": self.llm_errors,
+            "compliance_errors": self.compliance_errors,
+            "elapsed_s": round(self.elapsed, 4),
+            "throughput_per_s": round(self.throughput, 2),
+            "stages_ms": {
+                stage: _latency_summary(values) for stage, values in self.stage_seconds.items()
+            },
+        }
+
+
+def run_load_test(
+    payloads: Iterable[dict[str, Any]],
+    llm: Callable[[str], str],
+    *,
+    max_in_flight: int = 32,
+) -> LoadTestReport:
+    """Run every payload through the pipeline stages and time each one."""
+    report = LoadTestReport()
+
+    def run(payload: dict[str, Any]) -> tuple[str, dict[str, float]]:
+        timings: dict[str, float] = {}
+        started = time.perf_counter()
+        try:
+            package = assign_package(to_decision_input(payload))
+        except ContractError:
+            timings["decision"] = _lap(started)
+            return "contract_error", timings
+        timings["decision"] = _lap(started)
+
+        # Prompt start, LLM start, LLM end and validation end, as generate_email reaches them.
+        marks = [time.perf_counter()]
+
+        def timed_llm(prompt: str) -> str:
+            marks.append(time.perf_counter())
+            try:
+                return llm(prompt)
+            finally:
+                marks.append(time.perf_counter())
+
+        def timed_validation(text: str) -> None:
+            try:
+                validate_output(text)
+            finally:
+                marks.append(time.perf_counter())
+
+        temporal = payload["temporal"]
+        outcome = "ok"
+        try:
+            body = generate_email(
+                patient_name=payload["patient"]["patient_name"],
+                package=package,
+                recency_type=temporal["recency_type"],
+                days_since_last_exam=temporal["days_since_last_exam"],
+                llm=timed_llm,
+                validator=timed_validation,
+            )
+        except ConnectionError:
+            outcome = "llm_error"
+        except ComplianceError:
+            outcome = "compliance_error"
+        for stage, begin, end in zip(("prompt", "llm", "validation"), marks, marks[1:]):
+            timings[stage] = end - begin
+        if outcome != "ok":
+            return outcome, timings
+
+        started = time.perf_counter()
+        assemble_full_email(body)
+        timings["assembly"] = _lap(started)
+        return "ok", timings
+
+    started = time.perf_counter()
+    for outcome, timings in map_in_order(run, payloads, max_in_flight=max_in_flight):
+        report.patients += 1
+        if outcome == "ok":
+            report.ok += 1
+        elif outcome == "contract_error":
+            report.contract_errors += 1
+        elif outcome == "llm_error":
+            report.llm_errors += 1
+        else:
+            report.compliance_errors += 1
+        for stage, seconds in timings.items():
+            report.stage_seconds[stage].append(seconds)
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, min(len(sorted_values), math.ceil(fraction * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    parser.add_argument("--latency", choices=("fixed", "uniform", "lognormal"), default="lognormal")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="median/fixed LLM latency")
+    parser.add_argument("--latency-max-ms", type=float, default=2000.0)
+    parser.add_argument("--sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--violation-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    llm = FakeLLM(
+        latency=LatencyModel(
+            kind=args.latency,
+            median=args.latency_ms / 1000.0,
+            sigma=args.sigma,
+            maximum=args.latency_max_ms / 1000.0,
+        ),
+        error_rate=args.error_rate,
+        violation_rate=args.violation_rate,
+        seed=args.seed,
+    )
+    report = run_load_test(
+        synthetic_payloads(args.patients, seed=args.seed),
+        llm,
+        max_in_flight=args.max_in_flight,
+    )
+    summary = report.summary()
+    if args.json:
+        json.dump(summary, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return 0
+
+    print(
+        f"pacientes={summary['patients']} ok={summary['ok']} "
+        f"errores_contrato={summary['contract_errors']} errores_llm={summary['llm_errors']} errores_cumplimiento={summary['compliance_errors']}"
+    )
+    print(f"tiempo={summary['elapsed_s']}s throughput={summary['throughput_per_s']}/s")
+    print(f"{'etapa':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'media ms':>10}")
+    for stage, stats in summary["stages_ms"].items():
+        print(
+            f"{stage:<12}{stats['p50']:>10.3f}{stats['p95']:>10.3f}"
+            f"{stats['p99']:>10.3f}{stats['mean']:>10.3f}"
+        )
+    return 0
+
+
+def _lap(started: float) -> float:
+    return time.perf_counter() - started
+
+
+def _latency_summary(values: list[float]) -> dict[str, float]:
+    ordered = sorted(values)
+    mean = sum(ordered) / len(ordered) if ordered else 0.0
+    return {
+        "count": len(ordered),
+        "p50": round(percentile(ordered, 0.50) * 1000, 4),
+        "p95": round(percentile(ordered, 0.95) * 1000, 4),
+        "p99": round(percentile(ordered, 0.99) * 1000, 4),
+        "mean": round(mean * 1000, 4),
+    }
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
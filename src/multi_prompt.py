@@ -0,0 +1,276 @@
+"""Batched generation: several patients of one package per LLM request.
+
+The prompt contract and package anchor are sent once per batch instead of
+once per patient, and the model answers with a JSON object holding one
+``email_body`` per patient key. Every body is validated on its own and
+must name its own patient and no other patient of the batch, so bodies the
+model swapped between keys are not delivered. Only patients whose body is
+missing, misassigned or rejected fall back to single-patient
+`generate_email`.
+
+Patients are keyed ``p1``..``pN`` within a batch, so no ``patient_id`` ever
+reaches the model.
+"""
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Iterable, Mapping, Optional, Sequence
+
+from . import instrumentation
+from .batch import EmailResult, _email_kwargs, map_in_order, patient_errors
+from .compliance import validate_output
+from .generator import (
+    RECENCY_MESSAGES,
+    _finalize_response,
+    _load_package_template,
+    _load_prompt_contract,
+    _normalize_package,
+    generate_email,
+    recency_bucket,
+)
+from .retry import RetryPolicy
+
+BATCH_HEADER = "PACIENTES DEL LOTE (JSON)\n"
+EXAMPLE_HEADER = "EJEMPLO DE ESTILO POR PAQUETE (NO COPIAR LITERAL)\n"
+ANSWER_HEADER = "\n\nRESPUESTA:\n"
+
+_BATCH_INSTRUCTIONS = (
+    "MODO LOTE\n"
+    "Genera un correo independiente para cada paciente de la lista. Cada cuerpo debe cumplir por sí "
+    "solo todas las reglas anteriores; no mezcles datos entre pacientes. Usa el recency_message de "
+    "cada paciente en lugar de {{recency_message}}.\n"
+    "Devuelve solo un objeto JSON, sin texto adicional, con esta forma:\n"
+    '{"emails": [{"key": "<key del paciente>", "email_body": "<cuerpo con los 7 bloques separados '
+    'por una línea en blanco>"}]}\n\n'
+)
+
+
+@dataclass
+class BatchStats:
+    """Counters for one `generate_emails_batched` run."""
+
+    batches: int = 0
+    batched_ok: int = 0
+    fallbacks: int = 0
+    failed: int = 0
+    prompt_chars: int = 0
+
+    def merge(self, other: "BatchStats") -> None:
+        self.batches += other.batches
+        self.batched_ok += other.batched_ok
+        self.fallbacks += other.fallbacks
+        self.failed += other.failed
+        self.prompt_chars += other.prompt_chars
+
+
+@dataclass(frozen=True)
+class _Entry:
+    index: int
+    key: str
+    kwargs: dict[str, Any]
+
+
+def build_batch_prompt(
+    patients: Sequence[Mapping[str, Any]],
+    package: str,
+    program_name: str = "Programa Preventivo de Minimed",
+) -> str:
+    """Build one prompt for ``patients``, all sharing ``package``.
+
+    Each patient mapping holds ``key``, ``patient_name``, ``recency_type``
+    and ``days_since_last_exam``; its recency message is added here.
+    """
+    normalized_package = _normalize_package(package)
+    listed = [
+        {
+            "key": patient["key"],
+            "patient_name": patient["patient_name"],
+            "recency_type": patient["recency_type"].strip().upper(),
+            "days_since_last_exam": patient["days_since_last_exam"],
+            "recency_message": RECENCY_MESSAGES[
+                recency_bucket(patient["recency_type"], patient["days_since_last_exam"])
+            ],
+        }
+        for patient in patients
+    ]
+    head, tail = _batch_frame(
+        _load_prompt_contract(),
+        _load_package_template(normalized_package),
+        normalized_package,
+        program_name,
+    )
+    return head + json.dumps(listed, ensure_ascii=False, indent=1) + tail
+
+
+def parse_batch_response(response: str) -> dict[str, str]:
+    """Map patient keys to the email bodies of a batched JSON response.
+
+    Surrounding Markdown code fences are tolerated; entries without a string
+    ``key`` and ``email_body`` are skipped.
+
+    Raises:
+        ValueError: When the response is not the expected JSON object.
+    """
+    text = response.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    data = json.loads(text)
+    if not isinstance(data, dict) or not isinstance(data.get("emails"), list):
+        raise ValueError("batched response must be an object with an 'emails' list")
+    bodies: dict[str, str] = {}
+    for entry in data["emails"]:
+        if not isinstance(entry, dict):
+            continue
+        key, body = entry.get("key"), entry.get("email_body")
+        if isinstance(key, str) and isinstance(body, str):
+            bodies[key] = body
+    return bodies
+
+
+def generate_emails_batched(
+    payloads: Iterable[Mapping[str, Any]],
+    llm: Callable[[str], str],
+    *,
+    batch_size: int = 10,
+    max_in_flight: int = 4,
+    validator: Callable[[str], None] | None = validate_output,
+    policy: Optional[RetryPolicy] = None,
+    fallback: bool = True,
+    stats: Optional[BatchStats] = None,
+) -> list[EmailResult]:
+    """Generate one email per payload with up to ``batch_size`` patients per request.
+
+    Payloads are the same mappings `batch.generate_emails` takes. They are
+    grouped by package and program name, and results keep the input order.
+    A body that is missing from the response or fails ``validator`` is
+    regenerated with `generate_email` when ``fallback`` is true, and
+    reported as an error otherwise.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    stats = stats if stats is not None else BatchStats()
+    errors = patient_errors(policy)
+    results: list[Optional[EmailResult]] = []
+    groups: dict[tuple[str, str], list[_Entry]] = {}
+
+    for index, payload in enumerate(payloads):
+        results.append(None)
+        try:
+            kwargs = _email_kwargs(payload)
+            kwargs["package"] = _normalize_package(kwargs["package"])
+            recency_bucket(kwargs["recency_type"], kwargs["days_since_last_exam"])
+        except ValueError as exc:
+            results[index] = EmailResult(index=index, error=exc)
+            stats.failed += 1
+            continue
+        group = groups.setdefault((kwargs["package"], kwargs["program_name"]), [])
+        group.append(_Entry(index=index, key=f"p{len(group) % batch_size + 1}", kwargs=kwargs))
+
+    chunks = [
+        entries[start : start + batch_size]
+        for entries in groups.values()
+        for start in range(0, len(entries), batch_size)
+    ]
+
+    def run(chunk: list[_Entry]) -> tuple[list[EmailResult], BatchStats]:
+        chunk_stats = BatchStats()
+        return _run_chunk(chunk, llm, validator, policy, fallback, errors, chunk_stats), chunk_stats
+
+    for chunk_results, chunk_stats in map_in_order(run, chunks, max_in_flight=max_in_flight):
+        for result in chunk_results:
+            results[result.index] = result
+        stats.merge(chunk_stats)
+    return [result for result in results if result is not None]
+
+
+def _run_chunk(
+    chunk: list[_Entry],
+    llm: Callable[[str], str],
+    validator: Callable[[str], None] | None,
+    policy: Optional[RetryPolicy],
+    fallback: bool,
+    errors: tuple[type[BaseException], ...],
+    stats: BatchStats,
+) -> list[EmailResult]:
+    first = chunk[0].kwargs
+    prompt = build_batch_prompt(
+        [{"key": entry.key, **entry.kwargs} for entry in chunk],
+        first["package"],
+        first["program_name"],
+    )
+    instrumentation.record_prompt(prompt)
+    timed = instrumentation.timed_llm(llm)
+    stats.batches += 1
+    stats.prompt_chars += len(prompt)
+    try:
+        response = policy.call(timed, prompt, str) if policy is not None else timed(prompt)
+        bodies = parse_batch_response(response)
+    except errors:
+        bodies = {}
+
+    results: list[EmailResult] = []
+    for entry in chunk:
+        body = bodies.get(entry.key)
+        if body is not None:
+            try:
+                _check_addressee(body, entry, chunk)
+                finalized = _finalize_response(body, validator)
+                results.append(EmailResult(index=entry.index, email_body=finalized))
+                stats.batched_ok += 1
+                continue
+            except ValueError as exc:
+                rejection: Exception = exc
+        else:
+            rejection = ValueError(f"batched response has no email for {entry.key}")
+        if not fallback:
+            results.append(EmailResult(index=entry.index, error=rejection))
+            stats.failed += 1
+            continue
+        stats.fallbacks += 1
+        try:
+            body = generate_email(**entry.kwargs, llm=llm, validator=validator, policy=policy)
+        except errors as exc:
+            results.append(EmailResult(index=entry.index, error=exc))
+            stats.failed += 1
+        else:
+            results.append(EmailResult(index=entry.index, email_body=body))
+    return results
+
+
+def _check_addressee(body: str, entry: _Entry, chunk: list[_Entry]) -> None:
+    """Reject a body that does not name ``entry``'s patient or names another one."""
+    own = entry.kwargs["patient_name"]
+    if not _names(body, own):
+        raise ValueError(f"batched email for {entry.key} does not name its patient")
+    for other in chunk:
+        name = other.kwargs["patient_name"]
+        if other is not entry and not _names(own, name) and _names(body, name):
+            raise ValueError(f"batched email for {entry.key} names another patient ({other.key})")
+
+
+def _names(text: str, name: str) -> bool:
+    pattern = rf"(?<!\w){re.escape(name.strip())}(?!\w)"
+    return re.search(pattern, text, re.IGNORECASE) is not None
+
+
+@lru_cache(maxsize=16)
+def _batch_frame(
+    prompt_contract: str,
+    anchor_template: str,
+    package: str,
+    program_name: str,
+) -> tuple[str, str]:
+    head = (
+        f"{prompt_contract}\n\n"
+        f"{_BATCH_INSTRUCTIONS}"
+        "INPUTS COMUNES\n"
+        f"- package: {package}\n"
+        f"- program_name: {program_name}\n\n"
+        f"{BATCH_HEADER}"
+    )
+    tail = f"\n\n{EXAMPLE_HEADER}{anchor_template}{ANSWER_HEADER}"
+    return head, tail
@@ -0,0 +1,403 @@
+"""Streaming JSONL campaign pipeline.
+
+Reads one patient payload per line, runs decision -> prompt -> LLM ->
+validation -> assembly and writes one JSON result per line as soon as it is
+ready. Input is pulled lazily through `batch.map_in_order`, so memory stays
+bounded by the LLM concurrency window regardless of the campaign size.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib
+import json
+import sys
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator, Optional, TextIO, Union
+
+from . import instrumentation
+from .audit import ComplianceAudit
+from .batch import map_in_order, patient_errors
+from .compliance import ComplianceError, validate_output
+from .contract import ContractError, to_decision_input
+from .decision_engine import assign_package
+from .generator import generate_email
+from .journal import RunJournal, content_version, payload_fingerprint
+from .llm_cache import CachedLLM, SQLiteResponseCache
+from .retry import RetryPolicy, TokenBucket
+from .segmentation import Segment, SegmentIndex
+from .spool import FORMATS, BackgroundSpool, Spool, open_spool, outgoing_from_record
+from .static_content import assemble_full_email
+from .variants import VariantPool
+
+DEFAULT_PROGRAM_NAME = "Programa Preventivo de Minimed"
+
+
+@dataclass
+class PipelineStats:
+    """Counters for one pipeline run."""
+
+    processed: int = 0
+    ok: int = 0
+    failed: int = 0
+    resumed: int = 0
+    skipped: int = 0
+
+    def merge(self, other: "PipelineStats") -> None:
+        self.processed += other.processed
+        self.ok += other.ok
+        self.failed += other.failed
+        self.resumed += other.resumed
+        self.skipped += other.skipped
+
+
+@dataclass
+class _Job:
+    line: int
+    payload: Any = None
+    patient_id: Any = None
+    error: Optional[Exception] = None
+    fingerprint: Optional[str] = None
+    resumed: Optional[dict[str, Any]] = None
+    segment: Optional[Segment] = None
+
+
+def iter_lines(stream: TextIO) -> Iterator[tuple[int, str]]:
+    """Yield ``(line_number, line)`` for every non-blank line of a JSONL stream."""
+    for line_number, line in enumerate(stream, start=1):
+        if line.strip():
+            yield line_number, line
+
+
+def process_payload(
+    payload: dict[str, Any],
+    llm: Optional[Callable[[str], str]],
+    *,
+    program_name: str = DEFAULT_PROGRAM_NAME,
+    validator: Callable[[str], None] | None = validate_output,
+    policy: Optional[RetryPolicy] = None,
+    variants: Optional[VariantPool] = None,
+) -> dict[str, Any]:
+    """Run the full single-patient flow and return the output record fields.
+
+    The payload is checked against the input contract first, so a malformed
+    row raises `ContractError` before any LLM call. With ``variants``, the
+    body comes from the pre-approved pool instead of the LLM, still goes
+    through ``validator`` with the patient's name in it, and the record names
+    the ``variant_id`` used. The payload's ``patient_email``, when present,
+    is copied to the record.
+    """
+    package = assign_package(to_decision_input(payload))
+    patient = payload["patient"]
+    temporal = payload["temporal"]
+    # Kept on the record so `spool` can address result files on its own.
+    address = {"patient_email": patient["patient_email"]} if "patient_email" in patient else {}
+    if variants is not None:
+        rendered = variants.render(
+            patient["patient_name"],
+            package,
+            temporal["recency_type"],
+            temporal["days_since_last_exam"],
+            validator=validator,
+        )
+        return {
+            "package": package,
+            **address,
+            "variant_id": rendered.variant_id,
+            "email_body": rendered.email_body,
+            "email": assemble_full_email(rendered.email_body),
+        }
+    body = generate_email(
+        patient_name=patient["patient_name"],
+        package=package,
+        recency_type=temporal["recency_type"],
+        days_since_last_exam=temporal["days_since_last_exam"],
+        llm=llm,
+        program_name=program_name,
+        validator=validator,
+        policy=policy,
+    )
+    return {"package": package, **address, "email_body": body, "email": assemble_full_email(body)}
+
+
+def run_pipeline(
+    lines: Iterable[tuple[int, str]],
+    sink: TextIO,
+    llm: Optional[Callable[[str], str]],
+    *,
+    max_in_flight: int = 8,
+    program_name: str = DEFAULT_PROGRAM_NAME,
+    validator: Callable[[str], None] | None = validate_output,
+    flush_every: int = 100,
+    journal: Optional[RunJournal] = None,
+    policy: Optional[RetryPolicy] = None,
+    variants: Optional[VariantPool] = None,
+    segments: Optional[SegmentIndex] = None,
+    spool: Optional[Union[Spool, BackgroundSpool]] = None,
+    audit: Optional[ComplianceAudit] = None,
+) -> PipelineStats:
+    """Process JSONL lines and write one result record per input line.
+
+    Records keep the input order and carry the input ``line`` number and the
+    ``patient_id`` when present. Malformed payloads and per-patient
+    ``ValueError`` failures, plus the errors ``policy`` retries once its
+    attempts run out, are written as ``status: "error"`` records;
+    contract violations also list their ``field_errors`` and compliance
+    rejections their ``violations``.
+
+    With a ``journal``, patients whose payload and content version already
+    produced a valid email are written from the journal without calling the
+    LLM, and every new result is checkpointed.
+
+    With ``variants``, bodies are rendered from the variant pool and ``llm``
+    may be ``None``.
+
+    With ``segments``, patients whose package did not change since the last
+    run are written as ``status: "skipped"`` records without generating an
+    email; the index is updated once a new or changed patient gets one.
+
+    With ``spool``, every ``ok`` record, resumed ones included, is also
+    written to it as an RFC 5322 message addressed to ``patient_email``; a
+    record whose address cannot be used becomes an ``error`` record.
+    The caller closes the spool.
+
+    With ``audit``, every rejection by the validator, retried ones included,
+    and every result record are counted in it.
+    """
+    if llm is None and variants is None:
+        raise ValueError("either llm or variants is required")
+    stats = PipelineStats()
+    if audit is not None and validator is not None:
+        validator = audit.wrap(validator)
+    # Payloads pass the input contract before use, so anything other than
+    # these is a bug and aborts the run instead of failing every record.
+    per_patient_errors = patient_errors(policy)
+    version = f"{content_version()}\n{program_name}" if journal is not None else ""
+    if journal is not None and variants is not None:
+        version += f"\nvariants:{variants.fingerprint()}"
+
+    def prepare(items: Iterable[tuple[int, str]]) -> Iterator[_Job]:
+        for line_number, line in items:
+            job = _Job(line=line_number)
+            try:
+                job.payload = json.loads(line)
+            except ValueError as exc:
+                job.error = exc
+            else:
+                job.patient_id = _patient_id(job.payload)
+            if segments is not None and job.error is None and job.patient_id is not None:
+                try:
+                    job.segment = segments.classify(
+                        str(job.patient_id), to_decision_input(job.payload)
+                    )
+                except ValueError as exc:
+                    job.error = exc
+            if journal is not None and job.patient_id is not None:
+                job.fingerprint = payload_fingerprint(job.payload, version)
+                job.resumed = journal.lookup(str(job.patient_id), job.fingerprint)
+            yield job
+
+    def run(job: _Job) -> tuple[_Job, dict[str, Any]]:
+        if job.resumed is not None:
+            return job, {**job.resumed, "line": job.line}
+        if job.segment is not None and not job.segment.needs_email:
+            return job, {
+                "line": job.line,
+                "patient_id": job.patient_id,
+                "status": "skipped",
+                "package": job.segment.package,
+            }
+        record: dict[str, Any] = {"line": job.line, "patient_id": job.patient_id, "status": "ok"}
+        try:
+            if job.error is not None:
+                raise job.error
+            record.update(
+                process_payload(
+                    job.payload,
+                    llm,
+                    program_name=program_name,
+                    validator=validator,
+                    policy=policy,
+                    variants=variants,
+                )
+            )
+        except per_patient_errors as exc:
+            record["status"] = "error"
+            record["error"] = _describe_error(exc)
+            if isinstance(exc, ContractError):
+                record["field_errors"] = [
+                    {"path": error.path, "message": error.message} for error in exc.errors
+                ]
+            elif isinstance(exc, ComplianceError):
+                record["violations"] = list(exc.violations)
+        return job, record
+
+    for job, record in map_in_order(run, prepare(lines), max_in_flight=max_in_flight):
+        message = None
+        if spool is not None and record["status"] == "ok":
+            try:
+                message = outgoing_from_record(record, job.payload)
+            except ValueError as exc:
+                # An undeliverable recipient fails this record, not the spool.
+                record = {
+                    "line": record["line"],
+                    "patient_id": record.get("patient_id"),
+                    "status": "error",
+                    "error": _describe_error(exc),
+                }
+        sink.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if message is not None:
+            spool.write(message)
+        if audit is not None:
+            audit.record_result(record, job.payload)
+        stats.processed += 1
+        if record["status"] == "ok":
+            stats.ok += 1
+        elif record["status"] == "skipped":
+            stats.skipped += 1
+        else:
+            stats.failed += 1
+        if job.segment is not None and record["status"] != "error":
+            segments.record(job.segment)
+        if job.resumed is not None:
+            stats.resumed += 1
+        elif journal is not None and job.fingerprint is not None and record["status"] != "skipped":
+            journal.record(str(job.patient_id), job.fingerprint, record)
+        if stats.processed % flush_every == 0:
+            sink.flush()
+    sink.flush()
+    if journal is not None:
+        journal.flush()
+    if segments is not None:
+        segments.flush()
+    return stats
+
+
+def load_llm(spec: str) -> Callable[[str], str]:
+    """Resolve a ``module:attribute`` spec to an LLM callable."""
+    module_name, _, attribute = spec.partition(":")
+    if not module_name or not attribute:
+        raise ValueError("llm spec must look like 'package.module:callable'")
+    target: Any = importlib.import_module(module_name)
+    for part in attribute.split("."):
+        target = getattr(target, part)
+    if not callable(target):
+        raise ValueError(f"{spec} is not callable")
+    return target
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="JSONL file with one payload per line, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSONL result file, or - for stdout")
+    parser.add_argument("--llm", help="LLM callable as module:attribute")
+    parser.add_argument("--variants", help="variant pool JSON; renders bodies without the LLM")
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--program-name", default=DEFAULT_PROGRAM_NAME)
+    parser.add_argument("--journal", help="SQLite checkpoint file; reruns skip finished patients")
+    parser.add_argument(
+        "--segments", help="SQLite segment index; only new patients or package changes get an email"
+    )
+    parser.add_argument("--cache", help="SQLite response cache for byte-identical prompts")
+    parser.add_argument("--model", default="default", help="model name used in cache keys")
+    parser.add_argument("--max-attempts", type=int, default=1, help="LLM attempts per patient")
+    parser.add_argument("--rpm", type=float, help="requests per minute allowed to the LLM")
+    parser.add_argument("--timeout", type=float, help="seconds allowed for one LLM call")
+    parser.add_argument(
+        "--spool", help="also write ok emails here: .mbox or .jsonl file, or .eml directory"
+    )
+    parser.add_argument("--spool-format", choices=FORMATS, help="spool format; inferred by default")
+    parser.add_argument("--spool-max-mb", type=float, help="rotate mbox/jsonl spool parts at this size")
+    parser.add_argument(
+        "--metrics", help="write stage metrics here; .json for JSON, Prometheus text otherwise"
+    )
+    parser.add_argument(
+        "--audit", help="write a compliance audit here; .json for JSON, CSV otherwise"
+    )
+    args = parser.parse_args(argv)
+    if not args.llm and not args.variants:
+        parser.error("one of --llm or --variants is required")
+
+    metrics = instrumentation.enable() if args.metrics else None
+    audit = ComplianceAudit() if args.audit else None
+
+    policy = None
+    if args.max_attempts > 1 or args.rpm or args.timeout:
+        policy = RetryPolicy(
+            max_attempts=args.max_attempts,
+            timeout=args.timeout,
+            rate_limiter=TokenBucket(args.rpm) if args.rpm else None,
+        )
+
+    llm: Optional[Callable[[str], str]] = load_llm(args.llm) if args.llm else None
+    variants = VariantPool.load(args.variants) if args.variants else None
+    cache = SQLiteResponseCache(args.cache) if args.cache and llm is not None else None
+    if cache is not None:
+        llm = CachedLLM(llm, cache, model=args.model)
+    journal = RunJournal(args.journal) if args.journal else None
+    segments = SegmentIndex(args.segments) if args.segments else None
+    spool = None
+    if args.spool:
+        max_bytes = int(args.spool_max_mb * (1 << 20)) if args.spool_max_mb else None
+        spool = BackgroundSpool(open_spool(args.spool, args.spool_format, max_bytes=max_bytes))
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    sink = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        stats = run_pipeline(
+            iter_lines(source),
+            sink,
+            llm,
+            max_in_flight=args.max_in_flight,
+            program_name=args.program_name,
+            journal=journal,
+            policy=policy,
+            variants=variants,
+            segments=segments,
+            spool=spool,
+            audit=audit,
+        )
+    finally:
+        if spool is not None:
+            spool.close()
+        if journal is not None:
+            journal.close()
+        if segments is not None:
+            segments.close()
+        if cache is not None:
+            cache.close()
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+    print(
+        f"procesados={stats.processed} ok={stats.ok} errores={stats.failed} "
+        f"reanudados={stats.resumed} omitidos={stats.skipped}",
+        file=sys.stderr,
+    )
+    if isinstance(llm, CachedLLM):
+        print(
+            f"cache aciertos={llm.stats.hits} fallos={llm.stats.misses} "
+            f"descartados={llm.stats.rejected}",
+            file=sys.stderr,
+        )
+    if metrics is not None:
+        exported = metrics.to_json() if args.metrics.endswith(".json") else metrics.to_prometheus()
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            f.write(exported)
+    if audit is not None:
+        audit.write(args.audit)
+    return 0 if stats.failed == 0 else 1
+
+
+def _patient_id(payload: Any) -> Any:
+    if isinstance(payload, dict) and isinstance(payload.get("patient"), dict):
+        return payload["patient"].get("patient_id")
+    return None
+
+
+def _describe_error(exc: BaseException) -> str:
+    return str(exc) or type(exc).__name__
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
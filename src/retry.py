@@ -0,0 +1,212 @@
+"""Retry, rate-limit and timeout policy shared by single and batch generation."""
+from __future__ import annotations
+
+import inspect
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Optional, Union
+
+from . import instrumentation
+from .compliance import ComplianceError
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+DEFAULT_RETRY_ON: tuple[type[BaseException], ...] = (
+    ComplianceError,
+    TimeoutError,
+    ConnectionError,
+)
+
+
+class TokenBucket:
+    """Thread-safe token bucket limiting requests per minute.
+
+    ``reserve()`` takes a token immediately and returns how long the caller
+    must wait before using it, so sync and async callers share one bucket.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        *,
+        burst: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute must be positive")
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst if burst is not None else max(1, int(self.rate)))
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1.0
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self) -> None:
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self) -> None:
+        import asyncio
+
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """How one email's LLM call is attempted.
+
+    Attributes:
+        max_attempts: Total attempts, including the first one.
+        backoff_base: Delay before the second attempt, doubled afterwards.
+        backoff_max: Upper bound for a single delay.
+        jitter: Fraction of each delay that is randomized (0 disables it).
+        timeout: Seconds allowed for one LLM call, counted from when it
+            starts; ``None`` waits forever. A timed call runs on a thread of
+            its own, so calls never queue behind each other. A call that
+            times out cannot be interrupted; it keeps its thread until it
+            returns and its result is discarded.
+        rate_limiter: Shared bucket acquired before every LLM call.
+        retry_on: Exceptions that trigger another attempt.
+    """
+
+    max_attempts: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 30.0
+    jitter: float = 0.5
+    timeout: Optional[float] = None
+    rate_limiter: Optional[TokenBucket] = None
+    retry_on: tuple[type[BaseException], ...] = DEFAULT_RETRY_ON
+
+    def __post_init__(self) -> None:
+        if self.max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+
+    def backoff(self, attempt: int) -> float:
+        """Delay after failed attempt number ``attempt`` (1-based)."""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        return delay * (1.0 - self.jitter * random.random())
+
+    def call(
+        self,
+        llm: Callable[[str], str],
+        prompt: str,
+        finalize: Callable[[str], str],
+    ) -> str:
+        """Run ``finalize(llm(prompt))`` with rate limiting, timeout and retries."""
+        for attempt in range(1, self.max_attempts + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                return finalize(self._invoke(llm, prompt))
+            except self.retry_on as exc:
+                if attempt == self.max_attempts:
+                    raise
+                instrumentation.metrics.inc("llm_retries_total", reason=type(exc).__name__)
+            time.sleep(self.backoff(attempt))
+        raise AssertionError("unreachable")
+
+    async def acall(
+        self,
+        llm: Callable[[str], Union[str, Awaitable[str]]],
+        prompt: str,
+        finalize: Callable[[str], str],
+    ) -> str:
+        """Async variant of :meth:`call`; blocking ``llm`` callables run in a thread."""
+        import asyncio
+
+        for attempt in range(1, self.max_attempts + 1):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire_async()
+            try:
+                return finalize(await self._ainvoke(llm, prompt))
+            except self.retry_on as exc:
+                if attempt == self.max_attempts:
+                    raise
+                instrumentation.metrics.inc("llm_retries_total", reason=type(exc).__name__)
+            await asyncio.sleep(self.backoff(attempt))
+        raise AssertionError("unreachable")
+
+    def _invoke(self, llm: Callable[[str], str], prompt: str) -> str:
+        if self.timeout is None:
+            return llm(prompt)
+        from concurrent.futures import wait
+
+        future = _start_call(llm, prompt)
+        if not wait([future], timeout=self.timeout).done:
+            raise TimeoutError(f"LLM call exceeded {self.timeout}s")
+        # Raises the LLM's own exception, its own TimeoutError included, unchanged.
+        return future.result()
+
+    async def _ainvoke(self, llm: Callable[[str], Any], prompt: str) -> str:
+        if self.timeout is None:
+            return await ainvoke_llm(llm, prompt)
+        import asyncio
+
+        task = asyncio.ensure_future(_ainvoke_on_thread(llm, prompt))
+        done, _ = await asyncio.wait({task}, timeout=self.timeout)
+        if not done:
+            task.cancel()
+            raise TimeoutError(f"LLM call exceeded {self.timeout}s")
+        return task.result()
+
+
+async def ainvoke_llm(llm: Callable[[str], Any], prompt: str) -> str:
+    """Await ``llm(prompt)``, running blocking callables in the default executor."""
+    import asyncio
+
+    if inspect.iscoroutinefunction(llm):
+        return await llm(prompt)
+    response = await asyncio.to_thread(llm, prompt)
+    if inspect.isawaitable(response):
+        response = await response
+    return response
+
+
+async def _ainvoke_on_thread(llm: Callable[[str], Any], prompt: str) -> str:
+    """`ainvoke_llm` with blocking callables started on a thread of their own.
+
+    The default executor is bounded, and time queued there would count
+    against the timeout.
+    """
+    import asyncio
+
+    if inspect.iscoroutinefunction(llm):
+        return await llm(prompt)
+    response = await asyncio.wrap_future(_start_call(llm, prompt))
+    if inspect.isawaitable(response):
+        response = await response
+    return response
+
+
+def _start_call(llm: Callable[[str], Any], prompt: str) -> "Future":
+    """Run ``llm(prompt)`` on a new daemon thread and return its future."""
+    from concurrent.futures import Future
+
+    future: Future = Future()
+
+    def run() -> None:
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(llm(prompt))
+        except BaseException as exc:
+            future.set_exception(exc)
+
+    threading.Thread(target=run, name="llm-call", daemon=True).start()
+    return future
@@ -1,32 +1,38 @@
-import os
-from openai import OpenAI
-from src.generator import generate_email
-from src.static_content import assemble_full_email
+"""Generate one fixed example email with the OpenAI backend and print it.
 
-def load_openai_key(path: str) -> str:
-    with open(path, "r", encoding="utf-8") as f:
-        line = f.read().strip()
-    return line.split("=", 1)[1].strip()
+Usage:
+    python -m src.run_generator [--api-key-file PATH] [--model NAME]
+"""
+import argparse
 
 # Ruta a tu archivo oaiak (ajústala)
-api_key = load_openai_key(r"C:\Users\orlando.caballero\Downloads\oaiak")
+DEFAULT_API_KEY_FILE = r"C:\Users\orlando.caballero\Downloads\oaiak"
 
-client = OpenAI(api_key=api_key)
 
-def llm(prompt: str) -> str:
-    response = client.responses.create(
-        model="gpt-4.1-mini",
-        input=prompt
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--api-key-file", default=DEFAULT_API_KEY_FILE)
+    parser.add_argument("--model", default="gpt-4.1-mini")
+    args = parser.parse_args(argv)
+
+    from src.generator import generate_email
+    from src.llm_backends import OpenAIBackend, load_api_key
+    from src.static_content import assemble_full_email
+
+    llm = OpenAIBackend(api_key=load_api_key(args.api_key_file), model=args.model)
+
+    body = generate_email(
+        patient_name="Ana",
+        package="STANDARD",
+        recency_type="HISTORICO",
+        days_since_last_exam=40,
+        llm=llm,
     )
-    return response.output_text
-
-body = generate_email(
-    patient_name="Ana",
-    package="STANDARD",
-    recency_type="HISTORICO",
-    days_since_last_exam=40,
-    llm=llm,
-)
-
-final_email = assemble_full_email(body)
-print(final_email)
+
+    final_email = assemble_full_email(body)
+    print(final_email)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
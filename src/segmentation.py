@@ -0,0 +1,257 @@
+"""Incremental re-segmentation for recurring campaigns.
+
+A `SegmentIndex` remembers, per ``patient_id``, a hash of the
+decision-relevant clinical fields and the package they produced. On the
+next run, patients whose hash still matches reuse their stored package
+without calling `assign_package`, and only new patients or patients whose
+package changed need a new email. The hash covers the decision rules as
+well, so editing the rules re-evaluates everyone while still reporting only
+real package changes.
+
+Usage:
+    python -m src.segmentation payloads.jsonl --index segments.sqlite --report diff.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterable, Optional, TextIO, Union
+
+from .contract import to_decision_input
+from .decision_engine import (
+    BIOMARKER_RISK_TO_PACKAGE,
+    MDLS_TIER_TO_PACKAGE,
+    DecisionInput,
+    RiskTierTable,
+    assign_package,
+    get_risk_tier_table,
+)
+
+NEW = "new"
+CHANGED = "changed"
+RECOMPUTED = "recomputed"
+UNCHANGED = "unchanged"
+# Statuses whose patients need a new email.
+NEEDS_EMAIL = frozenset((NEW, CHANGED))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    patient_id TEXT PRIMARY KEY,
+    decision_hash TEXT NOT NULL,
+    package TEXT NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+def rules_version() -> str:
+    """Hash of the package mappings and the active biomarker risk table.
+
+    Derived from the live table and mappings on every call, so it changes
+    after `rebuild_risk_tier_table` or an edit of the mappings. The table is
+    only hashed again when the active table object changes.
+    """
+    global _table_digest
+    table = get_risk_tier_table()
+    if _table_digest is None or _table_digest[0] is not table:
+        encoded = json.dumps([table.markers, table.tiers]).encode()
+        _table_digest = (table, hashlib.blake2b(encoded, digest_size=16).hexdigest())
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([MDLS_TIER_TO_PACKAGE, BIOMARKER_RISK_TO_PACKAGE], sort_keys=True).encode())
+    digest.update(_table_digest[1].encode())
+    return digest.hexdigest()
+
+
+_table_digest: Optional[tuple[RiskTierTable, str]] = None
+
+
+def decision_hash(decision_input: DecisionInput, version: Optional[str] = None) -> str:
+    """Stable hash of the fields `assign_package` reads, plus the rules version."""
+    canonical = json.dumps(
+        [
+            decision_input.mdls_calculable,
+            decision_input.mdls_tier,
+            decision_input.biomarker_flags or {},
+            decision_input.mdls_derivatives or {},
+            decision_input.comorbidity_channels or {},
+        ],
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update((version if version is not None else rules_version()).encode())
+    digest.update(canonical.encode("utf-8"))
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class Segment:
+    """Package of one patient and how it compares with the stored one."""
+
+    patient_id: str
+    status: str
+    package: str
+    previous_package: Optional[str]
+    decision_hash: str
+
+    @property
+    def needs_email(self) -> bool:
+        return self.status in NEEDS_EMAIL
+
+
+@dataclass
+class SegmentationReport:
+    """Outcome of one `resegment` run."""
+
+    counts: dict[str, int] = field(
+        default_factory=lambda: {NEW: 0, CHANGED: 0, RECOMPUTED: 0, UNCHANGED: 0}
+    )
+    changes: list[Segment] = field(default_factory=list)
+
+    def add(self, segment: Segment) -> None:
+        self.counts[segment.status] += 1
+        if segment.status == CHANGED:
+            self.changes.append(segment)
+
+    def write_jsonl(self, stream: TextIO) -> None:
+        """Write one line per patient whose package changed."""
+        for segment in self.changes:
+            stream.write(
+                json.dumps(
+                    {
+                        "patient_id": segment.patient_id,
+                        "previous_package": segment.previous_package,
+                        "package": segment.package,
+                    },
+                    ensure_ascii=False,
+                )
+                + "\n"
+            )
+
+
+class SegmentIndex:
+    """SQLite index of ``patient_id -> (decision hash, package)``.
+
+    Writes are batched like `RunJournal`. Use it from a single thread.
+    """
+
+    def __init__(self, path: Union[str, Path], *, batch_size: int = 500) -> None:
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self._pending: dict[str, tuple[str, str, float]] = {}
+        self._connection = sqlite3.connect(str(self.path))
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(_SCHEMA)
+        self._connection.commit()
+
+    def lookup(self, patient_id: str) -> Optional[tuple[str, str]]:
+        """Return the stored ``(decision_hash, package)`` of a patient."""
+        pending = self._pending.get(patient_id)
+        if pending is not None:
+            return pending[0], pending[1]
+        row = self._connection.execute(
+            "SELECT decision_hash, package FROM segments WHERE patient_id = ?", (patient_id,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def classify(self, patient_id: str, decision_input: DecisionInput) -> Segment:
+        """Assign the patient's package, reusing the stored one when inputs match."""
+        current = decision_hash(decision_input)
+        stored = self.lookup(patient_id)
+        if stored is not None and stored[0] == current:
+            return Segment(patient_id, UNCHANGED, stored[1], stored[1], current)
+        package = assign_package(decision_input)
+        if stored is None:
+            return Segment(patient_id, NEW, package, None, current)
+        status = CHANGED if stored[1] != package else RECOMPUTED
+        return Segment(patient_id, status, package, stored[1], current)
+
+    def record(self, segment: Segment) -> None:
+        """Store a patient's hash and package; committed with the next batch."""
+        self._pending[segment.patient_id] = (segment.decision_hash, segment.package, time.time())
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO segments (patient_id, decision_hash, package, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                [(pid, *values) for pid, values in self._pending.items()],
+            )
+        self._pending.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self._connection.close()
+
+    def __enter__(self) -> "SegmentIndex":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+def resegment(
+    index: SegmentIndex,
+    payloads: Iterable[dict[str, Any]],
+    *,
+    commit: bool = True,
+) -> SegmentationReport:
+    """Classify every payload against ``index`` and report package changes.
+
+    With ``commit`` the new hashes and packages are stored; leave it off for
+    a dry-run diff. Payloads must carry ``patient.patient_id`` and satisfy
+    the input contract.
+    """
+    report = SegmentationReport()
+    for payload in payloads:
+        segment = index.classify(str(payload["patient"]["patient_id"]), to_decision_input(payload))
+        report.add(segment)
+        if commit and segment.status != UNCHANGED:
+            index.record(segment)
+    if commit:
+        index.flush()
+    return report
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Report package changes since the last campaign.")
+    parser.add_argument("input", help="JSONL file with one payload per line, or - for stdin")
+    parser.add_argument("--index", required=True, help="SQLite segment index")
+    parser.add_argument("--report", help="write changed packages as JSONL to this file")
+    parser.add_argument("--dry-run", action="store_true", help="do not update the index")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    try:
+        with SegmentIndex(args.index) as index:
+            payloads = (json.loads(line) for line in source if line.strip())
+            report = resegment(index, payloads, commit=not args.dry_run)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as stream:
+            report.write_jsonl(stream)
+    counts = report.counts
+    print(
+        f"nuevos={counts[NEW]} cambiados={counts[CHANGED]} "
+        f"recalculados={counts[RECOMPUTED]} sin_cambios={counts[UNCHANGED]}",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
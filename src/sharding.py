@@ -0,0 +1,349 @@
+"""Sharded campaign execution across processes or machines.
+
+Every input line belongs to exactly one of N shards, chosen by a stable
+hash of its ``patient_id``. Rows without one use their line number.
+``--shard i/N`` runs the same partition on any machine. Each shard runs the
+regular pipeline over its own lines, with its own result file and
+checkpoint journal:
+
+    <out-dir>/shard-003-of-008.jsonl          result records
+    <out-dir>/shard-003-of-008.journal.sqlite
+    <out-dir>/shard-003-of-008.audit.json     compliance audit counters
+    <out-dir>/shard-003-of-008.stats.json     written when the shard finishes
+
+A failed shard is rerun on its own, and its journal skips the patients it
+already finished. `merge_shards` checks that every shard finished. It then
+interleaves the shard files back into input line order and adds up their
+stats and, on request, their compliance audits.
+
+Usage:
+    python -m src.sharding run payloads.jsonl --shards 8 --out-dir shards/ --llm mymodule:llm -o results.jsonl
+    python -m src.sharding run payloads.jsonl --shards 8 --out-dir shards/ --llm mymodule:llm --only 3
+    python -m src.sharding shard payloads.jsonl --shard 3/8 --out-dir shards/ --llm mymodule:llm
+    python -m src.sharding merge --shards 8 --out-dir shards/ -o results.jsonl --audit audit.csv
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import heapq
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional, TextIO, Union
+
+from .audit import ComplianceAudit
+from .journal import RunJournal
+from .pipeline import DEFAULT_PROGRAM_NAME, PipelineStats, iter_lines, load_llm, run_pipeline
+from .retry import RetryPolicy, TokenBucket
+from .variants import VariantPool
+
+@dataclass(frozen=True)
+class ShardSpec:
+    """Shard ``index`` (0-based) of ``count``."""
+
+    index: int
+    count: int
+
+    def __post_init__(self) -> None:
+        if self.count < 1 or not 0 <= self.index < self.count:
+            raise ValueError(f"invalid shard {self.index}/{self.count}")
+
+    @classmethod
+    def parse(cls, text: str) -> "ShardSpec":
+        """Parse ``"i/N"``."""
+        index, sep, count = text.partition("/")
+        if not sep or not index.strip().isdigit() or not count.strip().isdigit():
+            raise ValueError(f"shard must look like 'i/N', got {text!r}")
+        return cls(int(index), int(count))
+
+    @property
+    def name(self) -> str:
+        return f"shard-{self.index:03d}-of-{self.count:03d}"
+
+    def owns(self, line_number: int, line: str) -> bool:
+        return line_shard(line_number, line, self.count) == self.index
+
+
+@dataclass(frozen=True)
+class ShardOptions:
+    """Pipeline settings shared by every shard; plain values, so they pickle.
+
+    ``rpm`` is the campaign-wide LLM budget and is split evenly across shards.
+    """
+
+    llm: Optional[str] = None
+    variants: Optional[str] = None
+    program_name: str = DEFAULT_PROGRAM_NAME
+    max_in_flight: int = 8
+    max_attempts: int = 1
+    rpm: Optional[float] = None
+    timeout: Optional[float] = None
+
+
+def shard_of(patient_id: Any, count: int) -> int:
+    """Stable shard of a patient id; the same on every machine and Python run."""
+    digest = hashlib.blake2b(str(patient_id).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count
+
+
+def line_shard(line_number: int, line: str, count: int) -> int:
+    """Shard of one input line: by ``patient.patient_id`` when present, else by line number.
+
+    Lines that are not JSON objects with a ``patient`` object go by line
+    number; the pipeline of the owning shard reports them.
+    """
+    try:
+        payload = json.loads(line)
+    except ValueError:
+        payload = None
+    patient = payload.get("patient") if isinstance(payload, dict) else None
+    patient_id = patient.get("patient_id") if isinstance(patient, dict) else None
+    if patient_id is not None:
+        return shard_of(patient_id, count)
+    return (line_number - 1) % count
+
+
+def shard_paths(out_dir: Union[str, Path], spec: ShardSpec) -> dict[str, Path]:
+    directory = Path(out_dir)
+    return {
+        "output": directory / f"{spec.name}.jsonl",
+        "journal": directory / f"{spec.name}.journal.sqlite",
+        "stats": directory / f"{spec.name}.stats.json",
+        "audit": directory / f"{spec.name}.audit.json",
+    }
+
+
+def run_shard(
+    input_path: Union[str, Path],
+    spec: ShardSpec,
+    out_dir: Union[str, Path],
+    options: ShardOptions,
+) -> PipelineStats:
+    """Run the pipeline over the lines of ``input_path`` owned by ``spec``.
+
+    The stats file is written last, so its presence marks a finished shard.
+    """
+    if options.llm is None and options.variants is None:
+        raise ValueError("either llm or variants is required")
+    paths = shard_paths(out_dir, spec)
+    paths["output"].parent.mkdir(parents=True, exist_ok=True)
+    paths["stats"].unlink(missing_ok=True)
+
+    policy = None
+    if options.max_attempts > 1 or options.rpm or options.timeout:
+        policy = RetryPolicy(
+            max_attempts=options.max_attempts,
+            timeout=options.timeout,
+            rate_limiter=TokenBucket(options.rpm / spec.count) if options.rpm else None,
+        )
+    llm = load_llm(options.llm) if options.llm else None
+    variants = VariantPool.load(options.variants) if options.variants else None
+
+    audit = ComplianceAudit()
+    started = time.perf_counter()
+    with open(input_path, encoding="utf-8") as source, open(
+        paths["output"], "w", encoding="utf-8"
+    ) as sink:
+        journal = RunJournal(paths["journal"])
+        try:
+            stats = run_pipeline(
+                ((number, line) for number, line in iter_lines(source) if spec.owns(number, line)),
+                sink,
+                llm,
+                max_in_flight=options.max_in_flight,
+                program_name=options.program_name,
+                journal=journal,
+                policy=policy,
+                variants=variants,
+                audit=audit,
+            )
+        finally:
+            journal.close()
+    summary = {
+        "shard": spec.index,
+        "shards": spec.count,
+        "elapsed_s": round(time.perf_counter() - started, 4),
+        **asdict(stats),
+    }
+    audit.write(paths["audit"])
+    tmp = paths["stats"].with_suffix(".tmp")
+    tmp.write_text(json.dumps(summary) + "\n", encoding="utf-8")
+    os.replace(tmp, paths["stats"])
+    return stats
+
+
+@dataclass
+class ShardedRun:
+    """Outcome of `run_sharded`: per-shard stats and the shards that raised."""
+
+    stats: dict[int, PipelineStats]
+    errors: dict[int, str]
+
+
+def run_sharded(
+    input_path: Union[str, Path],
+    out_dir: Union[str, Path],
+    shards: int,
+    options: ShardOptions,
+    *,
+    processes: Optional[int] = None,
+    only: Optional[Iterable[int]] = None,
+) -> ShardedRun:
+    """Run shards in a process pool; ``only`` limits the run to some shard indexes."""
+    indexes = sorted(set(only)) if only is not None else list(range(shards))
+    specs = [ShardSpec(index, shards) for index in indexes]
+    outcome = ShardedRun(stats={}, errors={})
+    if not specs:
+        return outcome
+    with ProcessPoolExecutor(max_workers=processes or min(len(specs), os.cpu_count() or 1)) as pool:
+        futures = {spec.index: pool.submit(run_shard, input_path, spec, out_dir, options) for spec in specs}
+        for index, future in futures.items():
+            try:
+                outcome.stats[index] = future.result()
+            except Exception as exc:
+                outcome.errors[index] = str(exc) or type(exc).__name__
+    return outcome
+
+
+def merge_shards(
+    out_dir: Union[str, Path],
+    shards: int,
+    sink: TextIO,
+    audit: Optional[ComplianceAudit] = None,
+) -> PipelineStats:
+    """Write every shard's records to ``sink`` in input line order and sum their stats.
+
+    Each shard's compliance audit is also added to ``audit`` when given.
+
+    Raises:
+        ValueError: When a shard has not finished; its index is in the message.
+    """
+    specs = [ShardSpec(index, shards) for index in range(shards)]
+    missing = [spec.index for spec in specs if not shard_paths(out_dir, spec)["stats"].exists()]
+    if missing:
+        raise ValueError(f"shards sin terminar: {', '.join(map(str, missing))}")
+
+    total = PipelineStats()
+    fields = set(asdict(total))
+    streams = []
+    try:
+        for spec in specs:
+            paths = shard_paths(out_dir, spec)
+            summary = json.loads(paths["stats"].read_text(encoding="utf-8"))
+            total.merge(PipelineStats(**{key: summary[key] for key in fields}))
+            if audit is not None:
+                audit.merge(ComplianceAudit.load(paths["audit"]))
+            streams.append(open(paths["output"], encoding="utf-8"))
+        for _, line in heapq.merge(*(_numbered(stream) for stream in streams)):
+            sink.write(line)
+    finally:
+        for stream in streams:
+            stream.close()
+    return total
+
+
+def _numbered(stream: TextIO) -> Iterator[tuple[int, str]]:
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)["line"], line
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a campaign in hash-partitioned shards.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def pipeline_options(sub: argparse.ArgumentParser) -> None:
+        sub.add_argument("input", help="JSONL file with one payload per line")
+        sub.add_argument("--out-dir", required=True, help="directory for shard files")
+        sub.add_argument("--llm", help="LLM callable as module:attribute")
+        sub.add_argument("--variants", help="variant pool JSON; renders bodies without the LLM")
+        sub.add_argument("--program-name", default=DEFAULT_PROGRAM_NAME)
+        sub.add_argument("--max-in-flight", type=int, default=8, help="LLM calls in flight per shard")
+        sub.add_argument("--max-attempts", type=int, default=1)
+        sub.add_argument("--rpm", type=float, help="campaign-wide LLM requests per minute")
+        sub.add_argument("--timeout", type=float)
+
+    run = commands.add_parser("run", help="run shards in a local process pool, then merge")
+    pipeline_options(run)
+    run.add_argument("--shards", type=int, required=True)
+    run.add_argument("--processes", type=int, help="worker processes; default one per shard up to CPUs")
+    run.add_argument("--only", help="comma-separated shard indexes to (re)run")
+    run.add_argument("-o", "--output", help="merged JSONL result file")
+    run.add_argument("--audit", help="merged compliance audit; .json for JSON, CSV otherwise")
+
+    one = commands.add_parser("shard", help="run a single shard, e.g. on another machine")
+    pipeline_options(one)
+    one.add_argument("--shard", required=True, help="shard as i/N, 0-based")
+
+    merge = commands.add_parser("merge", help="merge finished shards into one ordered file")
+    merge.add_argument("--out-dir", required=True)
+    merge.add_argument("--shards", type=int, required=True)
+    merge.add_argument("-o", "--output", default="-", help="merged JSONL file, or - for stdout")
+    merge.add_argument("--audit", help="merged compliance audit; .json for JSON, CSV otherwise")
+
+    args = parser.parse_args(argv)
+    if args.command != "merge":
+        if not args.llm and not args.variants:
+            parser.error("one of --llm or --variants is required")
+        options = ShardOptions(
+            llm=args.llm,
+            variants=args.variants,
+            program_name=args.program_name,
+            max_in_flight=args.max_in_flight,
+            max_attempts=args.max_attempts,
+            rpm=args.rpm,
+            timeout=args.timeout,
+        )
+
+    if args.command == "shard":
+        spec = ShardSpec.parse(args.shard)
+        stats = run_shard(args.input, spec, args.out_dir, options)
+        _print_stats(f"{spec.name}: ", stats)
+        return 0 if stats.failed == 0 else 1
+
+    if args.command == "run":
+        only = [int(item) for item in args.only.split(",")] if args.only else None
+        outcome = run_sharded(
+            args.input, args.out_dir, args.shards, options, processes=args.processes, only=only
+        )
+        for index in sorted(outcome.stats):
+            _print_stats(f"{ShardSpec(index, args.shards).name}: ", outcome.stats[index])
+        for index, error in sorted(outcome.errors.items()):
+            print(f"{ShardSpec(index, args.shards).name}: error {error}", file=sys.stderr)
+        if outcome.errors:
+            return 1
+        if not args.output and not args.audit:
+            return 0 if all(stats.failed == 0 for stats in outcome.stats.values()) else 1
+
+    output = args.output or os.devnull
+    sink = sys.stdout if output == "-" else open(output, "w", encoding="utf-8")
+    audit = ComplianceAudit() if args.audit else None
+    try:
+        total = merge_shards(args.out_dir, args.shards, sink, audit)
+    except ValueError as exc:
+        print(str(exc), file=sys.stderr)
+        return 1
+    finally:
+        if sink is not sys.stdout:
+            sink.close()
+    _print_stats("total: ", total)
+    if audit is not None:
+        audit.write(args.audit)
+    return 0 if total.failed == 0 else 1
+
+
+def _print_stats(prefix: str, stats: PipelineStats) -> None:
+    print(
+        f"{prefix}procesados={stats.processed} ok={stats.ok} errores={stats.failed} "
+        f"reanudados={stats.resumed} omitidos={stats.skipped}",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,253 @@
+"""In-process SMTP stand-in for delivery tests and throughput runs.
+
+`SMTPStandIn` is started and stopped like an ``aiosmtpd`` controller but
+only needs the standard library. It speaks enough ESMTP for
+`src.delivery`:
+- EHLO with PIPELINING and 8BITMIME
+- MAIL, RCPT, DATA, RSET, NOOP and QUIT
+
+It answers pipelined commands in order. Transient ``451`` replies to RCPT
+are injected at ``transient_failure_rate``. A draw only depends on
+``seed``, the recipient and how many times that recipient was tried, so
+runs are reproducible while retries still get a fresh draw. Recipients in
+``rejected_domains`` get a permanent ``550``.
+
+Usage:
+    python -m src.smtp_standin --port 2525 --transient-failure-rate 0.05
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import socketserver
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+
+@dataclass(frozen=True)
+class ReceivedMessage:
+    """One message accepted by the stand-in."""
+
+    mail_from: str
+    rcpt_tos: tuple[str, ...]
+    data: bytes
+
+
+class SMTPStandIn:
+    """Threaded local SMTP server keeping accepted messages in memory.
+
+    Attributes:
+        messages: Accepted messages, in acceptance order (when ``keep_messages``).
+        accepted: Number of accepted messages.
+        connections: Number of client connections opened so far.
+        transient_failures: Number of injected ``451`` replies.
+    """
+
+    def __init__(
+        self,
+        hostname: str = "127.0.0.1",
+        port: int = 0,
+        *,
+        transient_failure_rate: float = 0.0,
+        rejected_domains: Iterable[str] = (),
+        latency: float = 0.0,
+        pipelining: bool = True,
+        keep_messages: bool = True,
+        seed: int = 0,
+    ) -> None:
+        self.hostname = hostname
+        self.port = port
+        self.transient_failure_rate = transient_failure_rate
+        self.rejected_domains = frozenset(domain.lower() for domain in rejected_domains)
+        self.latency = latency
+        self.pipelining = pipelining
+        self.keep_messages = keep_messages
+        self.seed = seed
+        self.messages: list[ReceivedMessage] = []
+        self.accepted = 0
+        self.connections = 0
+        self.transient_failures = 0
+        self._attempts: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[socketserver.ThreadingTCPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        standin = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            # Replies are small separate writes; without this, Nagle delays pipelined replies.
+            disable_nagle_algorithm = True
+
+            def handle(self) -> None:
+                _Session(standin, self.rfile, self.wfile).run()
+
+        server = socketserver.ThreadingTCPServer((self.hostname, self.port), Handler)
+        server.daemon_threads = True
+        self._server = server
+        self.port = server.server_address[1]
+        self._thread = threading.Thread(target=server.serve_forever, name="smtp-standin", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "SMTPStandIn":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.stop()
+
+    def _opened(self) -> None:
+        with self._lock:
+            self.connections += 1
+
+    def _rcpt_reply(self, address: str) -> bytes:
+        domain = address.rpartition("@")[2].lower()
+        if domain in self.rejected_domains:
+            return b"550 5.1.1 Destinatario rechazado\r\n"
+        if self.transient_failure_rate:
+            with self._lock:
+                attempt = self._attempts.get(address, 0)
+                self._attempts[address] = attempt + 1
+            if random.Random(f"{self.seed}:{address}:{attempt}").random() < self.transient_failure_rate:
+                with self._lock:
+                    self.transient_failures += 1
+                return b"451 4.3.0 Error temporal, intente nuevamente\r\n"
+        return b"250 2.1.5 OK\r\n"
+
+    def _accept(self, message: ReceivedMessage) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.accepted += 1
+            if self.keep_messages:
+                self.messages.append(message)
+
+
+class _Session:
+    """State of one client connection."""
+
+    def __init__(self, standin: SMTPStandIn, rfile, wfile) -> None:
+        self.standin = standin
+        self.rfile = rfile
+        self.wfile = wfile
+        self.mail_from: Optional[str] = None
+        self.rcpt_tos: list[str] = []
+
+    def run(self) -> None:
+        self.standin._opened()
+        self.reply(b"220 localhost ESMTP stand-in\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb, _, argument = line.decode("utf-8", "replace").strip().partition(" ")
+            verb = verb.upper()
+            if verb == "QUIT":
+                self.reply(b"221 2.0.0 Adios\r\n")
+                return
+            handler = getattr(self, f"smtp_{verb}", None)
+            self.reply(handler(argument) if handler else b"500 5.5.1 Comando no reconocido\r\n")
+
+    def reply(self, data: bytes) -> None:
+        self.wfile.write(data)
+
+    def reset(self) -> None:
+        self.mail_from = None
+        self.rcpt_tos = []
+
+    def smtp_EHLO(self, argument: str) -> bytes:
+        self.reset()
+        features = [b"250-localhost", b"250-8BITMIME", b"250-SIZE 10485760"]
+        if self.standin.pipelining:
+            features.append(b"250-PIPELINING")
+        features.append(b"250 HELP")
+        return b"\r\n".join(features) + b"\r\n"
+
+    def smtp_HELO(self, argument: str) -> bytes:
+        self.reset()
+        return b"250 localhost\r\n"
+
+    def smtp_NOOP(self, argument: str) -> bytes:
+        return b"250 2.0.0 OK\r\n"
+
+    def smtp_RSET(self, argument: str) -> bytes:
+        self.reset()
+        return b"250 2.0.0 OK\r\n"
+
+    def smtp_MAIL(self, argument: str) -> bytes:
+        if self.mail_from is not None:
+            return b"503 5.5.1 MAIL ya indicado\r\n"
+        self.mail_from = _address(argument)
+        return b"250 2.1.0 OK\r\n"
+
+    def smtp_RCPT(self, argument: str) -> bytes:
+        if self.mail_from is None:
+            return b"503 5.5.1 Falta MAIL\r\n"
+        address = _address(argument)
+        reply = self.standin._rcpt_reply(address)
+        if reply.startswith(b"250"):
+            self.rcpt_tos.append(address)
+        return reply
+
+    def smtp_DATA(self, argument: str) -> bytes:
+        if not self.rcpt_tos:
+            self.reset()
+            return b"554 5.5.1 Sin destinatarios validos\r\n"
+        self.reply(b"354 Termine con <CRLF>.<CRLF>\r\n")
+        lines: list[bytes] = []
+        while True:
+            line = self.rfile.readline()
+            if not line or line == b".\r\n":
+                break
+            lines.append(line[1:] if line.startswith(b"..") else line)
+        self.standin._accept(ReceivedMessage(self.mail_from or "", tuple(self.rcpt_tos), b"".join(lines)))
+        self.reset()
+        return b"250 2.0.0 Mensaje aceptado\r\n"
+
+
+def _address(argument: str) -> str:
+    _, _, value = argument.partition(":")
+    value = value.strip()
+    if value.startswith("<"):
+        value = value[1 : value.find(">")]
+    return value.split(" ", 1)[0]
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run a local SMTP stand-in until interrupted.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2525)
+    parser.add_argument("--transient-failure-rate", type=float, default=0.0)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added per accepted message")
+    parser.add_argument("--no-pipelining", action="store_true")
+    args = parser.parse_args(argv)
+
+    standin = SMTPStandIn(
+        args.host,
+        args.port,
+        transient_failure_rate=args.transient_failure_rate,
+        latency=args.latency,
+        pipelining=not args.no_pipelining,
+        keep_messages=False,
+    )
+    with standin:
+        print(f"SMTP stand-in en {standin.hostname}:{standin.port}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+    print(f"aceptados={standin.accepted} conexiones={standin.connections}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
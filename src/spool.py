@@ -0,0 +1,573 @@
+"""Bulk output of finished emails as RFC 5322 messages.
+
+A `MessageRenderer` turns an `OutgoingEmail` into message bytes. The
+headers that never change and the disclaimer/signature footer are encoded
+once per renderer, so rendering an email costs one body encode and one
+join. Spools write the rendered messages as one ``.eml`` file per email, as
+an mboxrd mailbox, or as JSONL records. Output is buffered and written in
+batches. With ``max_bytes``, mbox and JSONL output rotates to numbered part
+files. `BackgroundSpool` moves rendering and disk writes to a writer thread
+behind a bounded queue.
+
+Recipients are checked and normalized when an `OutgoingEmail` is built, so
+a bad address fails that one email in the caller's thread instead of the
+writer thread. Header values have control characters replaced by spaces,
+so patient data cannot add header lines.
+
+Usage:
+    python -m src.spool results.jsonl -o campaign.mbox --max-mb 50
+    python -m src.spool results.jsonl -o outbox/ --format eml
+"""
+from __future__ import annotations
+
+import argparse
+import email.utils
+import itertools
+import json
+import queue
+import quopri
+import re
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from email.header import Header
+from pathlib import Path
+from typing import Any, Iterable, Optional, Union
+
+from .static_content import footer_text
+
+FORMATS = ("eml", "mbox", "jsonl")
+DEFAULT_SENDER = "Programa Preventivo de Minimed <contacto@minimed.cl>"
+DEFAULT_SUBJECT = "Programa Preventivo de Minimed"
+# RFC 5322 limit on line length, excluding the line break.
+MAX_LINE_BYTES = 998
+
+_MBOX_FROM = re.compile(rb"^(>*From )", re.MULTILINE)
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9._-]+")
+_CONTROL = re.compile(r"[\x00-\x1f\x7f]+")
+# RFC 5321 dot-atom local part; quoted and non-ASCII local parts are not accepted.
+_LOCAL_PART = re.compile(r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*\Z")
+_LABEL = r"[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?"
+_DOMAIN = re.compile(rf"(?:{_LABEL}\.)*{_LABEL}\Z")
+
+
+@dataclass(frozen=True)
+class OutgoingEmail:
+    """One finished email body and the data needed to address it.
+
+    Raises:
+        ValueError: When ``recipient`` is not a well-formed address; see
+            `normalize_address`.
+    """
+
+    email_body: str
+    patient_id: Optional[str] = None
+    recipient: Optional[str] = None
+    recipient_name: Optional[str] = None
+    package: Optional[str] = None
+    variant_id: Optional[str] = None
+
+    def __post_init__(self) -> None:
+        if self.recipient is not None:
+            object.__setattr__(self, "recipient", normalize_address(self.recipient))
+
+
+class MessageRenderer:
+    """Render `OutgoingEmail` objects as RFC 5322 ``text/plain`` messages.
+
+    The footer is read from the static assets when the renderer is built;
+    build a new renderer to pick up edited assets. Bodies are sent as UTF-8
+    ``8bit``; a body with a line longer than the RFC 5322 limit is sent as
+    quoted-printable instead.
+    """
+
+    def __init__(
+        self,
+        *,
+        sender: str = DEFAULT_SENDER,
+        subject: str = DEFAULT_SUBJECT,
+        include_disclaimer: bool = True,
+        include_signature: bool = True,
+        linesep: str = "\r\n",
+    ) -> None:
+        self.linesep = linesep
+        self._eol = linesep.encode("ascii")
+        name, address = email.utils.parseaddr(sender)
+        address = normalize_address(address)
+        self._domain = address.rpartition("@")[2]
+        self._token = uuid.uuid4().hex[:12]
+        self._serial = itertools.count(1)
+        self._date = (0, "")
+        footer = footer_text(include_disclaimer=include_disclaimer, include_signature=include_signature)
+        self._footer = self._encode_text(footer)
+        self._footer_qp = _quoted_printable(self._footer, self._eol)
+        self._static = self._join_headers(
+            [
+                ("From", self._encode_address(name, address)),
+                ("Subject", self._encode_header(subject)),
+                ("MIME-Version", "1.0"),
+                ("Content-Type", "text/plain; charset=utf-8"),
+            ]
+        )
+
+    def render(self, message: OutgoingEmail) -> bytes:
+        """Return the full message, headers and footer included."""
+        headers = [("Date", self._now()), ("Message-ID", self._message_id())]
+        if message.recipient:
+            headers.append(("To", self._encode_address(message.recipient_name or "", message.recipient)))
+        for name, value in (
+            ("X-Minimed-Patient-Id", message.patient_id),
+            ("X-Minimed-Package", message.package),
+            ("X-Minimed-Variant-Id", message.variant_id),
+        ):
+            if value is not None:
+                headers.append((name, self._encode_header(str(value))))
+
+        body = self._encode_text(message.email_body.strip())
+        footer = self._footer
+        encoding = "8bit"
+        if _longest_line(body, self._eol) > MAX_LINE_BYTES:
+            body = _quoted_printable(body, self._eol)
+            footer = self._footer_qp
+            encoding = "quoted-printable"
+        headers.append(("Content-Transfer-Encoding", encoding))
+
+        eol = self._eol
+        parts = [self._static, self._join_headers(headers), eol, body]
+        if footer:
+            parts.extend((eol, eol, footer) if body else (footer,))
+        parts.append(eol)
+        return b"".join(parts)
+
+    def _encode_text(self, text: str) -> bytes:
+        lines = text.replace("\r\n", "\n").replace("\r", "\n")
+        if self.linesep != "\n":
+            lines = lines.replace("\n", self.linesep)
+        return lines.encode("utf-8")
+
+    def _encode_header(self, value: str) -> str:
+        value = _CONTROL.sub(" ", value)
+        if value.isascii():
+            return value
+        return Header(value, "utf-8").encode(linesep=self.linesep)
+
+    def _encode_address(self, name: str, address: str) -> str:
+        name = _CONTROL.sub(" ", name).strip()
+        if not name:
+            return address
+        if name.isascii():
+            return email.utils.formataddr((name, address))
+        return f"{self._encode_header(name)} <{address}>"
+
+    def _join_headers(self, headers: list[tuple[str, str]]) -> bytes:
+        return b"".join(f"{name}: {value}".encode("ascii") + self._eol for name, value in headers)
+
+    def _now(self) -> str:
+        second = int(time.time())
+        if self._date[0] != second:
+            self._date = (second, email.utils.formatdate(second, usegmt=True))
+        return self._date[1]
+
+    def _message_id(self) -> str:
+        return f"<{self._token}.{next(self._serial)}@{self._domain}>"
+
+
+class Spool:
+    """Base class for spools: buffered, batched writes of rendered messages.
+
+    Subclasses implement `_encode` and `_write_batch`. Messages are kept in
+    memory until ``buffer_bytes`` have been rendered, then written at once.
+    Not thread-safe; wrap it in a `BackgroundSpool` to write from workers.
+    """
+
+    format = ""
+    linesep = "\r\n"
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        *,
+        renderer: Optional[MessageRenderer] = None,
+        buffer_bytes: int = 1 << 20,
+    ) -> None:
+        self.path = Path(path)
+        self.renderer = renderer if renderer is not None else MessageRenderer(linesep=self.linesep)
+        self.buffer_bytes = buffer_bytes
+        self.count = 0
+        self.bytes_written = 0
+        self.paths: list[Path] = []
+        self._buffer: list[tuple[OutgoingEmail, bytes]] = []
+        self._buffered = 0
+        self._closed = False
+
+    def write(self, message: OutgoingEmail) -> None:
+        if self._closed:
+            raise ValueError("spool is closed")
+        data = self._encode(message, self.renderer.render(message))
+        self._buffer.append((message, data))
+        self._buffered += len(data)
+        self.count += 1
+        if self._buffered >= self.buffer_bytes:
+            self.flush()
+
+    def write_many(self, messages: Iterable[OutgoingEmail]) -> None:
+        for message in messages:
+            self.write(message)
+
+    def flush(self) -> None:
+        if not self._buffer:
+            return
+        batch, self._buffer, self._buffered = self._buffer, [], 0
+        self._write_batch(batch)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self.flush()
+        self._close_files()
+        self._closed = True
+
+    def __enter__(self) -> "Spool":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def _encode(self, message: OutgoingEmail, rendered: bytes) -> bytes:
+        return rendered
+
+    def _write_batch(self, batch: list[tuple[OutgoingEmail, bytes]]) -> None:
+        raise NotImplementedError
+
+    def _close_files(self) -> None:
+        pass
+
+
+class EmlSpool(Spool):
+    """One ``.eml`` file per message in a directory.
+
+    Files are named ``<sequence>-<patient_id>.eml`` so they sort in
+    output order.
+    """
+
+    format = "eml"
+
+    def __init__(self, path: Union[str, Path], **kwargs: Any) -> None:
+        super().__init__(path, **kwargs)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._sequence = 0
+
+    def _write_batch(self, batch: list[tuple[OutgoingEmail, bytes]]) -> None:
+        for message, data in batch:
+            self._sequence += 1
+            stem = f"{self._sequence:06d}"
+            if message.patient_id:
+                stem += "-" + _UNSAFE_NAME.sub("_", str(message.patient_id))[:64]
+            target = self.path / f"{stem}.eml"
+            with open(target, "wb") as f:
+                f.write(data)
+            self.paths.append(target)
+            self.bytes_written += len(data)
+
+
+class _RotatingSpool(Spool):
+    """Appends messages to one file, or to numbered parts when ``max_bytes`` is set.
+
+    With rotation, ``campaign.mbox`` becomes ``campaign-0001.mbox``,
+    ``campaign-0002.mbox`` and so on. A part is closed before the message
+    that would take it past ``max_bytes``; messages are never split.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        *,
+        max_bytes: Optional[int] = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(path, **kwargs)
+        if max_bytes is not None and max_bytes < 1:
+            raise ValueError("max_bytes must be positive")
+        self.max_bytes = max_bytes
+        self._file: Any = None
+        self._file_bytes = 0
+
+    def _write_batch(self, batch: list[tuple[OutgoingEmail, bytes]]) -> None:
+        chunks: list[bytes] = []
+        for _, data in batch:
+            if self._file is None or (
+                self.max_bytes is not None
+                and self._file_bytes
+                and self._file_bytes + len(data) > self.max_bytes
+            ):
+                self._write_chunks(chunks)
+                chunks = []
+                self._rotate()
+            chunks.append(data)
+            self._file_bytes += len(data)
+        self._write_chunks(chunks)
+
+    def _write_chunks(self, chunks: list[bytes]) -> None:
+        if chunks:
+            data = b"".join(chunks)
+            self._file.write(data)
+            self.bytes_written += len(data)
+
+    def _rotate(self) -> None:
+        self._close_files()
+        if self.max_bytes is None:
+            target = self.path
+        else:
+            target = self.path.with_name(f"{self.path.stem}-{len(self.paths) + 1:04d}{self.path.suffix}")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(target, "wb", buffering=0)
+        self._file_bytes = 0
+        self.paths.append(target)
+
+    def _close_files(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class MboxSpool(_RotatingSpool):
+    """mboxrd mailbox: ``From `` separator lines and ``>From`` quoting, LF line ends."""
+
+    format = "mbox"
+    linesep = "\n"
+
+    def _encode(self, message: OutgoingEmail, rendered: bytes) -> bytes:
+        separator = f"From MAILER-DAEMON {time.asctime(time.gmtime())}\n".encode("ascii")
+        return separator + _MBOX_FROM.sub(rb">\1", rendered) + b"\n"
+
+
+class JsonlSpool(_RotatingSpool):
+    """One JSON record per message with its routing fields and the RFC 5322 text."""
+
+    format = "jsonl"
+
+    def _encode(self, message: OutgoingEmail, rendered: bytes) -> bytes:
+        record = {
+            "patient_id": message.patient_id,
+            "to": message.recipient,
+            "package": message.package,
+            "variant_id": message.variant_id,
+            "message": rendered.decode("utf-8"),
+        }
+        return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+_SPOOLS = {"eml": EmlSpool, "mbox": MboxSpool, "jsonl": JsonlSpool}
+
+
+def open_spool(
+    path: Union[str, Path],
+    format: Optional[str] = None,
+    *,
+    max_bytes: Optional[int] = None,
+    sender: str = DEFAULT_SENDER,
+    subject: str = DEFAULT_SUBJECT,
+    buffer_bytes: int = 1 << 20,
+) -> Spool:
+    """Open a spool, inferring the format from the path when ``format`` is omitted.
+
+    ``.mbox`` and ``.jsonl`` paths select those formats; anything else is
+    treated as an ``.eml`` directory. ``max_bytes`` does not apply to ``eml``.
+    """
+    path = Path(path)
+    if format is None:
+        format = path.suffix.lstrip(".").lower()
+        if format not in _SPOOLS:
+            format = "eml"
+    spool_class = _SPOOLS.get(format)
+    if spool_class is None:
+        raise ValueError(f"Unsupported spool format: {format}. Allowed: {', '.join(FORMATS)}")
+    renderer = MessageRenderer(sender=sender, subject=subject, linesep=spool_class.linesep)
+    if spool_class is EmlSpool:
+        return EmlSpool(path, renderer=renderer, buffer_bytes=buffer_bytes)
+    return spool_class(path, renderer=renderer, buffer_bytes=buffer_bytes, max_bytes=max_bytes)
+
+
+_STOP = object()
+
+
+class BackgroundSpool:
+    """Run a `Spool` in a writer thread behind a bounded queue.
+
+    `write` only enqueues, so rendering and disk I/O overlap with
+    generation; it blocks once ``max_queue`` messages are waiting, which
+    bounds memory. A write error stops the thread and is raised again from
+    the next `write` or from `close`.
+    """
+
+    def __init__(self, spool: Spool, *, max_queue: int = 1024) -> None:
+        self.spool = spool
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue)
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name="spool-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def count(self) -> int:
+        return self.spool.count
+
+    @property
+    def paths(self) -> list[Path]:
+        return self.spool.paths
+
+    def write(self, message: OutgoingEmail) -> None:
+        if self._error is not None:
+            raise self._error
+        if not self._thread.is_alive():
+            raise ValueError("spool is closed")
+        self._queue.put(message)
+
+    def close(self) -> None:
+        """Drain the queue, close the spool and re-raise any writer error."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self) -> "BackgroundSpool":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        try:
+            while True:
+                message = self._queue.get()
+                if message is _STOP:
+                    break
+                self.spool.write(message)
+                if self._queue.empty():
+                    # Idle: push buffered messages to disk instead of holding them.
+                    self.spool.flush()
+            self.spool.close()
+        except BaseException as exc:  # re-raised in the producer thread
+            self._error = exc
+            self._drain()
+            self.spool._close_files()
+
+    def _drain(self) -> None:
+        # Unblock producers waiting on a full queue after a failure.
+        while True:
+            try:
+                if self._queue.get_nowait() is _STOP:
+                    return
+            except queue.Empty:
+                return
+
+
+def outgoing_from_record(record: dict[str, Any], payload: Any = None) -> Optional[OutgoingEmail]:
+    """Build the `OutgoingEmail` of an ``ok`` pipeline record, or ``None``.
+
+    The recipient comes from ``payload["patient"]`` when given, and from the
+    record's ``patient_email`` field otherwise.
+
+    Raises:
+        ValueError: When the recipient is not a well-formed address.
+    """
+    if record.get("status") != "ok" or not isinstance(record.get("email_body"), str):
+        return None
+    patient = payload.get("patient") if isinstance(payload, dict) else None
+    patient = patient if isinstance(patient, dict) else {}
+    patient_id = record.get("patient_id")
+    return OutgoingEmail(
+        email_body=record["email_body"],
+        patient_id=str(patient_id) if patient_id is not None else None,
+        recipient=patient.get("patient_email") or record.get("patient_email"),
+        recipient_name=patient.get("patient_name"),
+        package=record.get("package"),
+        variant_id=record.get("variant_id"),
+    )
+
+
+def normalize_address(address: str) -> str:
+    """Return ``address`` as an ASCII ``local@domain`` SMTP address.
+
+    The local part must be an RFC 5321 dot-atom; an internationalized
+    domain is converted to its IDNA form. Anything else, including CR, LF,
+    whitespace, angle brackets and display names, is rejected, so the
+    result is safe in ``To`` headers and ``RCPT TO`` commands.
+
+    Raises:
+        ValueError: When ``address`` is not a single well-formed address.
+    """
+    if not isinstance(address, str):
+        raise ValueError("email address must be a string")
+    local, sep, domain = address.rpartition("@")
+    if not sep or len(local) > 64 or not _LOCAL_PART.match(local):
+        raise ValueError(f"invalid email address: {address!r}")
+    if not domain.isascii():
+        try:
+            domain = domain.encode("idna").decode("ascii")
+        except UnicodeError:
+            raise ValueError(f"invalid email address domain: {address!r}") from None
+    if not _DOMAIN.match(domain) or len(local) + len(domain) >= 254:
+        raise ValueError(f"invalid email address domain: {address!r}")
+    return f"{local}@{domain}"
+
+
+def _longest_line(data: bytes, eol: bytes) -> int:
+    if len(data) <= MAX_LINE_BYTES:
+        return len(data)
+    return max(map(len, data.split(eol)))
+
+
+def _quoted_printable(data: bytes, eol: bytes) -> bytes:
+    return quopri.encodestring(data.replace(eol, b"\n")).replace(b"\n", eol)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Spool the ok records of a pipeline result file.")
+    parser.add_argument("input", help="pipeline result JSONL, or - for stdin")
+    parser.add_argument("-o", "--output", required=True, help=".mbox or .jsonl file, or .eml directory")
+    parser.add_argument("--format", choices=FORMATS, help="output format; inferred from -o by default")
+    parser.add_argument("--max-mb", type=float, help="rotate mbox/jsonl parts at this size")
+    parser.add_argument("--sender", default=DEFAULT_SENDER)
+    parser.add_argument("--subject", default=DEFAULT_SUBJECT)
+    args = parser.parse_args(argv)
+
+    spool = open_spool(
+        args.output,
+        args.format,
+        max_bytes=int(args.max_mb * (1 << 20)) if args.max_mb else None,
+        sender=args.sender,
+        subject=args.subject,
+    )
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    skipped = rejected = 0
+    try:
+        with spool:
+            for line in source:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                try:
+                    message = outgoing_from_record(record)
+                except ValueError as exc:
+                    rejected += 1
+                    print(f"paciente {record.get('patient_id')}: {exc}", file=sys.stderr)
+                    continue
+                if message is None:
+                    skipped += 1
+                else:
+                    spool.write(message)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    print(
+        f"escritos={spool.count} omitidos={skipped} rechazados={rejected} archivos={len(spool.paths)}",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
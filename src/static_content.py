@@ -1,7 +1,9 @@
 """Static institutional content appended outside the LLM."""
 from __future__ import annotations
 
-from pathlib import Path
+from functools import lru_cache
+
+from .content import read_text
 
 
 def assemble_full_email(
@@ -11,12 +13,25 @@ def assemble_full_email(
     include_signature: bool = True,
 ) -> str:
     """Append fixed institutional content to the email body."""
-    sections = [email_body.strip()]
-    if include_disclaimer:
-        sections.append(_load_disclaimer())
-    if include_signature:
-        sections.append(_load_signature())
-    return "\n\n".join(section for section in sections if section)
+    body = email_body.strip()
+    footer = footer_text(include_disclaimer=include_disclaimer, include_signature=include_signature)
+    if body and footer:
+        return f"{body}\n\n{footer}"
+    return body or footer
+
+
+def footer_text(*, include_disclaimer: bool = True, include_signature: bool = True) -> str:
+    """The disclaimer and signature block that `assemble_full_email` appends."""
+    return _join_footer(
+        _load_disclaimer() if include_disclaimer else "",
+        _load_signature() if include_signature else "",
+    )
+
+
+@lru_cache(maxsize=8)
+def _join_footer(disclaimer: str, signature: str) -> str:
+    # Keyed on the asset texts, so registry reloads still produce a new footer.
+    return "\n\n".join(section for section in (disclaimer, signature) if section)
 
 
 def _load_disclaimer() -> str:
@@ -28,5 +43,4 @@ def _load_signature() -> str:
 
 
 def _read_text(relative_path: str) -> str:
-    repo_root = Path(__file__).resolve().parents[1]
-    return (repo_root / relative_path).read_text(encoding="utf-8").strip()
+    return read_text(relative_path)
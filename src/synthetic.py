@@ -0,0 +1,62 @@
+"""Synthetic patient payloads that follow `input_output_contract.md`.
+
+Used by the load test and the benchmarks; never for real campaigns.
+"""
+from __future__ import annotations
+
+import random
+from datetime import date, timedelta
+from typing import Any, Iterator
+
+PATIENT_NAMES = (
+    "Ana", "Luis", "Camila", "Marcela", "Ignacio", "Juan", "Valentina", "Diego",
+    "Francisca", "Tomás", "Josefa", "Matías", "Catalina", "Benjamín", "Sofía", "Martín",
+)
+BIOMARKERS = ("GLU", "HBA1C", "LDL", "HDL", "VLDL", "TG", "PLT", "HGB", "ALT")
+FLAG_VALUES = ("NORMAL", "NORMAL", "FUERA_RANGO", "SIN_DATO")
+MDLS_TIERS = ("BAJO", "MEDIO", "ALTO")
+DERIVATIVES = ("TG_HDL_RATIO", "AST_ALT_RATIO", "NON_HDL")
+COMORBIDITY_CHANNELS = ("CREAT", "FIB4")
+REFERENCE_DATE = date(2025, 1, 1)
+
+
+def synthetic_payloads(count: int, *, seed: int = 0) -> Iterator[dict[str, Any]]:
+    """Yield ``count`` reproducible payloads, one patient at a time."""
+    rng = random.Random(seed)
+    for index in range(count):
+        yield synthetic_payload(index, rng)
+
+
+def synthetic_payload(index: int, rng: random.Random) -> dict[str, Any]:
+    """Build one payload with every contract section populated."""
+    name = rng.choice(PATIENT_NAMES)
+    calculable = rng.random() < 0.6
+    clinical: dict[str, Any] = {"mdls_calculable": calculable}
+    if calculable:
+        clinical["mdls_score"] = round(rng.random(), 2)
+        clinical["mdls_tier"] = rng.choice(MDLS_TIERS)
+    markers = rng.sample(BIOMARKERS, rng.randint(0, len(BIOMARKERS)))
+    clinical["biomarkers"] = {marker: round(rng.uniform(0, 300), 1) for marker in markers}
+    clinical["biomarker_flags"] = {marker: rng.choice(FLAG_VALUES) for marker in markers}
+    clinical["mdls_derivatives"] = {
+        key: rng.choice((0, 0, 0, round(rng.uniform(0.5, 5.0), 2))) for key in DERIVATIVES
+    }
+    clinical["comorbidity_channels"] = {
+        key: rng.choice((0, 0, 0, 1)) for key in COMORBIDITY_CHANNELS
+    }
+
+    first_exam = rng.random() < 0.2
+    days = 0 if first_exam else rng.randint(1, 900)
+    return {
+        "patient": {
+            "patient_id": f"INT-{index:07d}",
+            "patient_name": name,
+            "patient_email": f"paciente.{index}@example.com",
+        },
+        "clinical": clinical,
+        "temporal": {
+            "last_exam_date": (REFERENCE_DATE - timedelta(days=days)).isoformat(),
+            "days_since_last_exam": days,
+            "recency_type": "PRIMER_EXAMEN" if first_exam else "HISTORICO",
+        },
+    }
@@ -0,0 +1,93 @@
+"""Slot templates parsed once and rendered with a single join."""
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Iterable, Mapping, Union
+
+SLOT_PATTERN = re.compile(r"\{\{(\w+)\}\}")
+
+
+@dataclass(frozen=True)
+class Slot:
+    """Named placeholder inside a :class:`SlotTemplate`."""
+
+    name: str
+
+
+class SlotTemplate:
+    """Literal fragments interleaved with named slots.
+
+    ``fragments`` always has one more element than ``slots``: rendering places
+    ``slots[i]`` between ``fragments[i]`` and ``fragments[i + 1]``. Adjacent
+    literals are merged at construction time, so the number of pieces joined
+    per render is the minimum for the template.
+    """
+
+    __slots__ = ("fragments", "slots")
+
+    def __init__(self, parts: Iterable[Union[str, Slot]]) -> None:
+        fragments: list[str] = [""]
+        slots: list[str] = []
+        for part in parts:
+            if isinstance(part, Slot):
+                slots.append(part.name)
+                fragments.append("")
+            else:
+                fragments[-1] += part
+        self.fragments = tuple(fragments)
+        self.slots = tuple(slots)
+
+    @classmethod
+    def parse(cls, text: str, slots: Iterable[str]) -> "SlotTemplate":
+        """Parse ``{{name}}`` markers for the given slot names.
+
+        Markers for any other name are kept as literal text, matching the
+        behaviour of substituting known placeholders with ``str.replace``.
+        """
+        names = set(slots)
+        parts: list[Union[str, Slot]] = []
+        position = 0
+        for match in SLOT_PATTERN.finditer(text):
+            if match.group(1) not in names:
+                continue
+            parts.append(text[position : match.start()])
+            parts.append(Slot(match.group(1)))
+            position = match.end()
+        parts.append(text[position:])
+        return cls(parts)
+
+    @property
+    def prefix(self) -> str:
+        """Constant text before the first slot."""
+        return self.fragments[0]
+
+    def parts(self) -> list[Union[str, Slot]]:
+        parts: list[Union[str, Slot]] = [self.fragments[0]]
+        for name, fragment in zip(self.slots, self.fragments[1:]):
+            parts.append(Slot(name))
+            parts.append(fragment)
+        return parts
+
+    def bind(self, **values: str) -> "SlotTemplate":
+        """Return a template with some slots replaced by constant text."""
+        return SlotTemplate(
+            values[part.name] if isinstance(part, Slot) and part.name in values else part
+            for part in self.parts()
+        )
+
+    def render(self, values: Mapping[str, str]) -> str:
+        """Fill every slot and return the final text."""
+        fragments = self.fragments
+        if not self.slots:
+            return fragments[0]
+        pieces = [""] * (2 * len(self.slots) + 1)
+        pieces[::2] = fragments
+        pieces[1::2] = [values[name] for name in self.slots]
+        return "".join(pieces)
+
+    def __add__(self, other: "SlotTemplate") -> "SlotTemplate":
+        return SlotTemplate(self.parts() + other.parts())
+
+    def __repr__(self) -> str:
+        return f"SlotTemplate(slots={self.slots!r})"
@@ -0,0 +1,289 @@
+"""Template-only generation from pools of pre-approved email variants.
+
+A `VariantPool` holds, per (package, recency bucket), email bodies that were
+generated once and passed `validate_output` with a sample name in the
+``{{patient_name}}`` slot. Rendering a patient's email then only fills that
+slot, with no LLM call, and checks the finished body. Variants are handed
+out round-robin per pool key, and every rendered email records the
+``variant_id`` it came from. Ids are derived from the variant text, so they
+stay stable across saves and refills.
+
+The package templates are style anchors for the prompt, not finished
+emails: they lack the 7-block, 120-220 word shape of the output contract.
+`from_anchors` therefore refuses to build a pool from them while they fail
+`validate_output`, and pools are normally filled from an LLM.
+
+Usage:
+    python -m src.variants -o pool.json --llm mymodule:llm --per-key 5
+    python -m src.variants -o pool.json            # anchors only; refused while they fail
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import itertools
+import json
+import sys
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable, Optional, Union
+
+from .compliance import ComplianceError, validate_output
+from .generator import (
+    ALLOWED_PACKAGES,
+    RECENCY_MESSAGES,
+    _finalize_response,
+    _load_package_template,
+    _normalize_package,
+    build_prompt,
+    recency_bucket,
+)
+from .retry import DEFAULT_RETRY_ON, RetryPolicy
+from .templating import SlotTemplate
+
+NAME_SLOT = "{{patient_name}}"
+# Stand-in for the name slot when a whole variant is checked against the contract.
+SAMPLE_NAME = "Ana"
+PACKAGES = tuple(sorted(ALLOWED_PACKAGES))
+BUCKETS = tuple(RECENCY_MESSAGES)
+# Prompt inputs that land in each recency bucket when filling a pool.
+BUCKET_INPUTS = {
+    "PRIMER_EXAMEN": ("PRIMER_EXAMEN", 0),
+    "HISTORICO_RECIENTE": ("HISTORICO", 30),
+    "HISTORICO_MEDIO": ("HISTORICO", 180),
+    "HISTORICO_LARGO": ("HISTORICO", 400),
+}
+
+
+class VariantError(ValueError):
+    """Raised when a variant cannot be accepted or no variant is available."""
+
+
+@dataclass(frozen=True)
+class Variant:
+    """One pre-validated email body with a ``patient_name`` slot."""
+
+    variant_id: str
+    package: str
+    bucket: str
+    text: str
+
+    @property
+    def template(self) -> SlotTemplate:
+        return SlotTemplate.parse(self.text, ("patient_name",))
+
+
+@dataclass(frozen=True)
+class VariantEmail:
+    """A rendered email body and the variant it was built from."""
+
+    email_body: str
+    variant_id: str
+
+
+def make_variant(
+    package: str,
+    bucket: str,
+    text: str,
+    *,
+    validator: Callable[[str], None] | None = validate_output,
+) -> Variant:
+    """Validate ``text`` and wrap it as a variant of ``(package, bucket)``.
+
+    ``validator`` sees the text with `SAMPLE_NAME` in the name slot, so the
+    whole-body rules of the output contract apply to the variant.
+
+    Raises:
+        VariantError: When the text has no name slot.
+        ComplianceError: When ``validator`` rejects the text.
+    """
+    body = text.strip()
+    if NAME_SLOT not in body:
+        raise VariantError(f"variant for {package}/{bucket} has no {NAME_SLOT} slot")
+    _finalize_response(body.replace(NAME_SLOT, SAMPLE_NAME), validator)
+    digest = hashlib.sha256(body.encode("utf-8")).hexdigest()[:10]
+    return Variant(f"{package.lower()}-{bucket.lower()}-{digest}", package, bucket, body)
+
+
+def anchor_variant(package: str, bucket: str) -> Variant:
+    """Variant built from the package anchor template and the bucket's recency message.
+
+    Raises:
+        ComplianceError: When the rendered anchor fails `validate_output`.
+    """
+    normalized = _normalize_package(package)
+    text = SlotTemplate.parse(_load_package_template(normalized), ("recency_message",)).render(
+        {"recency_message": RECENCY_MESSAGES[bucket]}
+    )
+    return make_variant(normalized, bucket, text)
+
+
+class VariantPool:
+    """Pre-approved variants per (package, recency bucket) with round-robin rotation."""
+
+    def __init__(self, variants: Iterable[Variant] = ()) -> None:
+        self._variants: dict[tuple[str, str], list[Variant]] = {}
+        self._templates: dict[str, SlotTemplate] = {}
+        self._cursors: dict[tuple[str, str], itertools.count] = {}
+        self._lock = threading.Lock()
+        for variant in variants:
+            self.add(variant)
+
+    def add(self, variant: Variant) -> None:
+        key = (variant.package, variant.bucket)
+        with self._lock:
+            existing = self._variants.setdefault(key, [])
+            if any(item.variant_id == variant.variant_id for item in existing):
+                return
+            existing.append(variant)
+            self._templates[variant.variant_id] = variant.template
+            self._cursors.setdefault(key, itertools.count())
+
+    def variants(self, package: str, bucket: str) -> list[Variant]:
+        return list(self._variants.get((package, bucket), ()))
+
+    def __len__(self) -> int:
+        return sum(len(items) for items in self._variants.values())
+
+    def render(
+        self,
+        patient_name: str,
+        package: str,
+        recency_type: str,
+        days_since_last_exam: int,
+        *,
+        validator: Callable[[str], None] | None = validate_output,
+    ) -> VariantEmail:
+        """Build a patient's email body from the next variant of its pool key.
+
+        The rendered body goes through ``validator``, since the patient name
+        can add forbidden terms or change the word count of the variant.
+
+        Raises:
+            VariantError: When the pool has no variant for the key.
+            ComplianceError: When ``validator`` rejects the rendered body.
+        """
+        key = (_normalize_package(package), recency_bucket(recency_type, days_since_last_exam))
+        items = self._variants.get(key)
+        if not items:
+            raise VariantError(f"no variants for {key[0]}/{key[1]}")
+        variant = items[next(self._cursors[key]) % len(items)]
+        body = self._templates[variant.variant_id].render({"patient_name": patient_name})
+        body = _finalize_response(body, validator)
+        return VariantEmail(email_body=body, variant_id=variant.variant_id)
+
+    def fingerprint(self) -> str:
+        """Hash of every variant id, for journals and cache keys."""
+        ids = sorted(self._templates)
+        return hashlib.sha256("\n".join(ids).encode("utf-8")).hexdigest()
+
+    def save(self, path: Union[str, Path]) -> None:
+        data = [
+            {"variant_id": v.variant_id, "package": v.package, "bucket": v.bucket, "text": v.text}
+            for key in sorted(self._variants)
+            for v in self._variants[key]
+        ]
+        Path(path).write_text(json.dumps(data, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+
+    @classmethod
+    def load(
+        cls,
+        path: Union[str, Path],
+        *,
+        validator: Callable[[str], None] | None = validate_output,
+    ) -> "VariantPool":
+        """Load a saved pool, re-validating every variant against the current rules."""
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        return cls(
+            make_variant(item["package"], item["bucket"], item["text"], validator=validator)
+            for item in data
+        )
+
+    @classmethod
+    def from_anchors(cls) -> "VariantPool":
+        """Pool with one anchor-template variant per key; needs no LLM.
+
+        Raises:
+            VariantError: When any anchor fails the output contract; the
+                message lists each key and its violations.
+        """
+        variants: list[Variant] = []
+        rejected: list[str] = []
+        for package in PACKAGES:
+            for bucket in BUCKETS:
+                try:
+                    variants.append(anchor_variant(package, bucket))
+                except ComplianceError as exc:
+                    rejected.append(f"{package}/{bucket} ({'; '.join(exc.violations)})")
+        if rejected:
+            raise VariantError(f"anchor templates fail the output contract: {', '.join(rejected)}")
+        return cls(variants)
+
+
+def fill_pool(
+    llm: Callable[[str], str],
+    *,
+    per_key: int = 5,
+    pool: Optional[VariantPool] = None,
+    packages: Iterable[str] = PACKAGES,
+    buckets: Iterable[str] = BUCKETS,
+    validator: Callable[[str], None] | None = validate_output,
+    max_attempts: Optional[int] = None,
+    program_name: str = "Programa Preventivo de Minimed",
+    policy: Optional[RetryPolicy] = None,
+) -> VariantPool:
+    """Ask ``llm`` for up to ``per_key`` accepted variants per (package, bucket).
+
+    The prompt uses the ``{{patient_name}}`` marker as the patient name, so
+    replies keep it as the slot. Rejected, slot-less and duplicate replies are
+    discarded; at most ``max_attempts`` (default ``3 * per_key``) calls are
+    made per key. A transient LLM error (the ``retry_on`` of ``policy``, or
+    of the default policy) counts as one discarded reply; with ``policy``,
+    each call is also rate limited, timed out and retried by it.
+    """
+    pool = pool if pool is not None else VariantPool()
+    attempts = max_attempts if max_attempts is not None else 3 * per_key
+    discarded = (ValueError, *(policy.retry_on if policy is not None else DEFAULT_RETRY_ON))
+    bucket_names = tuple(buckets)
+    for package in packages:
+        for bucket in bucket_names:
+            recency_type, days = BUCKET_INPUTS[bucket]
+            prompt = build_prompt(NAME_SLOT, package, recency_type, days, program_name)
+            for _ in range(attempts):
+                if len(pool.variants(package, bucket)) >= per_key:
+                    break
+                try:
+                    response = policy.call(llm, prompt, str) if policy is not None else llm(prompt)
+                    pool.add(make_variant(package, bucket, response, validator=validator))
+                except discarded:
+                    continue
+    return pool
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    from .pipeline import load_llm
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output", required=True, help="JSON file for the pool")
+    parser.add_argument("--llm", help="LLM callable as module:attribute; anchors only when omitted")
+    parser.add_argument("--per-key", type=int, default=5, help="variants per package and bucket")
+    args = parser.parse_args(argv)
+
+    if args.llm:
+        pool = fill_pool(load_llm(args.llm), per_key=args.per_key)
+    else:
+        try:
+            pool = VariantPool.from_anchors()
+        except VariantError as exc:
+            print(f"{exc}; use --llm to fill the pool", file=sys.stderr)
+            return 1
+    pool.save(args.output)
+    for package in PACKAGES:
+        counts = " ".join(f"{bucket}={len(pool.variants(package, bucket))}" for bucket in BUCKETS)
+        print(f"{package}: {counts}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,15 +1,77 @@
 """Run deterministic validation cases for the email generator."""
 from __future__ import annotations
 
+import contextlib
+import io
+import itertools
 import json
+import mailbox
+import os
+from email import message_from_bytes, policy as email_policy
 from pathlib import Path
+from typing import Optional, Union
+import random
+import shutil
+import re
+import subprocess
 import sys
+import tempfile
+import threading
+import time
 
 REPO_ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(REPO_ROOT))
 
-from src.compliance import ComplianceError, validate_email
-from src.decision_engine import DecisionInput, assign_package
+from src import instrumentation
+from src.audit import ComplianceAudit
+from src.batch import generate_emails
+from src import bulk_decision, content, decision_engine
+from src.bulk_decision import assign_packages, to_columns
+from src.compliance import (
+    DEFAULT_DIAGNOSIS_PATTERNS,
+    DEFAULT_FORBIDDEN_TERMS,
+    DEFAULT_URGENCY_TERMS,
+    ComplianceError,
+    ComplianceScanner,
+    check_email,
+    check_structure,
+    validate_email,
+    validate_output,
+)
+from src.content import ContentRegistry
+from src.contract import partition_payloads, validate_payload
+from src.delivery import DeliveryStats, Envelope, SMTPConfig, SMTPPool, deliver, envelope_for
+from src.decision_engine import (
+    DecisionEngineError,
+    DecisionInput,
+    _evaluate_rules,
+    assign_package,
+    derive_biomarker_risk_tier,
+)
+from src.journal import RunJournal, content_version
+from src.generator import build_prompt, generate_email, generate_email_streaming, recency_bucket
+from src.llm_backends import FakeLLM
+from src.loadtest import run_load_test
+from src.llm_cache import CachedLLM, SQLiteResponseCache, cache_key
+from src.multi_prompt import BatchStats, generate_emails_batched
+from src.retry import RetryPolicy
+from src.pipeline import run_pipeline
+from src.segmentation import SegmentIndex, resegment, rules_version
+from src.sharding import (
+    ShardOptions,
+    ShardSpec,
+    line_shard,
+    merge_shards,
+    run_shard,
+    run_sharded,
+    shard_of,
+)
+from src.smtp_standin import SMTPStandIn
+from src.spool import BackgroundSpool, MessageRenderer, OutgoingEmail, open_spool
+from src.spool import main as spool_main
+from src.static_content import footer_text
+from src.synthetic import synthetic_payloads
+from src.variants import BUCKETS, PACKAGES, VariantError, VariantPool, fill_pool, make_variant
 
 
 def main() -> int:
@@ -34,18 +96,16 @@ def main() -> int:
         if package != expected["package"]:
             failures.append(f"{case_id}: package esperado {expected['package']} != {package}")
 
-        recency_bucket = _recency_bucket(
+        bucket = recency_bucket(
             payload["temporal"]["recency_type"],
             payload["temporal"]["days_since_last_exam"],
         )
-        if recency_bucket != expected["recency_bucket"]:
-            failures.append(
-                f"{case_id}: recency esperado {expected['recency_bucket']} != {recency_bucket}"
-            )
+        if bucket != expected["recency_bucket"]:
+            failures.append(f"{case_id}: recency esperado {expected['recency_bucket']} != {bucket}")
 
         email_body = _placeholder_email(
             patient_name=payload["patient"]["patient_name"],
-            recency_bucket=recency_bucket,
+            recency_bucket=bucket,
             package=package,
         )
         try:
@@ -53,13 +113,32 @@ def main() -> int:
         except ComplianceError as exc:
             failures.append(f"{case_id}: compliance error {exc}")
 
-        word_count = _word_count(email_body)
-        if not 120 <= word_count <= 220:
-            failures.append(f"{case_id}: longitud fuera de rango ({word_count} palabras)")
+        structure = check_structure(email_body)
+        for violation in structure.violations:
+            failures.append(f"{case_id}: {violation}")
 
-        block_count = _block_count(email_body)
-        if block_count != 7:
-            failures.append(f"{case_id}: bloques esperados 7 != {block_count}")
+    failures.extend(_check_batch(cases))
+    failures.extend(_check_scanner_equivalence())
+    failures.extend(_check_content_registry())
+    failures.extend(_check_bulk_decision())
+    failures.extend(_check_retry_policy())
+    failures.extend(_check_retry_timeouts())
+    failures.extend(_check_streaming_abort())
+    failures.extend(_check_fake_llm())
+    failures.extend(_check_pipeline_errors())
+    failures.extend(_check_journal_resume())
+    failures.extend(_check_llm_cache())
+    failures.extend(_check_instrumentation())
+    failures.extend(_check_contract(cases))
+    failures.extend(_check_multi_prompt())
+    failures.extend(_check_variants())
+    failures.extend(_check_segmentation())
+    failures.extend(_check_output_structure())
+    failures.extend(_check_spool())
+    failures.extend(_check_delivery())
+    failures.extend(_check_sharding())
+    failures.extend(_check_import_budget())
+    failures.extend(_check_audit())
 
     if failures:
         for failure in failures:
@@ -70,15 +149,1079 @@ def main() -> int:
     return 0
 
 
-def _recency_bucket(recency_type: str, days_since_last_exam: int) -> str:
-    normalized = (recency_type or "").strip().upper()
-    if normalized == "PRIMER_EXAMEN":
-        return "PRIMER_EXAMEN"
-    if days_since_last_exam > 365:
-        return "HISTORICO_LARGO"
-    if days_since_last_exam > 90:
-        return "HISTORICO_MEDIO"
-    return "HISTORICO_RECIENTE"
+def _check_batch(cases: list[dict]) -> list[str]:
+    payloads = [
+        {
+            "patient_name": case["input"]["patient"]["patient_name"],
+            "package": case["expected"]["package"],
+            "recency_type": case["input"]["temporal"]["recency_type"],
+            "days_since_last_exam": case["input"]["temporal"]["days_since_last_exam"],
+        }
+        for case in cases
+    ]
+    payloads.insert(1, {**payloads[0], "package": "PLATINUM"})
+    payloads.insert(2, {**payloads[0], "patient_name": "Glucosa"})
+
+    def fake_llm(prompt: str) -> str:
+        name = prompt.rsplit("- patient_name: ", 1)[1].split("\n", 1)[0]
+        return _placeholder_email(patient_name=name, recency_bucket="HISTORICO_RECIENTE", package="STANDARD")
+
+    failures: list[str] = []
+    for backend in ("thread", "asyncio"):
+        results = generate_emails(payloads, fake_llm, max_in_flight=2, backend=backend)
+        names = [payload["patient_name"] for payload in payloads]
+        if [result.index for result in results] != list(range(len(payloads))):
+            failures.append(f"batch {backend}: orden de resultados alterado")
+        if [result.ok for result in results] != [True, False, False] + [True] * (len(payloads) - 3):
+            failures.append(f"batch {backend}: errores por paciente inesperados")
+        if not isinstance(results[2].error, ComplianceError):
+            failures.append(f"batch {backend}: se esperaba ComplianceError")
+        for result, name in zip(results, names):
+            if result.ok and name not in result.email_body:
+                failures.append(f"batch {backend}: cuerpo no corresponde a {name}")
+
+    def failing_llm(prompt: str) -> str:
+        if "- patient_name: Roto\n" in prompt:
+            raise RuntimeError("backend caído")
+        return fake_llm(prompt)
+
+    mixed = [payloads[0], {**payloads[0], "patient_name": "Roto"}, payloads[3]]
+    for backend in ("thread", "asyncio"):
+        results = generate_emails(mixed, failing_llm, max_in_flight=2, backend=backend)
+        if [result.ok for result in results] != [True, False, True] or not isinstance(
+            results[1].error, RuntimeError
+        ):
+            failures.append(f"batch {backend}: un error del LLM abortó el lote")
+    return failures
+
+
+# Custom patterns that cannot share one alternation with the others.
+_UNFOLDABLE_PATTERNS = (
+    r"\b(\w+) \1\b",
+    r"(?i)control\s+anual",
+    r"(?P<x>cita)\s+(?P=x)",
+    r"(muy )?(?(1)bienestar|glucosa\b)",
+)
+
+
+def _check_scanner_equivalence(samples: int = 400, seed: int = 13) -> list[str]:
+    rng = random.Random(seed)
+    patterns = DEFAULT_DIAGNOSIS_PATTERNS + _UNFOLDABLE_PATTERNS
+    scanner = ComplianceScanner(diagnosis_patterns=patterns)
+    vocabulary = [
+        *DEFAULT_FORBIDDEN_TERMS,
+        *DEFAULT_URGENCY_TERMS,
+        "usted tiene diabetes",
+        "diagnosticada con diabetes",
+        "Control  Anual",
+        "cita cita",
+        "muy muy",
+        "hola",
+        "bienestar",
+        "Resultados.",
+        "GLUCOSA",
+        "programa",
+    ]
+    for _ in range(samples):
+        text = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(0, 12)))
+        expected = _per_term_violations(text, patterns)
+        stream = scanner.stream()
+        for start in range(0, len(text), 5):
+            stream.feed(text[start : start + 5])
+        if scanner.scan(text) != expected or stream.finish() != expected:
+            return [f"escáner: {scanner.scan(text)} != {expected} para {text!r}"]
+        if not set(stream.violations) <= set(expected):
+            return [f"escáner: violaciones parciales inventadas para {text!r}"]
+    # Patterns that match the empty string must not loop at the end of the text.
+    for empty_patterns in ((r"y?",), (r"y?", r"\bdiabetes\b")):
+        empty_scanner = ComplianceScanner(diagnosis_patterns=empty_patterns)
+        found: list[list[str]] = []
+        worker = threading.Thread(target=lambda: found.append(empty_scanner.scan("ab")), daemon=True)
+        worker.start()
+        worker.join(timeout=2)
+        if found != [_per_term_violations("ab", empty_patterns)]:
+            return [f"escáner: patrón vacío {empty_patterns} sin resultado o colgado ({found})"]
+    return []
+
+
+def _per_term_violations(text: str, patterns: tuple[str, ...]) -> list[str]:
+    """The original one-rule-at-a-time scan, kept as the reference."""
+    lower_text = text.lower()
+    violations = [f"término prohibido: {t}" for t in DEFAULT_FORBIDDEN_TERMS if t in lower_text]
+    violations += [f"lenguaje de urgencia: {t}" for t in DEFAULT_URGENCY_TERMS if t in lower_text]
+    violations += [f"diagnóstico explícito: {p}" for p in patterns if re.search(p, lower_text)]
+    return violations
+
+
+def _check_content_registry() -> list[str]:
+    failures: list[str] = []
+    with tempfile.TemporaryDirectory() as directory:
+        asset = Path(directory) / "prompt.txt"
+
+        def edit(text: str) -> None:
+            asset.write_text(text, encoding="utf-8")
+            # Move the mtime forward so coarse filesystem clocks still see a change.
+            stamp = asset.stat().st_mtime_ns + 1_000_000_000
+            os.utime(asset, ns=(stamp, stamp))
+
+        edit("  versión 1\n")
+        polled = ContentRegistry(Path(directory), check_interval=0.05)
+        if polled.get("prompt.txt") != "versión 1":
+            failures.append("contenido: texto inicial")
+        edit("versión 2")
+        if polled.get("prompt.txt") != "versión 1":
+            failures.append("contenido: se releyó disco antes del intervalo")
+        time.sleep(0.06)
+        if polled.get("prompt.txt") != "versión 2":
+            failures.append("contenido: no se detectó el cambio de mtime")
+
+        pinned = ContentRegistry(Path(directory), check_interval=3600)
+        pinned.get("prompt.txt")
+        edit("versión 3")
+        if pinned.get("prompt.txt") != "versión 2":
+            failures.append("contenido: se releyó disco sin reload")
+        pinned.reload("prompt.txt")
+        if pinned.get("prompt.txt") != "versión 3":
+            failures.append("contenido: reload(ruta) no releyó el archivo")
+        edit("versión 4")
+        pinned.reload()
+        if pinned.get("prompt.txt") != "versión 4":
+            failures.append("contenido: reload() no releyó el archivo")
+    return failures
+
+
+def _check_bulk_decision(samples: int = 5000, seed: int = 7) -> list[str]:
+    """Property check: the bulk engine must agree with assign_package."""
+    rng = random.Random(seed)
+    markers = ["GLU", "HBA1C", "TG", "VLDL", "HDL", "LDL", "NON_HDL", "ALT", "AST_ALT_RATIO", "PLT", "HGB"]
+    statuses = ["NORMAL", "FUERA_RANGO", "fuera_rango", "SIN_DATO", None]
+    inputs: list[DecisionInput] = []
+    for _ in range(samples):
+        calculable = rng.random() < 0.3
+        inputs.append(
+            DecisionInput(
+                mdls_calculable=calculable,
+                mdls_tier=rng.choice(["BAJO", "medio", " ALTO "]) if calculable else None,
+                biomarker_flags={
+                    marker: rng.choice(statuses)
+                    for marker in rng.sample(markers, rng.randint(0, len(markers)))
+                },
+                mdls_derivatives={"TG_HDL_RATIO": rng.choice([0, 0, 1.4, None])},
+                comorbidity_channels=rng.choice([None, {}, {"CREAT": 0}, {"FIB4": 2.1}]),
+            )
+        )
+
+    failures: list[str] = []
+    expected = [assign_package(decision_input) for decision_input in inputs]
+    if assign_packages(inputs) != expected:
+        failures.append("bulk: assign_packages difiere de assign_package")
+    # Both paths are checked directly; the NumPy one only when it is installed.
+    columns = to_columns(inputs)
+    paths = {"python": bulk_decision._assign_python}
+    if bulk_decision.np is not None:
+        paths["numpy"] = bulk_decision._assign_numpy
+    bad_rows = [DecisionInput(mdls_calculable=True, mdls_tier="BAJO")] * 3
+    bad_rows[1:] = [DecisionInput(mdls_calculable=True, mdls_tier="X")] * 2
+    for name, assign in paths.items():
+        if assign(columns) != expected:
+            failures.append(f"bulk: la ruta {name} difiere de assign_package")
+        try:
+            assign(to_columns(bad_rows))
+        except DecisionEngineError as exc:
+            if not str(exc).startswith("row 1:"):
+                failures.append(f"bulk: la ruta {name} reporta la fila equivocada ({exc})")
+        else:
+            failures.append(f"bulk: la ruta {name} aceptó un tier desconocido")
+
+    for decision_input in inputs:
+        signals = (
+            decision_input.biomarker_flags,
+            decision_input.mdls_derivatives,
+            decision_input.comorbidity_channels,
+        )
+        if derive_biomarker_risk_tier(*signals) != _evaluate_rules(*signals):
+            failures.append(f"tabla de riesgo difiere de las reglas para {signals}")
+            break
+    return failures
+
+
+def _check_retry_policy() -> list[str]:
+    responses = iter(_retry_responses())
+    policy = RetryPolicy(max_attempts=2, backoff_base=0.0)
+    try:
+        body = generate_email(
+            patient_name="Ana",
+            package="STANDARD",
+            recency_type="HISTORICO",
+            days_since_last_exam=40,
+            llm=lambda prompt: next(responses),
+            policy=policy,
+        )
+    except ComplianceError as exc:
+        return [f"retry: no se regeneró tras error de cumplimiento ({exc})"]
+    if "urgente" in body:
+        return ["retry: se devolvió la respuesta rechazada"]
+    return []
+
+
+def _check_retry_timeouts(concurrent_calls: int = 130) -> list[str]:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    failures: list[str] = []
+    # More concurrent calls than a shared worker pool would run at once;
+    # none of them may time out while waiting for a worker.
+    policy = RetryPolicy(max_attempts=1, timeout=0.5)
+
+    def slow(prompt: str) -> str:
+        time.sleep(0.3)
+        return prompt
+
+    def attempt(index: int) -> str:
+        try:
+            return policy.call(slow, str(index), str)
+        except TimeoutError:
+            return "timeout"
+
+    with ThreadPoolExecutor(max_workers=concurrent_calls) as executor:
+        outcomes = list(executor.map(attempt, range(concurrent_calls)))
+    if outcomes.count("timeout"):
+        failures.append(f"timeout: {outcomes.count('timeout')} llamadas vencieron en cola")
+
+    try:
+        RetryPolicy(max_attempts=1, timeout=0.05).call(lambda prompt: slow(prompt), "p", str)
+    except TimeoutError as exc:
+        if "exceeded 0.05s" not in str(exc):
+            failures.append(f"timeout: mensaje inesperado ({exc})")
+    else:
+        failures.append("timeout: una llamada lenta no venció")
+
+    def own_timeout(prompt: str) -> str:
+        raise TimeoutError("el backend agotó su plazo")
+
+    async def async_own_timeout(prompt: str) -> str:
+        raise TimeoutError("el backend agotó su plazo")
+
+    async def async_slow(prompt: str) -> str:
+        await asyncio.sleep(0.3)
+        return prompt
+
+    for timeout in (None, 1.0):
+        timed = RetryPolicy(max_attempts=1, timeout=timeout)
+        for name, run in (
+            ("call", lambda: timed.call(own_timeout, "p", str)),
+            ("acall", lambda: asyncio.run(timed.acall(own_timeout, "p", str))),
+            ("acall async", lambda: asyncio.run(timed.acall(async_own_timeout, "p", str))),
+        ):
+            try:
+                run()
+            except TimeoutError as exc:
+                if str(exc) != "el backend agotó su plazo":
+                    failures.append(f"timeout: {name} con timeout={timeout} cambió el error ({exc})")
+    try:
+        asyncio.run(RetryPolicy(max_attempts=1, timeout=0.05).acall(async_slow, "p", str))
+    except TimeoutError as exc:
+        if "exceeded 0.05s" not in str(exc):
+            failures.append(f"timeout: acall mensaje inesperado ({exc})")
+    else:
+        failures.append("timeout: acall no venció")
+    return failures
+
+
+def _check_streaming_abort() -> list[str]:
+    consumed: list[str] = []
+
+    def llm_stream(prompt: str):
+        for chunk in ["Hola Ana. Es ur", "gente que nos escriba.", " Más texto.", " Aún más."]:
+            consumed.append(chunk)
+            yield chunk
+
+    try:
+        generate_email_streaming(
+            patient_name="Ana",
+            package="STANDARD",
+            recency_type="HISTORICO",
+            days_since_last_exam=40,
+            llm_stream=llm_stream,
+        )
+    except ComplianceError as exc:
+        if "urgente" not in str(exc):
+            return [f"streaming: violación inesperada ({exc})"]
+    else:
+        return ["streaming: no se detectó un término partido entre fragmentos"]
+    if len(consumed) != 2:
+        return [f"streaming: se consumieron {len(consumed)} fragmentos en lugar de 2"]
+    return []
+
+
+def _check_fake_llm() -> list[str]:
+    failures: list[str] = []
+    llm = FakeLLM(seed=3)
+    for package in ("STANDARD", "SILVER", "GOLD"):
+        for recency_type, days in (("PRIMER_EXAMEN", 0), ("HISTORICO", 40), ("HISTORICO", 400)):
+            body = generate_email("Ana", package, recency_type, days, llm=llm)
+            if not check_structure(body).ok:
+                failures.append(f"fake llm: forma inválida para {package}/{recency_type}/{days}")
+    bounded = FakeLLM(max_tracked_prompts=8)
+    for index in range(50):
+        bounded(f"prompt {index}")
+    if len(bounded._attempts) > 8:
+        failures.append(f"fake llm: {len(bounded._attempts)} prompts retenidos")
+
+    # The load test goes through the input contract and generate_email.
+    payloads = list(synthetic_payloads(20, seed=2))
+    payloads[3] = {**payloads[3], "temporal": {"days_since_last_exam": -1, "recency_type": "HISTORICO"}}
+    report = run_load_test(payloads, FakeLLM(violation_rate=0.3, seed=2), max_in_flight=4)
+    stages = {stage: len(values) for stage, values in report.stage_seconds.items()}
+    expected = {
+        "decision": 20,
+        "prompt": 19,
+        "llm": 19,
+        "validation": 19,
+        "assembly": report.ok,
+    }
+    if report.contract_errors != 1 or report.ok + report.compliance_errors != 19 or stages != expected:
+        failures.append(f"carga: {report.summary()['patients']} pacientes, etapas {stages}")
+    return failures
+
+
+def _check_pipeline_errors() -> list[str]:
+    failures: list[str] = []
+    good = next(iter(synthetic_payloads(1, seed=4)))
+    lines = [
+        json.dumps(good, ensure_ascii=False),
+        json.dumps({"patient": {"patient_id": "X"}}),
+        "[1, 2",
+    ]
+    sink = io.StringIO()
+    stats = run_pipeline(enumerate(lines, start=1), sink, FakeLLM(seed=1))
+    records = [json.loads(line) for line in sink.getvalue().splitlines()]
+    if [record["status"] for record in records] != ["ok", "error", "error"]:
+        failures.append(f"pipeline: estados {[record['status'] for record in records]}")
+    if stats.failed != 2 or "field_errors" not in records[1]:
+        failures.append("pipeline: el contrato no se reportó por paciente")
+
+    def broken_llm(prompt: str) -> str:
+        raise TypeError("bug en el backend")
+
+    try:
+        run_pipeline(enumerate(lines[:1], start=1), io.StringIO(), broken_llm)
+    except TypeError:
+        pass
+    else:
+        failures.append("pipeline: un error de programación se ocultó como registro de error")
+    return failures
+
+
+def _check_journal_resume() -> list[str]:
+    failures: list[str] = []
+    payloads = list(synthetic_payloads(30, seed=8))
+    prompts: list[str] = []
+    fake = FakeLLM(violation_rate=0.3, seed=2)
+
+    def llm(prompt: str) -> str:
+        prompts.append(prompt)
+        return fake(prompt)
+
+    def run(journal_path: Path, items: list[dict], program_name: str = "Programa") -> list[dict]:
+        sink = io.StringIO()
+        with RunJournal(journal_path) as journal:
+            run_pipeline(
+                enumerate((json.dumps(p, ensure_ascii=False) for p in items), start=1),
+                sink,
+                llm,
+                journal=journal,
+                program_name=program_name,
+            )
+        return [json.loads(line) for line in sink.getvalue().splitlines()]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "journal.sqlite"
+        first = run(path, payloads)
+        finished = {r["patient_id"] for r in first if r["status"] == "ok"}
+        failed = {r["patient_id"] for r in first if r["status"] == "error"}
+        if not finished or not failed:
+            return [f"journal: la primera corrida no mezcla ok y errores ({len(failed)} errores)"]
+
+        changed = [dict(p) for p in payloads]
+        edited = next(p for p in changed if p["patient"]["patient_id"] in finished)
+        changed[changed.index(edited)] = {
+            **edited,
+            "patient": {**edited["patient"], "patient_name": "Nombre Nuevo"},
+        }
+        del prompts[:]
+        second = run(path, changed)
+        regenerated = {r["patient_id"] for r in second if "Nombre Nuevo" in r.get("email_body", "")}
+        reused = [r for r in second if r["patient_id"] in finished - regenerated]
+        if [r["email_body"] for r in reused] != [
+            r["email_body"] for r in first if r["patient_id"] in finished - regenerated
+        ]:
+            failures.append("journal: los registros terminados no se reutilizaron")
+        if not any("Nombre Nuevo" in prompt for prompt in prompts):
+            failures.append("journal: el paciente modificado no se regeneró")
+        if len(prompts) != len(failed) + 1:
+            failures.append(f"journal: {len(prompts)} llamadas para {len(failed)} errores y 1 cambio")
+
+        del prompts[:]
+        run(path, changed, program_name="Otro programa")
+        if len(prompts) < len(payloads):
+            failures.append("journal: un cambio de versión de contenido no regeneró todo")
+
+        assets = Path(directory) / "assets"
+        for relative_path in ("prompts", "templates", "static"):
+            shutil.copytree(REPO_ROOT / relative_path, assets / relative_path)
+        shared = content.registry
+        content.registry = content.ContentRegistry(assets)
+        try:
+            before = content_version()
+            signature = assets / "static" / "signature.txt"
+            signature.write_text(signature.read_text(encoding="utf-8") + "\nNueva línea", encoding="utf-8")
+            content.reload()
+            if content_version() == before:
+                failures.append("journal: content_version no cambió al editar un asset")
+        finally:
+            content.registry = shared
+    return failures
+
+
+def _check_llm_cache() -> list[str]:
+    failures: list[str] = []
+    valid, urgent = _retry_responses()[1], _retry_responses()[0]
+    replies: list[str] = []
+
+    def llm(prompt: str) -> str:
+        return replies.pop(0)
+
+    def generate(cached: CachedLLM, policy: Optional[RetryPolicy] = None) -> str:
+        # A plain llm callable: the default validator, no cache-specific wiring.
+        return generate_email("Ana", "STANDARD", "HISTORICO", 40, llm=cached, policy=policy)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "cache.sqlite"
+        with_cache = SQLiteResponseCache(path)
+        cached = CachedLLM(llm, with_cache, model="m")
+        replies[:] = [urgent]
+        try:
+            generate(cached)
+        except ComplianceError:
+            pass
+        if len(with_cache) != 0:
+            failures.append("cache: se guardó una respuesta rechazada")
+        replies[:] = [valid]
+        generate(cached)
+        generate(cached)
+        if replies or (cached.stats.hits, cached.stats.misses) != (1, 2) or len(with_cache) != 1:
+            failures.append(f"cache: contadores {cached.stats} entradas={len(with_cache)}")
+
+        # A stored response that fails today's rules is dropped and regenerated.
+        prompt_key = cache_key(build_prompt("Ana", "STANDARD", "HISTORICO", 40), "m")
+        with_cache.delete(prompt_key)
+        with_cache.put(prompt_key, urgent)
+        replies[:] = [valid]
+        body = generate(cached, RetryPolicy(max_attempts=2, backoff_base=0.0))
+        if "urgente" in body or cached.stats.rejected != 1 or with_cache.get(prompt_key) is None:
+            failures.append(f"cache: respuesta vencida por reglas no descartada {cached.stats}")
+        # Hits are validated even when the caller does not validate at all.
+        with_cache.delete(prompt_key)
+        with_cache.put(prompt_key, urgent)
+        replies[:] = [valid]
+        body = generate_email("Ana", "STANDARD", "HISTORICO", 40, llm=cached, validator=None)
+        if "urgente" in body or cached.stats.rejected != 2:
+            failures.append("cache: respuesta inválida servida sin validador")
+
+        other = SQLiteResponseCache(path)
+        other.put("otra", "x" * 10)
+        if len(with_cache) != 2 or with_cache.size_bytes != len(valid.encode()) + 10:
+            failures.append(f"cache: totales compartidos {len(with_cache)} {with_cache.size_bytes}")
+        other.close()
+        with_cache.close()
+
+        expiring = SQLiteResponseCache(Path(directory) / "age.sqlite", max_age=0.05)
+        expiring.put(cache_key("p", "m"), "texto")
+        time.sleep(0.06)
+        if expiring.get(cache_key("p", "m")) is not None or len(expiring) != 0:
+            failures.append("cache: una entrada vencida se siguió sirviendo")
+        expiring.close()
+
+        by_count = SQLiteResponseCache(Path(directory) / "count.sqlite", max_entries=10)
+        for index in range(11):
+            by_count.put(f"k{index}", "texto")
+        if len(by_count) != 9 or by_count.get("k0") is not None or by_count.get("k10") is None:
+            failures.append(f"cache: desalojo por cantidad dejó {len(by_count)} entradas")
+        by_count.close()
+
+        by_size = SQLiteResponseCache(Path(directory) / "size.sqlite", max_bytes=1000)
+        for index in range(5):
+            by_size.put(f"k{index}", "é" * 150)
+        if by_size.size_bytes > 900 or by_size.get("k4") is None:
+            failures.append(f"cache: desalojo por tamaño dejó {by_size.size_bytes} bytes")
+        by_size.close()
+    return failures
+
+
+def _check_instrumentation() -> list[str]:
+    failures: list[str] = []
+    metrics = instrumentation.enable()
+    try:
+        responses = iter(_retry_responses())
+        package = assign_package(DecisionInput(mdls_calculable=True, mdls_tier="ALTO"))
+        generate_email(
+            "Ana",
+            package,
+            "HISTORICO",
+            40,
+            llm=lambda prompt: next(responses),
+            policy=RetryPolicy(max_attempts=2, backoff_base=0.0),
+        )
+    finally:
+        instrumentation.disable()
+    expected = {
+        ("packages_assigned_total", (("package", "GOLD"),)): 1,
+        ("compliance_violations_total", (("category", "lenguaje de urgencia"),)): 1,
+        ("llm_retries_total", (("reason", "ComplianceError"),)): 1,
+    }
+    for (name, labels), value in expected.items():
+        if metrics.counter(name, **dict(labels)) != value:
+            failures.append(f"métricas: {name}{dict(labels)} != {value}")
+    exported = metrics.to_prometheus()
+    for line in (
+        'minimed_stage_duration_seconds_count{stage="llm"} 2',
+        'minimed_stage_duration_seconds_count{stage="prompt"} 1',
+        "minimed_prompt_chars_count 1",
+    ):
+        if line not in exported:
+            failures.append(f"métricas: falta '{line}' en la exportación Prometheus")
+    if json.loads(metrics.to_json())["counters"] == []:
+        failures.append("métricas: exportación JSON vacía")
+    if assign_package(DecisionInput(mdls_calculable=True, mdls_tier="BAJO")) != "STANDARD":
+        failures.append("métricas: assign_package cambió con instrumentación deshabilitada")
+    if metrics.counter("packages_assigned_total", package="STANDARD"):
+        failures.append("métricas: se registró con instrumentación deshabilitada")
+    return failures
+
+
+def _check_contract(cases: list[dict]) -> list[str]:
+    failures: list[str] = []
+    payloads = [case["input"] for case in cases] + list(synthetic_payloads(500, seed=5))
+    partition = partition_payloads(payloads)
+    for rejected in partition.rejected:
+        failures.append(f"contrato: payload válido rechazado ({rejected.errors[0]})")
+
+    invalid = {
+        "patient": {"patient_name": " ", "nickname": "Anita"},
+        "clinical": {"mdls_calculable": True, "biomarker_flags": {"GLU": "ALTO"}},
+        "temporal": {"days_since_last_exam": True, "recency_type": "historico"},
+    }
+    expected = {
+        "patient.patient_name",
+        "patient.nickname",
+        "clinical.mdls_tier",
+        "clinical.biomarker_flags.GLU",
+        "temporal.days_since_last_exam",
+        "temporal.recency_type",
+    }
+    paths = {error.path for error in validate_payload(invalid)}
+    if paths != expected:
+        failures.append(f"contrato: errores esperados {sorted(expected)}, obtenidos {sorted(paths)}")
+    negative = {**cases[0]["input"], "temporal": {"days_since_last_exam": -1, "recency_type": "HISTORICO"}}
+    if [error.path for error in validate_payload(negative)] != ["temporal.days_since_last_exam"]:
+        failures.append("contrato: se aceptó days_since_last_exam negativo")
+    # Deliverability is checked when spooling, not by the input contract.
+    unusual = {**cases[0]["input"], "patient": {**cases[0]["input"]["patient"], "patient_email": "josé@ejemplo"}}
+    if validate_payload(unusual):
+        failures.append("contrato: patient_email rechazado por el contrato de entrada")
+    return failures
+
+
+def _check_multi_prompt() -> list[str]:
+    failures: list[str] = []
+    payloads = [
+        {"patient_name": name, "package": package, "recency_type": recency_type, "days_since_last_exam": days}
+        for name, package, recency_type, days in (
+            ("Ana", "GOLD", "HISTORICO", 40),
+            ("Luis", "SILVER", "PRIMER_EXAMEN", 0),
+            ("Camila", "GOLD", "HISTORICO", 400),
+        )
+    ] * 3
+    llm = FakeLLM(seed=2)
+    stats = BatchStats()
+    results = generate_emails_batched(payloads, llm, batch_size=4, stats=stats)
+    if [result.index for result in results] != list(range(len(payloads))):
+        failures.append("lote: resultados fuera de orden")
+    if not all(result.ok for result in results) or llm.calls != 3 or stats.batches != 3:
+        failures.append(f"lote: se esperaban 3 llamadas sin respaldo, hubo {llm.calls} ({stats})")
+    for payload, result in zip(payloads, results):
+        if result.ok and not result.email_body.startswith(f"Hola {payload['patient_name']},"):
+            failures.append(f"lote: cuerpo asignado a otro paciente ({payload['patient_name']})")
+            break
+
+    fake = FakeLLM(seed=2)
+    stats = BatchStats()
+    results = generate_emails_batched(
+        payloads[:2], lambda prompt: "no es json" if "MODO LOTE" in prompt else fake(prompt), stats=stats
+    )
+    if not all(result.ok for result in results) or stats.fallbacks != 2:
+        failures.append(f"lote: respuesta inválida no usó generación individual ({stats})")
+
+    def swapping(prompt: str) -> str:
+        if "MODO LOTE" not in prompt:
+            return fake(prompt)
+        emails = json.loads(fake(prompt))["emails"]
+        emails[0]["key"], emails[1]["key"] = emails[1]["key"], emails[0]["key"]
+        return json.dumps({"emails": emails}, ensure_ascii=False)
+
+    stats = BatchStats()
+    gold = [payloads[0], payloads[2]]
+    results = generate_emails_batched(gold, swapping, stats=stats)
+    for payload, result in zip(gold, results):
+        if not result.ok or not result.email_body.startswith(f"Hola {payload['patient_name']},"):
+            failures.append(f"lote: cuerpo intercambiado entregado a {payload['patient_name']}")
+    if stats.fallbacks != 2:
+        failures.append(f"lote: cuerpos intercambiados sin respaldo individual ({stats})")
+    return failures
+
+
+def _check_variants() -> list[str]:
+    failures: list[str] = []
+    fake = FakeLLM(seed=4)
+    calls = itertools.count()
+
+    def flaky(prompt: str) -> str:
+        # Every fourth call drops, as a transient network error would.
+        if next(calls) % 4 == 0:
+            raise ConnectionError("conexión reiniciada")
+        return fake(prompt)
+
+    pool = fill_pool(flaky, per_key=3)
+    # Every variant must pass the full output contract once the name is in.
+    for package in PACKAGES:
+        for bucket in BUCKETS:
+            variants = pool.variants(package, bucket)
+            if not variants:
+                failures.append(f"variantes: sin variantes para {package}/{bucket}")
+            for variant in variants:
+                try:
+                    validate_output(variant.text.replace("{{patient_name}}", "Ana"))
+                except ComplianceError as exc:
+                    failures.append(f"variantes: {variant.variant_id} no cumple el contrato ({exc})")
+    # The anchors are style exemplars; a pool built from them must still pass.
+    try:
+        anchors = VariantPool.from_anchors()
+    except VariantError:
+        pass
+    else:
+        for package in PACKAGES:
+            for variant in anchors.variants(package, BUCKETS[0]):
+                if not check_email(variant.text.replace("{{patient_name}}", "Ana")).ok:
+                    failures.append(f"variantes: ancla {variant.variant_id} aceptada sin cumplir")
+    used = [pool.render("Ana", "SILVER", "HISTORICO", 200) for _ in range(6)]
+    ids = [email.variant_id for email in used]
+    if len(set(ids)) < 2 or ids[:3] != ids[3:]:
+        failures.append(f"variantes: rotación inesperada {ids}")
+    for email in used:
+        if not email.email_body.startswith("Hola Ana,") or "{{" in email.email_body:
+            failures.append("variantes: nombre no insertado en la variante")
+            break
+        try:
+            validate_output(email.email_body)
+        except ComplianceError as exc:
+            failures.append(f"variantes: {email.variant_id} no cumple ({exc})")
+    for name in ("Diabetes", " ".join(["Ana"] * 120)):
+        try:
+            pool.render(name, "GOLD", "PRIMER_EXAMEN", 0)
+        except ComplianceError:
+            pass
+        else:
+            failures.append(f"variantes: se aceptó el nombre {name[:20]!r} sin validar el cuerpo")
+    # Text with a slot but without the contract's shape never enters a pool.
+    short = "Hola {{patient_name}}, le invitamos a su chequeo preventivo."
+    try:
+        make_variant("GOLD", "PRIMER_EXAMEN", short)
+    except ComplianceError:
+        pass
+    else:
+        failures.append("variantes: variante sin estructura aceptada")
+    root = Path(tempfile.mkdtemp())
+    try:
+        saved = {"variant_id": "x", "package": "GOLD", "bucket": "PRIMER_EXAMEN", "text": short}
+        (root / "pool.json").write_text(json.dumps([saved]), encoding="utf-8")
+        try:
+            VariantPool.load(root / "pool.json")
+        except ComplianceError:
+            pass
+        else:
+            failures.append("variantes: se cargó un pool con una variante sin estructura")
+    finally:
+        shutil.rmtree(root)
+    return failures
+
+
+def _check_segmentation() -> list[str]:
+    failures: list[str] = []
+    expected_bajo = decision_engine.MDLS_TIER_TO_PACKAGE["BAJO"]
+    payloads = list(synthetic_payloads(300, seed=9))
+    with tempfile.TemporaryDirectory() as directory:
+        with SegmentIndex(Path(directory) / "segments.sqlite") as index:
+            first = resegment(index, payloads)
+            payloads[0]["clinical"] = {"mdls_calculable": True, "mdls_tier": "ALTO"}
+            payloads[1]["clinical"] = {"mdls_calculable": True, "mdls_tier": "BAJO"}
+            second = resegment(index, payloads)
+    if first.counts["new"] != len(payloads):
+        failures.append(f"segmentación: primera corrida {first.counts}")
+    expected = {
+        payload["patient"]["patient_id"]: assign_package(
+            DecisionInput(mdls_calculable=True, mdls_tier=payload["clinical"]["mdls_tier"])
+        )
+        for payload in payloads[:2]
+    }
+    changed = {segment.patient_id: segment.package for segment in second.changes}
+    if second.counts["new"] or second.counts["unchanged"] < len(payloads) - 2:
+        failures.append(f"segmentación: segunda corrida {second.counts}")
+    if any(changed.get(pid, package) != package for pid, package in expected.items()):
+        failures.append(f"segmentación: cambios inesperados {changed}")
+
+    # The rules version follows the live table and mappings, not the first call.
+    version = rules_version()
+    try:
+        decision_engine._risk_tier_table = decision_engine.build_risk_tier_table(["GLU", "TG"])
+        if rules_version() == version:
+            failures.append("segmentación: la versión no cambió con otra tabla de riesgo")
+        decision_engine.MDLS_TIER_TO_PACKAGE["BAJO"] = "GOLD"
+        changed_mapping = rules_version()
+    finally:
+        decision_engine.MDLS_TIER_TO_PACKAGE["BAJO"] = expected_bajo
+        decision_engine.rebuild_risk_tier_table()
+    if rules_version() != version or changed_mapping == version:
+        failures.append("segmentación: la versión no sigue la tabla y los mapeos vigentes")
+    return failures
+
+
+def _check_output_structure() -> list[str]:
+    failures: list[str] = []
+    valid = _retry_responses()[1]
+    if not check_email(valid).ok:
+        failures.append(f"estructura: cuerpo válido rechazado {check_email(valid).violations}")
+    informal = valid.replace("Si le interesa, puede", "Si te interesa, puedes", 1)
+    linked = valid.replace("este correo", "este correo o visite www.minimed.cl", 1)
+    signed = valid + "\nAtentamente,"
+    expected = {
+        "registro informal": informal,
+        "link no permitido": linked,
+        "disclaimer o firma incluidos": signed,
+        "estructura": valid.replace("\n\n", " ", 1),
+        "longitud": "\n\n".join(["Hola Ana."] * 7),
+    }
+    for category, body in expected.items():
+        check = check_email(body)
+        if check.categories != {category} or not check.structural_only:
+            failures.append(f"estructura: se esperaba solo '{category}', hubo {check.violations}")
+    try:
+        generate_email("Ana", "STANDARD", "HISTORICO", 40, llm=lambda prompt: "Hola Ana.")
+    except ComplianceError as exc:
+        if exc.check is None or "longitud" not in exc.check.categories:
+            failures.append("estructura: ComplianceError sin resultado estructurado")
+    else:
+        failures.append("estructura: generate_email aceptó un cuerpo sin estructura")
+    return failures
+
+
+def _check_spool() -> list[str]:
+    failures: list[str] = []
+    body = _placeholder_email(patient_name="Ana", recency_bucket="PRIMER_EXAMEN", package="GOLD")
+    messages = [
+        OutgoingEmail(
+            email_body=body,
+            patient_id=f"P{index}",
+            recipient=f"p{index}@example.com",
+            recipient_name="Ana Núñez",
+            package="GOLD",
+        )
+        for index in range(40)
+    ]
+    parsed = message_from_bytes(MessageRenderer().render(messages[0]), policy=email_policy.default)
+    if parsed["To"].addresses[0].display_name != "Ana Núñez" or parsed["X-Minimed-Patient-Id"] != "P0":
+        failures.append(f"spool: cabeceras inesperadas {dict(parsed.items())}")
+    if parsed.get_content().replace("\r\n", "\n").strip() != f"{body}\n\n{footer_text()}":
+        failures.append("spool: cuerpo o pie de página alterado")
+
+    with tempfile.TemporaryDirectory() as directory:
+        root = Path(directory)
+        with open_spool(root / "campaign.mbox", max_bytes=8000, buffer_bytes=5000) as spool:
+            spool.write_many(messages)
+        parts = [mailbox.mbox(str(path)) for path in spool.paths]
+        ids = [message["X-Minimed-Patient-Id"] for part in parts for message in part]
+        if len(parts) < 2 or ids != [message.patient_id for message in messages]:
+            failures.append(f"spool: rotación mbox incorrecta ({len(parts)} partes, {len(ids)} correos)")
+
+        with BackgroundSpool(open_spool(root / "outbox"), max_queue=4) as background:
+            for message in messages:
+                background.write(message)
+        if len(list((root / "outbox").glob("*.eml"))) != len(messages):
+            failures.append("spool: faltan archivos .eml")
+
+        # A bad address fails its own record; the writer thread keeps going.
+        payloads = list(synthetic_payloads(3, seed=3))
+        payloads[1]["patient"]["patient_email"] = "josé@ejemplo.cl"
+        payloads[2]["patient"]["patient_email"] = "ana@ñandú.cl"
+        sink = io.StringIO()
+        with BackgroundSpool(open_spool(root / "mixed.jsonl")) as background:
+            run_pipeline(
+                enumerate((json.dumps(p, ensure_ascii=False) for p in payloads), start=1),
+                sink,
+                FakeLLM(seed=1),
+                spool=background,
+            )
+        statuses = [json.loads(line)["status"] for line in sink.getvalue().splitlines()]
+        spooled = [json.loads(line)["to"] for line in (root / "mixed.jsonl").read_text().splitlines()]
+        if statuses != ["ok", "error", "ok"] or spooled[1:] != ["ana@xn--and-6ma2c.cl"]:
+            failures.append(f"spool: dirección inválida no aislada ({statuses}, {spooled})")
+
+        # Result files carry the recipient, so the spool CLI can address them alone.
+        (root / "results.jsonl").write_text(sink.getvalue(), encoding="utf-8")
+        with contextlib.redirect_stderr(io.StringIO()):
+            spool_main([str(root / "results.jsonl"), "-o", str(root / "cli.jsonl")])
+        addressed = [json.loads(line)["to"] for line in (root / "cli.jsonl").read_text().splitlines()]
+        if addressed != spooled:
+            failures.append(f"spool: CLI sin destinatarios {addressed} != {spooled}")
+
+    try:
+        OutgoingEmail(body, recipient="ana@example.com\r\nBcc: otro@example.com")
+    except ValueError:
+        pass
+    else:
+        failures.append("spool: se aceptó un destinatario con salto de línea")
+    injected = OutgoingEmail(
+        body,
+        patient_id="P1\r\nBcc: otro@example.com",
+        recipient="ana@example.com",
+        recipient_name="Ana\r\nBcc: otro@example.com",
+        package="GOLD",
+    )
+    long_name = OutgoingEmail(body, recipient="ana@example.com", recipient_name="María José " * 12)
+    for message in (injected, long_name):
+        raw = MessageRenderer().render(message)
+        head = raw.split(b"\r\n\r\n", 1)[0]
+        parsed = message_from_bytes(raw, policy=email_policy.default)
+        if b"\n" in head.replace(b"\r\n", b"") or "Bcc" in parsed:
+            failures.append(f"spool: cabeceras inyectadas o mal plegadas {head[:200]!r}")
+    return failures
+
+
+def _check_delivery() -> list[str]:
+    failures: list[str] = []
+    renderer = MessageRenderer()
+    body = ".Hola\n\nFrom el equipo"
+    envelopes = [
+        envelope_for(OutgoingEmail(body, patient_id=f"P{index}", recipient=f"p{index}@example.com"), renderer)
+        for index in range(60)
+    ]
+    envelopes.append(Envelope("baja@rechazo.invalid", envelopes[0].data, "P-rechazo"))
+    envelopes.append(Envelope(None, envelopes[0].data, "P-sin-correo"))
+    policy = RetryPolicy(max_attempts=6, backoff_base=0.0, jitter=0.0)
+    for pipelining in (True, False):
+        with SMTPStandIn(transient_failure_rate=0.2, rejected_domains=["rechazo.invalid"]) as server:
+            stats = DeliveryStats()
+            config = SMTPConfig(host=server.hostname, port=server.port)
+            with SMTPPool(config, size=3, max_messages_per_connection=10, pipelining=pipelining) as pool:
+                results = list(deliver(envelopes, pool, policy=policy, stats=stats))
+        label = "delivery pipelining" if pipelining else "delivery"
+        if [result.index for result in results] != list(range(len(envelopes))):
+            failures.append(f"{label}: resultados fuera de orden")
+        if stats.sent != 60 or stats.failed != 2 or stats.retries != server.transient_failures:
+            failures.append(f"{label}: {stats} fallos_transitorios={server.transient_failures}")
+        if not 6 <= stats.connections <= 9 or server.connections != stats.connections:
+            failures.append(f"{label}: conexiones {stats.connections}/{server.connections}")
+        if results[-2].code != 550 or results[-2].attempts != 1:
+            failures.append(f"{label}: rechazo permanente reintentado {results[-2]}")
+        if {message.data for message in server.messages} != {envelope.data for envelope in envelopes[:60]}:
+            failures.append(f"{label}: contenido alterado en tránsito")
+
+    # An address must not be able to add commands to a pipelined write.
+    injected = Envelope("ana@example.com>\r\nRCPT TO:<otro@example.com", envelopes[0].data, "P-inyeccion")
+    with SMTPStandIn() as server:
+        config = SMTPConfig(host=server.hostname, port=server.port)
+        with SMTPPool(config, size=1) as pool:
+            results = list(deliver([injected], pool, policy=policy))
+        bad_sender = SMTPConfig(host=server.hostname, port=server.port, sender="a@b.cl>\r\nRSET")
+        with SMTPPool(bad_sender, size=1) as pool:
+            results += list(deliver(envelopes[:1], pool, policy=policy))
+    if [result.status for result in results] != ["failed", "failed"] or server.messages:
+        failures.append(f"delivery: dirección con comandos SMTP aceptada {results}")
+
+    # Replies that do not fit MAIL/RCPT/DATA leave the session unusable.
+    scripts = {
+        "DATA abierto tras rechazo": (((550, b"no"), (250, b"ok"), (354, b"go")), 550, False),
+        "respuesta fuera de secuencia": (((250, b"ok"), (250, b"ok"), (250, b"ok")), 250, False),
+        "rechazo en secuencia": (((550, b"no"), (503, b"no"), (503, b"no")), 550, True),
+    }
+    for label, (replies, code, reusable) in scripts.items():
+        smtp = _ScriptedSMTP(replies)
+        with SMTPPool(SMTPConfig(), size=1, factory=lambda config: smtp) as pool:
+            result = next(deliver(envelopes[:1], pool, policy=RetryPolicy(max_attempts=1)))
+            reused = pool._idle.qsize() == 1
+        if result.code != code or reused != reusable:
+            failures.append(f"delivery: {label}: conexión reutilizada={reused} {result}")
+        if not reusable and (smtp.quit_sent or b".\r\n" in b"".join(smtp.sent)):
+            failures.append(f"delivery: {label}: la sesión rota recibió más comandos")
+    return failures
+
+
+class _ScriptedSMTP:
+    """Pipelining SMTP stand-in that answers MAIL, RCPT and DATA from a script."""
+
+    def __init__(self, replies: tuple[tuple[int, bytes], ...]) -> None:
+        self.replies = list(replies)
+        self.sent: list[bytes] = []
+        self.quit_sent = False
+
+    def has_extn(self, name: str) -> bool:
+        return name == "pipelining"
+
+    def send(self, data: Union[str, bytes]) -> None:
+        self.sent.append(data.encode() if isinstance(data, str) else data)
+
+    def getreply(self) -> tuple[int, bytes]:
+        return self.replies.pop(0) if self.replies else (250, b"ok")
+
+    def rset(self) -> tuple[int, bytes]:
+        return 250, b"ok"
+
+    def quit(self) -> None:
+        self.quit_sent = True
+
+    def close(self) -> None:
+        pass
+
+
+def _check_sharding() -> list[str]:
+    failures: list[str] = []
+    # Pinned values: shard assignment must not change between releases or machines.
+    pinned = [shard_of(f"INT-{index:07d}", 8) for index in range(6)]
+    if pinned != [6, 6, 6, 1, 3, 5] or shard_of(12345, 8) != shard_of("12345", 8):
+        failures.append(f"sharding: asignación inestable {pinned}")
+
+    lines = [json.dumps(payload, ensure_ascii=False) for payload in synthetic_payloads(120, seed=5)]
+    lines[7] = "{no es json"
+    owners = [line_shard(number, line, 3) for number, line in enumerate(lines, start=1)]
+    if len(set(owners)) != 3:
+        failures.append(f"sharding: particiones vacías {sorted(set(owners))}")
+    # Only the patient object's id counts, not one nested elsewhere or inside a string.
+    decoy = json.dumps(
+        {"nota": '"patient_id": "X"', "otro": {"patient_id": "Y"}, "patient": {"patient_id": "A1"}}
+    )
+    if line_shard(1, decoy, 97) != shard_of("A1", 97):
+        failures.append("sharding: patient_id tomado fuera del objeto patient")
+    empty = run_sharded("no-existe.jsonl", "no-existe", 3, ShardOptions(variants="x"), only=[])
+    if empty.stats or empty.errors:
+        failures.append(f"sharding: selección vacía no devolvió un resultado vacío {empty}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        root = Path(directory)
+        (root / "payloads.jsonl").write_text("\n".join(lines) + "\n", encoding="utf-8")
+        fill_pool(FakeLLM(seed=6), per_key=1).save(root / "pool.json")
+        options = ShardOptions(variants=str(root / "pool.json"), max_in_flight=2)
+        for index in range(3):
+            run_shard(root / "payloads.jsonl", ShardSpec(index, 3), root / "shards", options)
+        merged = io.StringIO()
+        total = merge_shards(root / "shards", 3, merged)
+        single = io.StringIO()
+        run_pipeline(
+            enumerate(lines, start=1),
+            single,
+            None,
+            variants=VariantPool.load(root / "pool.json"),
+        )
+        rerun = run_shard(root / "payloads.jsonl", ShardSpec(1, 3), root / "shards", options)
+
+    def summary(text: str) -> list[tuple]:
+        records = [json.loads(line) for line in text.splitlines()]
+        return [(r["line"], r["status"], r.get("package"), r.get("variant_id")) for r in records]
+
+    if summary(merged.getvalue()) != summary(single.getvalue()):
+        failures.append("sharding: la unión no coincide con una corrida única")
+    if total.processed != len(lines) or total.failed != 1:
+        failures.append(f"sharding: totales {total}")
+    if rerun.resumed != rerun.ok or rerun.ok == 0:
+        failures.append(f"sharding: el reintento del shard no reanudó {rerun}")
+    return failures
+
+
+def _check_audit() -> list[str]:
+    failures: list[str] = []
+    lines = [json.dumps(payload, ensure_ascii=False) for payload in synthetic_payloads(60, seed=9)]
+    audit = ComplianceAudit()
+    sink = io.StringIO()
+    stats = run_pipeline(
+        enumerate(lines, start=1),
+        sink,
+        FakeLLM(violation_rate=0.4, seed=3),
+        policy=RetryPolicy(max_attempts=3, backoff_base=0.0),
+        audit=audit,
+    )
+    records = [json.loads(line) for line in sink.getvalue().splitlines()]
+    final = sum(1 for record in records if record.get("violations"))
+
+    if audit.emails != stats.processed or audit.statuses["ok"] != stats.ok:
+        failures.append(f"audit: totales {audit.emails}/{dict(audit.statuses)} != {stats}")
+    if audit.compliance_failures != final or audit.retries != audit.rejections - final:
+        failures.append(f"audit: fallos {audit.compliance_failures} != {final}")
+    if audit.retries == 0 or sum(audit.violations_per_rejection.values()) != audit.rejections:
+        failures.append(f"audit: rechazos {audit.rejections} reintentos {audit.retries}")
+    if not audit.terms or any(":" in category for category in audit.terms):
+        failures.append(f"audit: términos {audit.terms}")
+    if sum(audit.packages.values()) != stats.ok or sum(audit.recency.values()) != stats.ok:
+        failures.append(f"audit: mezcla {dict(audit.packages)} {dict(audit.recency)}")
+
+    merged = ComplianceAudit.from_dict(json.loads(audit.to_json()))
+    merged.merge(audit)
+    if merged.rejections != 2 * audit.rejections or merged.terms.keys() != audit.terms.keys():
+        failures.append("audit: la unión no suma los contadores")
+    capped = ComplianceAudit(max_terms=1)
+    capped.record_rejection(["término prohibido: a", "término prohibido: b"])
+    if capped.terms["término prohibido"] != {"a": 1, "(otros)": 1}:
+        failures.append(f"audit: tope de términos {capped.terms}")
+    table = io.StringIO()
+    audit.write_csv(table)
+    if not table.getvalue().startswith("section,key,detail,count\n") or "\nterm," not in table.getvalue():
+        failures.append("audit: CSV inesperado")
+    return failures
+
+
+# Modules the decide/prompt/validate paths must not import.
+HEAVY_MODULES = ("asyncio", "concurrent.futures", "sqlite3", "smtplib", "ssl", "openai")
+IMPORT_BUDGET_SECONDS = 0.25
+
+_IMPORT_PROBE = """
+import sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+import src, src.__main__, src.batch, src.contract, src.decision_engine, src.generator
+import src.static_content
+elapsed = time.perf_counter() - started
+print(elapsed, *[name for name in {heavy!r} if name in sys.modules])
+"""
+
+
+def _check_import_budget(runs: int = 3) -> list[str]:
+    failures: list[str] = []
+    probe = _IMPORT_PROBE.format(root=str(REPO_ROOT), heavy=HEAVY_MODULES)
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", probe], capture_output=True, text=True, check=True
+        ).stdout.split()
+        timings.append(float(output[0]))
+        if output[1:]:
+            failures.append(f"importación: módulos pesados cargados al importar: {output[1:]}")
+            break
+    if min(timings) > IMPORT_BUDGET_SECONDS:
+        failures.append(f"importación: {min(timings):.3f}s > presupuesto {IMPORT_BUDGET_SECONDS}s")
+    return failures
+
+
+def _retry_responses() -> list[str]:
+    valid = _placeholder_email(patient_name="Ana", recency_bucket="HISTORICO_RECIENTE", package="STANDARD")
+    return [valid.replace("Hola Ana,", "Hola Ana, es urgente que nos escriba;", 1), valid]
 
 
 def _placeholder_email(*, patient_name: str, recency_bucket: str, package: str) -> str:
@@ -128,13 +1271,5 @@ def _placeholder_email(*, patient_name: str, recency_bucket: str, package: str)
     return "\n\n".join(paragraphs)
 
 
-def _word_count(text: str) -> int:
-    return len([word for word in text.split() if word.strip()])
-
-
-def _block_count(text: str) -> int:
-    return len([block for block in text.split("\n\n") if block.strip()])
-
-
 if __name__ == "__main__":
     raise SystemExit(main())